@@ -0,0 +1,131 @@
+"""
+Micro-benchmark for PDF parsing and semantic chunking.
+
+Runs PDFProcessingService in-process over every PDF in a corpus directory
+(sample regulations), reports pages/s and chunks/s per file, and checks that
+chunk offsets point at the chunk text in the document. Without a corpus, a
+synthetic regulation-style PDF is generated.
+
+Usage (from backend/):
+    python benchmarks/bench_chunking.py --corpus benchmarks/corpus --save bench.json
+    python benchmarks/bench_chunking.py --corpus benchmarks/corpus --baseline bench.json
+
+With --baseline the script exits non-zero when any file got slower than the
+baseline by more than --tolerance (default 25%).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+from src.services.pdf_processing_service import PDFProcessingService, PAGE_SEPARATOR
+
+def make_synthetic_regulation(path: str, pages: int = 120) -> None:
+    """Write a dense, recital-style PDF similar to EU directives"""
+    doc = fitz.open()
+    recital = 1
+    for page_num in range(pages):
+        page = doc.new_page()
+        lines = ["EN", f"Official Journal of the European Union L {page_num + 1}"]
+        for _ in range(6):
+            lines.append(
+                f"({recital}) Member States should ensure that the share of energy from renewable "
+                f"sources in gross final consumption reaches the targets set out in Article {recital % 40 + 1}, "
+                f"taking into account Directive (EU) 2018/2001 and the REPowerEU plan."
+            )
+            recital += 1
+        page.insert_textbox(fitz.Rect(50, 50, 545, 800), "\n\n".join(lines), fontsize=8)
+    doc.save(path)
+    doc.close()
+
+def document_text(service: PDFProcessingService, path: str) -> str:
+    """Cleaned text of all pages, joined the way chunk offsets expect"""
+    with fitz.open(path) as doc:
+        return PAGE_SEPARATOR.join(service._clean_page_text(page.get_text("text")) for page in doc)
+
+def bench_file(service: PDFProcessingService, path: str, repeat: int) -> dict:
+    with fitz.open(path) as doc:
+        pages = len(doc)
+
+    timings = []
+    chunks = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = service.process_pdf_sync(path)["chunks"]
+        timings.append(time.perf_counter() - start)
+
+    # Each chunk's offsets must point at its opening text
+    text = document_text(service, path)
+    bad_offsets = sum(
+        1 for chunk in chunks
+        if not text[chunk.start_offset:chunk.end_offset].startswith(chunk.content.split("\n")[0])
+    )
+
+    seconds = statistics.median(timings)
+    return {
+        "pages": pages,
+        "chunks": len(chunks),
+        "seconds": seconds,
+        "pages_per_second": pages / seconds if seconds else 0.0,
+        "chunks_per_second": len(chunks) / seconds if seconds else 0.0,
+        "bad_offsets": bad_offsets
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(__file__), "corpus"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    files = []
+    if os.path.isdir(args.corpus):
+        files = sorted(
+            os.path.join(args.corpus, name)
+            for name in os.listdir(args.corpus) if name.lower().endswith(".pdf")
+        )
+    if not files:
+        synthetic = os.path.join(tempfile.gettempdir(), "synthetic_regulation.pdf")
+        make_synthetic_regulation(synthetic)
+        files = [synthetic]
+        print(f"No PDFs in {args.corpus}, using synthetic corpus")
+
+    service = PDFProcessingService()
+    results = {}
+    print(f"{'file':40} {'pages':>6} {'chunks':>7} {'seconds':>8} {'pages/s':>8} {'chunks/s':>9} {'bad':>4}")
+    for path in files:
+        result = bench_file(service, path, args.repeat)
+        results[os.path.basename(path)] = result
+        print(
+            f"{os.path.basename(path)[:40]:40} {result['pages']:>6} {result['chunks']:>7} "
+            f"{result['seconds']:>8.3f} {result['pages_per_second']:>8.1f} "
+            f"{result['chunks_per_second']:>9.1f} {result['bad_offsets']:>4}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    failed = any(result["bad_offsets"] for result in results.values())
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous and result["seconds"] > previous["seconds"] * (1 + args.tolerance):
+                print(f"REGRESSION {name}: {previous['seconds']:.3f}s -> {result['seconds']:.3f}s")
+                failed = True
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
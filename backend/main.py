@@ -11,6 +11,7 @@ from fastapi.responses import JSONResponse
 from src.core.config import settings
 from src.api.v1 import documents, chat, payments
 from src.core.background_tasks import background_task_manager
+from src.services.supabase import supabase_service
 from src.middleware.rate_limiter import rate_limiter
 from fastapi import Request
 import logging
@@ -99,6 +100,7 @@ async def startup_event():
 async def shutdown_event():
     """Shutdown background tasks when application stops"""
     background_task_manager.shutdown()
+    await supabase_service.aclose()
     logging.info("Application shutting down, background tasks stopped")
 
 # Health check endpoint
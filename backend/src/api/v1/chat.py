@@ -3,51 +3,220 @@ Chat endpoints handling user queries and responses.
 Integrates RAG and LLM services with credit management.
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, Optional
+from dataclasses import dataclass
+import asyncio
+import json
 import logging
-from ...models.chat_pydantic import ChatRequest, ChatResponse, ErrorResponse, ConversationHistory, ChatMessage
+from ...models.chat_pydantic import ChatRequest, ChatResponse, ErrorResponse, ConversationHistory, ChatMessage, ConversationResponse
 from ...services.rag_service import rag_service
 from ...services.llm_service import llm_service
 from ...services.supabase import supabase_service
 from uuid import uuid4
 from ...services.conversation_service import conversation_service
+from ...services.history_service import history_service, HistoryWindow
+from ...services.credit_service import credit_service
+from ...services.credit_ledger import CreditReservation, UserNotFoundError, InsufficientCreditsError
+from ...core.timing import StageTimer
 
 router = APIRouter(tags=["chat"])
 logger = logging.getLogger(__name__)
 
+@dataclass
+class ChatTurn:
+    """State gathered for one chat request before the answer is generated"""
+    conversation: ConversationResponse
+    rag_result: Dict
+    history: Optional[HistoryWindow]  # summary and recent messages before this turn
+    user_message: asyncio.Task  # pending insert of the user's message
+    timer: StageTimer
+    reservation: CreditReservation  # credit held for this answer
+
 @router.post("/chat")
-async def process_chat_query(request: ChatRequest):
+async def process_chat_query(request: ChatRequest, http_response: Response = None):
+    turn = None
     try:
-        # Get user_id from email using Supabase
-        result = supabase_service.admin_client.from_('user_profiles')\
-            .select('user_id, credits')\
-            .eq('email', request.email)\
-            .single()\
-            .execute()
+        turn = await prepare_chat(request)
+        conversation, rag_result = turn.conversation, turn.rag_result
+        chunk_ids = [chunk["source"]["chunk_id"] for chunk in rag_result["context"]["chunks"]]
+        
+        # Answers only depend on the question and chunks when there is no prior history
+        answer_cache = rag_service.answer_cache if not request.conversation_id else None
+        cached = answer_cache.lookup(rag_result["query_embedding"], chunk_ids) if answer_cache else None
+        
+        if cached:
+            logger.info(f"Answer cache hit for conversation {conversation.conversation_id}")
+            llm_result = {"response": cached.response}
+            used_chunks = cached.sources
+        else:
+            with turn.timer.stage("generation"):
+                llm_result = await llm_service.generate_rag_response(
+                    query=request.query,
+                    context=rag_result["context"],
+                    conversation_id=conversation.conversation_id,
+                    history=turn.history
+                )
             
-        if not result.data:
+            # Extract used chunks from response
+            used_chunks = extract_used_chunks(
+                llm_result["response"], 
+                rag_result["context"]["chunks"]
+            )
+            
+            if answer_cache and chunk_ids:
+                answer_cache.store(rag_result["query_embedding"], chunk_ids, llm_result["response"], used_chunks)
+        
+        with turn.timer.stage("save"):
+            await save_assistant_message(turn, llm_result["response"], used_chunks)
+        
+        turn.timer.log("Chat")
+        if http_response is not None:
+            http_response.headers["Server-Timing"] = turn.timer.server_timing()
+        
+        return ChatResponse(
+            response=llm_result["response"],
+            sources=used_chunks,
+            conversation_id=conversation.conversation_id,
+            tokens_used=len(request.query.split()) + len(llm_result["response"].split()),
+            credits_remaining=turn.reservation.balance
+        )
+        
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error processing chat query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Returns the credit unless the answer was saved, which settles it
+        if turn:
+            credit_service.refund(turn.reservation)
+
+@router.post("/chat/stream")
+async def stream_chat_query(request: ChatRequest):
+    """
+    Server-Sent Events variant of /chat.
+    Emits a `sources` event with the retrieved chunks, `token` events with
+    response deltas, then a `done` event with the cited chunks and the id of
+    the persisted assistant message. Failures after streaming starts are
+    reported as an `error` event.
+    """
+    try:
+        turn = await prepare_chat(request)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error processing chat query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            conversation, context = turn.conversation, turn.rag_result["context"]
+            chunk_ids = [chunk["source"]["chunk_id"] for chunk in context["chunks"]]
+            yield sse_event("sources", {
+                "conversation_id": conversation.conversation_id,
+                "sources": context["chunks"]
+            })
+            
+            answer_cache = rag_service.answer_cache if not request.conversation_id else None
+            cached = answer_cache.lookup(turn.rag_result["query_embedding"], chunk_ids) if answer_cache else None
+            
+            if cached:
+                logger.info(f"Answer cache hit for conversation {conversation.conversation_id}")
+                response = cached.response
+                used_chunks = cached.sources
+                yield sse_event("token", {"delta": response})
+            else:
+                deltas = []
+                with turn.timer.stage("generation"):
+                    async for delta in llm_service.stream_rag_response(
+                        query=request.query,
+                        context=context,
+                        conversation_id=conversation.conversation_id,
+                        history=turn.history
+                    ):
+                        if not deltas:
+                            turn.timer.timings["first_token"] = turn.timer.total()
+                        deltas.append(delta)
+                        yield sse_event("token", {"delta": delta})
+                
+                response = "".join(deltas)
+                used_chunks = extract_used_chunks(response, context["chunks"])
+                if answer_cache and chunk_ids:
+                    answer_cache.store(turn.rag_result["query_embedding"], chunk_ids, response, used_chunks)
+            
+            with turn.timer.stage("save"):
+                message = await save_assistant_message(turn, response, used_chunks)
+            turn.timer.log("Chat stream")
+            yield sse_event("done", {
+                "message_id": message.get("message_id"),
+                "conversation_id": conversation.conversation_id,
+                "sources": used_chunks,
+                "tokens_used": len(request.query.split()) + len(response.split()),
+                "credits_remaining": turn.reservation.balance
+            })
+            
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            # Also reached when the client disconnects mid-stream
+            credit_service.refund(turn.reservation)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def prepare_chat(request: ChatRequest) -> ChatTurn:
+    """
+    Reserve a credit, store the user's message and retrieve RAG context and history.
+    Steps that do not depend on each other run concurrently: retrieval and the
+    history fetch start immediately, the credit reservation (which also
+    resolves the user) and the conversation lookup run side by side, and the
+    user's message is inserted in the background.
+    Raises HTTPException for unknown users and exhausted credits; the
+    reservation is refunded if any later step fails.
+    """
+    timer = StageTimer()
+    
+    # Start work that only needs the request; it is cancelled if the checks below fail
+    retrieval = asyncio.create_task(timer.track("retrieval", rag_service.process_query(request.query, request.filters)))
+    history = asyncio.create_task(timer.track(
+        "history", history_service.get_window(request.conversation_id)
+    )) if request.conversation_id else None
+    
+    reservation = None
+    try:
+        # Reserve the credit (resolving user_id) and get the existing conversation at the same time
+        reservation, conversation = await timer.track("lookup", asyncio.gather(
+            credit_service.reserve(request.email),
+            conversation_service.get_conversation(request.conversation_id)
+            if request.conversation_id else asyncio.sleep(0),
+            return_exceptions=True
+        ))
+        
+        if isinstance(reservation, UserNotFoundError):
             raise HTTPException(
                 status_code=404,
                 detail="User profile not found"
             )
-            
-        user_id = result.data['user_id']
-        credits = result.data['credits']
-        
-        # Check credits
-        if credits <= 0:
+        if isinstance(reservation, InsufficientCreditsError):
             raise HTTPException(
                 status_code=402,  # Payment Required
                 detail="Insufficient credits. Please purchase more credits to continue using the AI Assistant."
             )
+        for outcome in (reservation, conversation):
+            if isinstance(outcome, BaseException):
+                raise outcome
 
-        # First get/create conversation
-        conversation = conversation_service.get_or_create_conversation(
-            request.conversation_id,
-            user_id
-        )
+        # Create the conversation if it does not exist yet
+        if not conversation:
+            conversation = await timer.track("conversation", conversation_service.create_conversation(reservation.user_id))
         
-        # Save user's message
+        # Save user's message off the critical path; it is awaited before the answer is saved
         user_message = {
             "conversation_id": conversation.conversation_id,
             "user_id": conversation.user_id,
@@ -55,55 +224,59 @@ async def process_chat_query(request: ChatRequest):
             "content": request.query,
             "credits_used": 0  # User messages don't use credits
         }
-        supabase_service.admin_client.table('messages').insert(user_message).execute()
+        insert = asyncio.create_task(history_service.add_message(user_message))
         
-        # Process with RAG + LLM
-        rag_result = await rag_service.process_query(request.query)
-        llm_result = await llm_service.generate_rag_response(
-            query=request.query,
-            context=rag_result["context"],
-            conversation_id=conversation.conversation_id
-        )
+        rag_result = await retrieval
+        window = await history if history else None
         
-        # Extract used chunks from response
-        used_chunks = extract_used_chunks(
-            llm_result["response"], 
-            rag_result["context"]["chunks"]
-        )
-        
-        # Save assistant's message with credits_used = -1
-        assistant_message = {
-            "conversation_id": conversation.conversation_id,
-            "user_id": conversation.user_id,
-            "role": "assistant",
-            "content": llm_result["response"],
-            "credits_used": -1,  # Explicitly set credit usage for assistant messages
-            "sources": {
-                str(chunk["index"]): {
-                    "chunk_id": chunk["source"]["chunk_id"],
-                    "document_id": chunk["source"]["document_id"],
-                    "page_number": chunk["source"]["page_number"],
-                    "section_title": chunk["source"]["section_title"],
-                    "location_data": chunk["source"]["location_data"],
-                    "content": chunk["content"]
-                }
-                for chunk in used_chunks
+    except BaseException:
+        for task in (retrieval, history):
+            if task:
+                task.cancel()
+        if isinstance(reservation, CreditReservation):
+            credit_service.refund(reservation)
+        raise
+    
+    return ChatTurn(conversation, rag_result, window, insert, timer, reservation)
+
+async def save_assistant_message(turn: ChatTurn, response: str, used_chunks: list) -> Dict:
+    """Persist the assistant's answer with its cited sources and return the stored row"""
+    conversation = turn.conversation
+    
+    # The user's message must land first so message order is preserved
+    await turn.user_message
+    
+    # The assistant message carries the charge: the messages trigger debits its
+    # credits_used, under either credit ledger; settling only closes the reservation
+    assistant_message = {
+        "conversation_id": conversation.conversation_id,
+        "user_id": conversation.user_id,
+        "role": "assistant",
+        "content": response,
+        "credits_used": -turn.reservation.amount,
+        "sources": {
+            str(chunk["index"]): {
+                "chunk_id": chunk["source"]["chunk_id"],
+                "document_id": chunk["source"]["document_id"],
+                "page_number": chunk["source"]["page_number"],
+                "section_title": chunk["source"]["section_title"],
+                "location_data": chunk["source"]["location_data"],
+                "content": chunk["content"]
             }
+            for chunk in used_chunks
         }
-        result = supabase_service.admin_client.table('messages').insert(assistant_message).execute()
-        
-        return ChatResponse(
-            response=llm_result["response"],
-            sources=used_chunks,
-            conversation_id=conversation.conversation_id,
-            tokens_used=len(request.query.split()) + len(llm_result["response"].split())
-        )
-        
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        logger.error(f"Error processing chat query: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    }
+    message = await history_service.add_message(assistant_message)
+    credit_service.settle(turn.reservation, conversation.conversation_id, message.get('message_id'))
+    
+    # Older turns are summarised off the request path
+    history_service.schedule_summary_refresh(conversation.conversation_id, turn.history)
+    
+    return message
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
 def extract_used_chunks(response: str, available_chunks: list) -> list:
     """Extract only the chunks that were actually cited in the response"""
@@ -146,7 +319,7 @@ async def get_conversation(conversation_id: str):
         result = await supabase_service.admin_client.table('messages')\
             .select('*')\
             .eq('conversation_id', conversation_id)\
-            .order('message_index', ascending=True)\
+            .order('message_index', desc=False)\
             .execute()
             
         if not result.data:
@@ -157,6 +330,8 @@ async def get_conversation(conversation_id: str):
             messages=[ChatMessage(**msg) for msg in result.data]
         )
             
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error retrieving conversation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,11 +1,14 @@
 """
 Endpoints for document management: listing, retrieving, and searching documents.
 Handles both metadata and file operations through Supabase.
+Processing runs as background ingestion jobs; the endpoints that start one
+return 202 with the job, whose progress is polled at /documents/jobs/{job_id}.
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Query, Body
 from typing import List, Optional
 from ...services.document_service import document_service
+from ...services.ingestion_scheduler import ingestion_scheduler
 from ...models.document_pydantic import DocumentSearchFilters, SearchResponse
 
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -47,6 +50,14 @@ async def list_documents(folder: Optional[str] = None) -> List[dict]:
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Status of an ingestion job with the progress and timing of each stage"""
+    job = ingestion_scheduler.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @router.get("/{document_id}")
 async def get_document(document_id: str):
     """Get document details and download URL"""
@@ -68,22 +79,23 @@ async def get_document(document_id: str):
         print(f"Error in get_document endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/{document_id}/process")
+@router.post("/{document_id}/process", status_code=202)
 async def process_document(document_id: str):
-    """Process a document with the specified ID"""
+    """Queue chunking and embedding of a document; returns the ingestion job"""
     try:
-        processed_doc = await document_service.process_document(document_id)
-        return processed_doc
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        document = await document_service.get_document_by_id(document_id)
+        if not document:
+            raise HTTPException(status_code=404, detail=f"Document not found: {document_id}")
+        return ingestion_scheduler.submit("process", document_id=document_id)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/from-storage")
+@router.post("/from-storage", status_code=202)
 async def create_document_from_storage(storage_path: str = Body(..., embed=True)):
-    """Create document record from file in storage"""
+    """Queue creation of a document record from a file in storage; returns the ingestion job"""
     try:
-        document = await document_service.create_document_from_upload(storage_path)
-        return document
+        return ingestion_scheduler.submit("create", file_path=storage_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
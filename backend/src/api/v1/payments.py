@@ -2,6 +2,7 @@ import os
 from fastapi import APIRouter, Request, HTTPException
 import stripe
 from ...services.supabase import supabase_service
+from ...services.profile_service import profile_service
 from fastapi.responses import JSONResponse
 
 router = APIRouter(tags=["payments"])
@@ -33,10 +34,8 @@ async def stripe_webhook(request: Request):
             if not email:
                 return JSONResponse(status_code=400, content={"detail": "Email not found. Contact support at greenreguai@outlook.com."})
 
-            # Fetch user_id from Supabase using email
-            user_response = supabase_service.admin_client.from_('user_profiles').select('user_id').eq('email', email).single().execute()
-            print("Supabase response:", user_response)
-            user_data = user_response.data
+            # Resolve user_id from email, bypassing the cache so a remembered miss cannot reject a new user's payment
+            user_data = await profile_service.get_profile(email, fresh=True)
             if not user_data:
                 return JSONResponse(status_code=400, content={"detail": "User not found. Contact support at greenreguai@outlook.com."})
             
@@ -59,7 +58,7 @@ async def stripe_webhook(request: Request):
                 return JSONResponse(status_code=400, content={"detail": "Payment not successful. Contact support at greenreguai@outlook.com."})
 
             # Insert transaction into Supabase
-            supabase_service.admin_client.table('credit_transactions').insert({
+            await supabase_service.admin_client.table('credit_transactions').insert({
                 'user_id': user_id,
                 'credits_amount': credits_to_add,
                 'money_amount': money_spent,
@@ -68,6 +67,9 @@ async def stripe_webhook(request: Request):
                 'stripe_payment_id': session['id'],
                 'status': 'completed'
             }).execute()
+            
+            # The purchase changed the user's balance
+            profile_service.invalidate(email=email, user_id=user_id)
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": f"Internal server error: {str(e)}. Contact support at greenreguai@outlook.com."})
@@ -4,7 +4,10 @@ Background task scheduler for periodic operations.
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from ..services.supabase import supabase_service
+from ..services.ingestion_scheduler import ingestion_scheduler
+from ..services.embedding_service import embedding_service
+from .concurrency import shutdown_process_pool
+from .config import settings
 import logging
 
 class BackgroundTaskManager:
@@ -14,11 +17,38 @@ class BackgroundTaskManager:
     def start(self):
         """Start the background task scheduler"""
         # Add document sync job - runs every 30 minutes
+        # A single instance at a time; missed runs collapse into one
         self.scheduler.add_job(
-            supabase_service.sync_unprocessed_documents,
-            trigger=IntervalTrigger(minutes=30),
+            ingestion_scheduler.run_sync,
+            trigger=IntervalTrigger(minutes=settings.DOCUMENT_SYNC_INTERVAL),
             id='document_sync',
             name='Document Sync Job',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        
+        # Pick up ingestion jobs interrupted by a restart; runs once at startup
+        self.scheduler.add_job(
+            ingestion_scheduler.resume_jobs,
+            id='ingestion_jobs_resume',
+            name='Ingestion Jobs Resume',
+            replace_existing=True
+        )
+        
+        # Index chunks embedded before hybrid search existed; runs once at startup
+        self.scheduler.add_job(
+            embedding_service.backfill_lexical_index,
+            id='lexical_index_backfill',
+            name='Lexical Index Backfill',
+            replace_existing=True
+        )
+        
+        # Copy filterable document fields onto vectors embedded before they existed; runs once at startup
+        self.scheduler.add_job(
+            embedding_service.backfill_filter_metadata,
+            id='vector_metadata_backfill',
+            name='Vector Metadata Backfill',
             replace_existing=True
         )
         
@@ -29,6 +59,7 @@ class BackgroundTaskManager:
     def shutdown(self):
         """Shutdown the scheduler"""
         self.scheduler.shutdown()
+        shutdown_process_pool()
         logging.info("Background task scheduler shutdown")
 
 # Create singleton instance
@@ -0,0 +1,52 @@
+"""
+Shared concurrency primitives for ingestion: a process pool for CPU-bound
+PDF parsing and per-stage limits for I/O-bound download/embedding work.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import asyncio
+import multiprocessing
+import logging
+from .config import settings
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_stage_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+STAGE_LIMITS = {
+    "download": settings.INGEST_DOWNLOAD_CONCURRENCY,
+    "parse": settings.PDF_PARSE_WORKERS,
+    "embed": settings.INGEST_EMBED_CONCURRENCY,
+}
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool, creating it on first use"""
+    global _process_pool
+    if _process_pool is None:
+        # Spawn avoids forking a process that already holds event-loop and HTTP client threads
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logging.info(f"Started PDF parsing pool with {settings.PDF_PARSE_WORKERS} workers")
+    return _process_pool
+
+def shutdown_process_pool() -> None:
+    """Shut down the shared process pool if it was started"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+@asynccontextmanager
+async def stage_limit(stage: str):
+    """
+    Cap concurrent work in an ingestion stage: documents downloading or
+    embedding, and page ranges being parsed in the process pool
+    """
+    semaphore = _stage_semaphores.get(stage)
+    if semaphore is None:
+        semaphore = _stage_semaphores[stage] = asyncio.Semaphore(STAGE_LIMITS[stage])
+    async with semaphore:
+        yield
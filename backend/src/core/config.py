@@ -39,6 +39,12 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_KEY: str
     SUPABASE_SERVICE_KEY: str
+    SUPABASE_MAX_CONNECTIONS: int = 50  # shared pool for database and storage requests
+    SUPABASE_MAX_KEEPALIVE: int = 20  # idle connections kept open
+    SUPABASE_KEEPALIVE_EXPIRY: float = 30.0  # seconds an idle connection is kept
+    SUPABASE_TIMEOUT: float = 15.0  # seconds per request
+    SUPABASE_CONNECT_TIMEOUT: float = 5.0
+    SUPABASE_RETRIES: int = 3  # retries for failed connects and idempotent requests
     
     # OpenAI
     OPENAI_API_KEY: str
@@ -61,6 +67,88 @@ class Settings(BaseSettings):
     # Background Tasks Configuration
     DOCUMENT_SYNC_INTERVAL: int = 30  # minutes
     
+    # Document Ingestion
+    CHUNK_INSERT_BATCH_SIZE: int = 200  # chunks per bulk insert request
+    CHUNK_INSERT_MAX_RETRIES: int = 3  # attempts per failed batch
+    INGEST_CONCURRENCY: int = 4  # documents ingested at once by the sync job
+    INGEST_DOWNLOAD_CONCURRENCY: int = 4  # concurrent storage downloads
+    INGEST_EMBED_CONCURRENCY: int = 2  # documents embedding at once
+    INGEST_MAX_ATTEMPTS: int = 3  # attempts per document before it is marked failed
+    PROCESSING_CLAIM_TIMEOUT: int = 120  # minutes before a processing claim is considered abandoned
+    INGESTION_QUEUE_PATH: str = ".cache/ingestion_queue.sqlite3"
+    INGESTION_JOBS_PATH: str = ".cache/ingestion_jobs.sqlite3"  # jobs submitted through the API
+    INGEST_JOB_WORKERS: int = 2  # API-submitted jobs run at once
+    INGEST_PROGRESS_INTERVAL: float = 5.0  # seconds between progress writes to the documents row within a stage
+    PDF_PARSE_WORKERS: int = max(1, (os.cpu_count() or 2) - 1)  # processes in the PDF parsing pool
+    PDF_PAGES_PER_TASK: int = 16  # pages parsed per pool task; large PDFs are split across workers
+    
+    # Embedding Generation
+    EMBEDDING_BATCH_TOKENS: int = 20000  # token budget per embedding request
+    EMBEDDING_MAX_BATCH_SIZE: int = 256  # max chunks per embedding request
+    EMBEDDING_CONCURRENCY: int = 4  # batches in flight at once
+    EMBEDDING_MAX_RETRIES: int = 6  # attempts per batch on rate limits/transient errors
+    
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MEMORY_ITEMS: int = 10000  # in-process LRU entries
+    EMBEDDING_CACHE_PATH: Optional[str] = ".cache/embeddings.sqlite3"  # empty disables the disk tier
+    
+    # Vector Store
+    VECTOR_STORE_BACKEND: str = "pinecone"  # "pinecone" or "local"
+    PINECONE_METRIC: str = ""  # "cosine", "dotproduct" or "euclidean"; read from the index when empty
+    LOCAL_VECTOR_STORE_PATH: str = ".cache/vector_store"
+    LOCAL_VECTOR_IVF_MIN_VECTORS: int = 20000  # exact search below this many vectors
+    LOCAL_VECTOR_NPROBE: int = 8  # IVF lists scanned per query
+    VECTOR_METADATA_BACKFILL_MARKER: str = ".cache/vector_metadata_backfill.done"  # written once old vectors carry the filter fields; empty disables the backfill
+    
+    # Retrieval Cutoff (rerank or normalised similarity scores in [0, 1])
+    RETRIEVAL_SCORE_MARGIN: float = 0.1  # keep final hits within this of the top score
+    RETRIEVAL_KNEE_GAP: float = 0.05  # a drop this large between consecutive hits ends the list
+    
+    # Hybrid Retrieval
+    HYBRID_SEARCH_ENABLED: bool = True  # fuse BM25 with vector results
+    LEXICAL_INDEX_PATH: str = ".cache/lexical_index.sqlite3"
+    HYBRID_CANDIDATES: int = 20  # hits taken from each retriever before fusion
+    
+    # Reranking
+    RERANK_ENABLED: bool = True
+    RERANK_BACKEND: str = "lexical"  # "lexical" or "cross-encoder" (needs sentence-transformers)
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 50  # first-stage hits handed to the reranker
+    RERANK_TIMEOUT_MS: int = 150  # beyond this the first-stage order is kept
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_CACHE_SIZE: int = 10000  # cached (query, chunk) scores
+    
+    # RAG Context
+    CONTEXT_MAX_TOKENS: int = 3000  # prompt tokens spent on retrieved chunks
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.9  # shingle overlap above which a chunk is a duplicate
+    
+    # Conversation History
+    HISTORY_MAX_TURNS: int = 3  # recent question/answer pairs sent verbatim
+    HISTORY_MESSAGE_MAX_CHARS: int = 2000  # longer messages are truncated in the prompt
+    HISTORY_SUMMARY_BATCH: int = 4  # messages outside the window before they are summarised
+    HISTORY_SUMMARY_MAX_TOKENS: int = 300
+    
+    # Conversation Cache
+    CONVERSATION_CACHE_ENABLED: bool = True
+    CONVERSATION_CACHE_TTL: int = 900  # seconds; bounds staleness if another instance writes
+    CONVERSATION_CACHE_MAX_ENTRIES: int = 1000
+    
+    # Credits
+    CREDIT_LEDGER_BACKEND: str = "local"  # "local" or "supabase" (needs the functions in DataStructure.md)
+    
+    # Profile Cache
+    PROFILE_CACHE_ENABLED: bool = True
+    PROFILE_CACHE_TTL: int = 300  # seconds; bounds staleness of balances changed elsewhere
+    PROFILE_CACHE_NEGATIVE_TTL: int = 30  # seconds an unknown email is remembered
+    PROFILE_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Answer Cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY: float = 0.95  # min cosine similarity between query embeddings
+    ANSWER_CACHE_TTL: int = 3600  # seconds
+    ANSWER_CACHE_MAX_ENTRIES: int = 512
+    
     # Security
     SECURITY_HEADERS: bool = ENV != "development"
     
@@ -0,0 +1,43 @@
+"""
+Per-request stage timing. Stages may overlap, so each stage records its own
+wall time and the total is measured from when the timer was created.
+"""
+
+from contextlib import contextmanager
+from typing import Dict, Awaitable, TypeVar
+import logging
+import time
+
+T = TypeVar("T")
+
+class StageTimer:
+    def __init__(self):
+        self.timings: Dict[str, float] = {}  # stage name -> milliseconds
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as one stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    async def track(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await a coroutine and time it as one stage; suited to asyncio.create_task"""
+        with self.stage(name):
+            return await awaitable
+
+    def total(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def server_timing(self) -> str:
+        """Format timings as a Server-Timing header value"""
+        metrics = [f"{name};dur={duration:.1f}" for name, duration in self.timings.items()]
+        metrics.append(f"total;dur={self.total():.1f}")
+        return ", ".join(metrics)
+
+    def log(self, label: str) -> None:
+        stages = " ".join(f"{name}={duration:.0f}ms" for name, duration in self.timings.items())
+        logging.info(f"{label} timings: {stages} total={self.total():.0f}ms")
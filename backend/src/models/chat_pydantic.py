@@ -27,11 +27,22 @@ class ChatMessage(BaseModel):
     message_index: int
     created_at: datetime
 
+class RetrievalFilters(BaseModel):
+    """Scope for retrieval, matched against the metadata of each chunk's document"""
+    region: Optional[str] = Field(None, description="Only documents for this region")
+    category: Optional[str] = Field(None, description="Only documents of this category")
+    tags: Optional[List[str]] = Field(None, description="Only documents with any of these tags")
+    year: Optional[int] = Field(None, description="Only documents published in this year")
+    year_from: Optional[int] = Field(None, description="Only documents published in or after this year")
+    year_to: Optional[int] = Field(None, description="Only documents published in or before this year")
+    document_ids: Optional[List[str]] = Field(None, description="Only these documents")
+
 class ChatRequest(BaseModel):
     """Incoming chat request"""
     query: str = Field(..., description="User's question")
     conversation_id: Optional[str] = Field(None, description="ID of existing conversation")
     email: str = Field(..., description="User's email from Supabase auth")
+    filters: Optional[RetrievalFilters] = Field(None, description="Restrict retrieval to matching documents")
 
 class ChatResponse(BaseModel):
     """Response including answer and source information"""
@@ -39,6 +50,7 @@ class ChatResponse(BaseModel):
     sources: List[Dict]
     conversation_id: str
     tokens_used: int
+    credits_remaining: Optional[int] = None  # balance once this answer is charged
 
 class ConversationHistory(BaseModel):
     """Complete conversation history"""
@@ -28,6 +28,8 @@ class DocumentBase(BaseModel):
     publication_year: Optional[str] = None
     processing_status: ProcessingStatus = ProcessingStatus.PENDING
     error_message: Optional[str] = None
+    content_hash: Optional[str] = None  # SHA-256 of the last fully ingested file
+    source_etag: Optional[str] = None  # Storage eTag the document was last synced from
 
 class DocumentResponse(DocumentBase):
     """Model for document responses"""
@@ -0,0 +1,111 @@
+"""
+Semantic answer cache for the chat endpoint.
+Returns a previous answer when a new question's embedding is close enough to
+a cached one, retrieval produced the same chunk set, and the corpus has not
+been re-ingested since. Entries expire after a TTL and are evicted LRU.
+"""
+
+from typing import List, Dict, Any, Optional, Iterable
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import itertools
+import threading
+import time
+import numpy as np
+
+@dataclass
+class CachedAnswer:
+    embedding: np.ndarray  # unit-normalised query embedding
+    chunk_ids: frozenset
+    corpus_version: int
+    response: str
+    sources: List[Dict[str, Any]]
+    document_ids: frozenset
+    created_at: float = field(default_factory=time.time)
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 3600, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.corpus_version = 0
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query_embedding: List[float], chunk_ids: Iterable[str]) -> Optional[CachedAnswer]:
+        """Find the most similar live answer built from exactly the same chunks"""
+        query = self._normalise(query_embedding)
+        chunk_ids = frozenset(chunk_ids)
+        
+        with self._lock:
+            self._expire()
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.chunk_ids == chunk_ids and entry.corpus_version == self.corpus_version
+            ]
+            if candidates:
+                similarities = np.stack([entry.embedding for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        query_embedding: List[float],
+        chunk_ids: Iterable[str],
+        response: str,
+        sources: List[Dict[str, Any]]
+    ) -> None:
+        """Cache an answer together with the retrieval result it was generated from"""
+        entry = CachedAnswer(
+            embedding=self._normalise(query_embedding),
+            chunk_ids=frozenset(chunk_ids),
+            corpus_version=self.corpus_version,
+            response=response,
+            sources=sources,
+            document_ids=frozenset(source["source"]["document_id"] for source in sources)
+        )
+        with self._lock:
+            self._entries[next(self._ids)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_document(self, document_id: str) -> None:
+        """
+        Drop answers citing a re-ingested document and bump the corpus version,
+        so answers that might now retrieve different chunks are not served either.
+        """
+        with self._lock:
+            self.corpus_version += 1
+            for key in [key for key, entry in self._entries.items() if document_id in entry.document_ids]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "corpus_version": self.corpus_version
+        }
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for key in [key for key, entry in self._entries.items() if entry.created_at < cutoff]:
+            del self._entries[key]
+
+    def _normalise(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,168 @@
+"""
+Token-budgeted context assembly for RAG prompts.
+Retrieved chunks are ranked by retrieval score, near-duplicates are dropped,
+the best chunks are packed into a token budget, and chunks that follow each
+other on the same page are merged into one context entry.
+"""
+
+from typing import List, Dict, Optional, Set, Tuple
+import logging
+import re
+import tiktoken
+
+logging.basicConfig(level=logging.INFO)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def format_chunk(chunk: Dict) -> str:
+    """Render one context entry as it appears in the prompt"""
+    return (
+        f"[Chunk {chunk['index']}]\n"
+        f"Page: {chunk['source']['page_number']}\n"
+        f"Section: {chunk['source']['section_title'] or 'N/A'}\n"
+        f"Content:\n{chunk['content']}\n"
+    )
+
+def shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    """Word n-grams used to compare chunk content"""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def overlap(a: Set, b: Set) -> float:
+    """Share of the smaller shingle set found in the other, so contained chunks count as duplicates"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+class ContextBuilder:
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        max_tokens: int = 3000,
+        duplicate_threshold: float = 0.9,
+        tokenizer=None
+    ):
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.tokenizer = tokenizer or tiktoken.encoding_for_model(model)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, disallowed_special=()))
+
+    def build(self, relevant_chunks: List[Dict]) -> Dict:
+        """
+        Assemble retrieved chunks ({chunk, similarity_score, retrieval_score})
+        into the array-based context format used by the prompt and citations.
+        Entries are ordered by their best retrieval score and indexed from 0.
+        """
+        ranked = sorted(relevant_chunks, key=lambda x: x['retrieval_score'], reverse=True)
+        unique = self._deduplicate(ranked)
+        selected = self._pack(unique)
+        groups = self._merge_adjacent(selected)
+        
+        chunks = [self._entry(i, group) for i, group in enumerate(groups)]
+        tokens = sum(self.count_tokens(format_chunk(chunk)) for chunk in chunks)
+        logging.info(
+            f"Context: {len(chunks)} entries from {len(selected)} of {len(relevant_chunks)} chunks "
+            f"({len(ranked) - len(unique)} duplicates), {tokens}/{self.max_tokens} tokens"
+        )
+        return {"chunks": chunks, "tokens": tokens}
+
+    def _deduplicate(self, ranked: List[Dict]) -> List[Dict]:
+        """Drop chunks whose content largely repeats a higher-ranked chunk"""
+        kept, kept_shingles = [], []
+        for item in ranked:
+            item_shingles = shingles(item['chunk']['content'])
+            if any(overlap(item_shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept.append(item)
+            kept_shingles.append(item_shingles)
+        return kept
+
+    def _pack(self, ranked: List[Dict]) -> List[Dict]:
+        """
+        Greedily take chunks in rank order while they fit the budget, skipping
+        ones that are too large. The top chunk is truncated rather than dropped.
+        """
+        selected, remaining = [], self.max_tokens
+        for item in ranked:
+            cost = self.count_tokens(format_chunk(self._entry(0, [item])))
+            if cost <= remaining:
+                selected.append(item)
+                remaining -= cost
+            elif not selected:
+                selected.append(self._truncate(item, cost - remaining))
+                remaining = 0
+        return selected
+
+    def _truncate(self, item: Dict, excess_tokens: int) -> Dict:
+        tokens = self.tokenizer.encode(item['chunk']['content'], disallowed_special=())
+        content = self.tokenizer.decode(tokens[:max(0, len(tokens) - excess_tokens)])
+        return {**item, 'chunk': {**item['chunk'], 'content': content}}
+
+    def _merge_adjacent(self, selected: List[Dict]) -> List[List[Dict]]:
+        """
+        Group chunks that are consecutive on the same page (by chunk_index).
+        Groups keep reading order internally and are ordered by their best rank.
+        """
+        position = {id(item): rank for rank, item in enumerate(selected)}
+        by_page: Dict[Tuple, List[Dict]] = {}
+        groups: List[List[Dict]] = []
+        
+        for item in selected:
+            chunk = item['chunk']
+            if chunk.get('chunk_index') is None:
+                groups.append([item])
+            else:
+                by_page.setdefault((chunk['document_id'], chunk['page_number']), []).append(item)
+        
+        for items in by_page.values():
+            items.sort(key=lambda item: item['chunk']['chunk_index'])
+            group = [items[0]]
+            for item in items[1:]:
+                if item['chunk']['chunk_index'] == group[-1]['chunk']['chunk_index'] + 1:
+                    group.append(item)
+                else:
+                    groups.append(group)
+                    group = [item]
+            groups.append(group)
+        
+        return sorted(groups, key=lambda group: min(position[id(item)] for item in group))
+
+    def _entry(self, index: int, group: List[Dict]) -> Dict:
+        """Build one context entry; a merged group cites its first chunk and lists all of them"""
+        first = group[0]['chunk']
+        similarity_scores = [item['similarity_score'] for item in group if item['similarity_score'] is not None]
+        return {
+            "index": index,  # Add index for easy reference
+            "content": "\n".join(item['chunk']['content'] for item in group),
+            "source": {
+                "chunk_id": first['chunk_id'],
+                "chunk_ids": [item['chunk']['chunk_id'] for item in group],
+                "document_id": first['document_id'],
+                "page_number": first['page_number'],
+                "section_title": next((item['chunk']['section_title'] for item in group if item['chunk']['section_title']), None),
+                "location_data": self._merge_locations([item['chunk']['location_data'] for item in group]),
+                "similarity_score": max(similarity_scores) if similarity_scores else None
+            }
+        }
+
+    def _merge_locations(self, locations: List[Optional[Dict]]) -> Optional[Dict]:
+        """Union the highlight rectangles of merged chunks"""
+        located = [location for location in locations if location and location.get("rects")]
+        if len(located) <= 1:
+            return located[0] if located else locations[0]
+        
+        rects = [rect for location in located for rect in location["rects"]]
+        return {
+            **located[0],
+            "rects": rects,
+            "bbox": {
+                "x0": min(rect["x0"] for rect in rects),
+                "y0": min(rect["y0"] for rect in rects),
+                "x1": max(rect["x1"] for rect in rects),
+                "y1": max(rect["y1"] for rect in rects)
+            }
+        }
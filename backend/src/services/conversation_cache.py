@@ -0,0 +1,150 @@
+"""
+In-process cache of recent conversation state.
+Holds the conversation row, the messages a prompt needs (those not yet folded
+into the rolling summary) and the summary itself, so a multi-turn chat served
+by this instance does not re-read them on every turn. Message inserts are
+written through; entries expire after a TTL and the least recently used
+conversations are evicted, after which state is read from Supabase again.
+"""
+
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import threading
+import time
+
+@dataclass
+class ConversationState:
+    conversation: Optional[Any] = None  # ConversationResponse
+    window_loaded: bool = False  # whether summary and messages mirror Supabase
+    summary: Optional[str] = None
+    summary_message_index: Optional[int] = None
+    messages: List[Dict] = field(default_factory=list)  # unsummarised messages, oldest first
+    expires_at: float = 0.0
+
+class ConversationCache:
+    def __init__(self, max_conversations: int = 1000, ttl_seconds: float = 900, max_messages: int = 9):
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages  # most recent messages kept per conversation
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_conversation(self, conversation_id: str) -> Optional[Any]:
+        with self._lock:
+            state = self._get(conversation_id)
+            conversation = state.conversation if state else None
+            self._count(conversation is not None)
+            return conversation
+
+    def set_conversation(self, conversation_id: str, conversation: Any) -> None:
+        with self._lock:
+            self._state(conversation_id).conversation = conversation
+
+    def get_window(self, conversation_id: str) -> Optional[ConversationState]:
+        """Cached summary and messages, or None if they have not been loaded"""
+        with self._lock:
+            state = self._get(conversation_id)
+            loaded = state is not None and state.window_loaded
+            self._count(loaded)
+            if not loaded:
+                return None
+            return ConversationState(
+                summary=state.summary,
+                summary_message_index=state.summary_message_index,
+                messages=list(state.messages)
+            )
+
+    def set_window(
+        self,
+        conversation_id: str,
+        summary: Optional[str],
+        summary_message_index: Optional[int],
+        messages: List[Dict]
+    ) -> None:
+        with self._lock:
+            state = self._state(conversation_id)
+            state.window_loaded = True
+            state.summary = summary
+            state.summary_message_index = summary_message_index
+            # Keep messages written through while the window was being read
+            loaded = {msg['message_index'] for msg in messages}
+            state.messages = sorted(
+                list(messages) + [msg for msg in state.messages if msg['message_index'] not in loaded],
+                key=lambda msg: msg['message_index']
+            )
+            self._trim(state)
+
+    def add_message(self, conversation_id: str, message: Dict) -> None:
+        """
+        Write through a stored message row; assistant messages also add to the credit total.
+        Messages are kept even before the window is loaded, so a read that raced
+        with the insert does not lose them.
+        """
+        with self._lock:
+            state = self._state(conversation_id)
+            if message.get('message_index') is None:
+                # Position unknown, so the cached window can no longer be trusted
+                state.window_loaded = False
+            elif all(msg['message_index'] != message['message_index'] for msg in state.messages):
+                state.messages.append(message)
+                state.messages.sort(key=lambda msg: msg['message_index'])
+                self._trim(state)
+            if state.conversation is not None and (message.get('credits_used') or 0) < 0:
+                state.conversation.total_credits_used -= message['credits_used']
+
+    def set_summary(self, conversation_id: str, summary: str, summary_message_index: int) -> None:
+        with self._lock:
+            state = self._get(conversation_id)
+            if state is None or not state.window_loaded:
+                return
+            state.summary = summary
+            state.summary_message_index = summary_message_index
+            self._trim(state)
+
+    def invalidate(self, conversation_id: str) -> None:
+        with self._lock:
+            self._states.pop(conversation_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "conversations": len(self._states),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def _get(self, conversation_id: str) -> Optional[ConversationState]:
+        state = self._states.get(conversation_id)
+        if state is None:
+            return None
+        if state.expires_at < time.monotonic():
+            del self._states[conversation_id]
+            return None
+        self._states.move_to_end(conversation_id)
+        return state
+
+    def _state(self, conversation_id: str) -> ConversationState:
+        """Get or create the entry for a write, extending its TTL"""
+        state = self._get(conversation_id)
+        if state is None:
+            state = self._states[conversation_id] = ConversationState()
+            while len(self._states) > self.max_conversations:
+                self._states.popitem(last=False)
+        state.expires_at = time.monotonic() + self.ttl_seconds
+        return state
+
+    def _trim(self, state: ConversationState) -> None:
+        if state.summary_message_index is not None:
+            state.messages = [msg for msg in state.messages if msg['message_index'] > state.summary_message_index]
+        del state.messages[:-self.max_messages]
+
+    def _count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
@@ -1,12 +1,15 @@
 """
 Manages conversation operations including creation, retrieval,
 and metadata management.
+Conversation rows are cached in process (see conversation_cache).
 """
 
 from typing import Dict, Optional
 from datetime import datetime
 import logging
 from .supabase import supabase_service
+from .conversation_cache import ConversationCache
+from ..core.config import settings
 from ..models.chat_pydantic import ConversationBase, ConversationResponse
 
 logging.basicConfig(level=logging.INFO)
@@ -14,8 +17,15 @@ logging.basicConfig(level=logging.INFO)
 class ConversationService:
     def __init__(self):
         self.supabase = supabase_service
+        
+        # Recent conversation state shared with the history service; None disables it
+        self.cache = ConversationCache(
+            max_conversations=settings.CONVERSATION_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.CONVERSATION_CACHE_TTL,
+            max_messages=settings.HISTORY_MAX_TURNS * 2 + settings.HISTORY_SUMMARY_BATCH - 1
+        ) if settings.CONVERSATION_CACHE_ENABLED else None
 
-    def create_conversation(self, user_id: str, title: str = "New Conversation") -> ConversationResponse:
+    async def create_conversation(self, user_id: str, title: str = "New Conversation") -> ConversationResponse:
         """Create a new conversation"""
         try:
             conversation_data = ConversationBase(
@@ -23,31 +33,45 @@ class ConversationService:
                 title=title
             )
             
-            result = self.supabase.admin_client.table('conversations')\
+            result = await self.supabase.admin_client.table('conversations')\
                 .insert(conversation_data.model_dump())\
                 .execute()
-                
-            return ConversationResponse(**result.data[0])
+            
+            conversation = ConversationResponse(**result.data[0])
+            if self.cache:
+                # A new conversation has no messages or summary yet
+                self.cache.set_conversation(conversation.conversation_id, conversation)
+                self.cache.set_window(conversation.conversation_id, None, None, [])
+            return conversation
             
         except Exception as e:
             logging.error(f"Error creating conversation: {str(e)}")
             raise
 
-    def get_conversation(self, conversation_id: str) -> Optional[ConversationResponse]:
+    async def get_conversation(self, conversation_id: str) -> Optional[ConversationResponse]:
         """Get conversation by ID"""
         try:
-            result = self.supabase.admin_client.table('conversations')\
+            cached = self.cache.get_conversation(conversation_id) if self.cache else None
+            if cached:
+                return cached
+            
+            result = await self.supabase.admin_client.table('conversations')\
                 .select('*')\
                 .eq('conversation_id', conversation_id)\
                 .execute()
-                
-            return ConversationResponse(**result.data[0]) if result.data else None
+            
+            if not result.data:
+                return None
+            conversation = ConversationResponse(**result.data[0])
+            if self.cache:
+                self.cache.set_conversation(conversation_id, conversation)
+            return conversation
             
         except Exception as e:
             logging.error(f"Error retrieving conversation: {str(e)}")
             raise
 
-    def get_or_create_conversation(
+    async def get_or_create_conversation(
         self, 
         conversation_id: Optional[str], 
         user_id: str
@@ -55,20 +79,20 @@ class ConversationService:
         """Get existing conversation or create new one"""
         try:
             if conversation_id:
-                conversation = self.get_conversation(conversation_id)
+                conversation = await self.get_conversation(conversation_id)
                 if conversation:
                     return conversation
                     
-            return self.create_conversation(user_id)
+            return await self.create_conversation(user_id)
             
         except Exception as e:
             logging.error(f"Error in get_or_create_conversation: {str(e)}")
             raise
 
-    def get_conversation_history(self, conversation_id: str) -> list:
+    async def get_conversation_history(self, conversation_id: str) -> list:
         """Get ordered messages for a conversation"""
         try:
-            result = self.supabase.admin_client.table('messages')\
+            result = await self.supabase.admin_client.table('messages')\
                 .select('*')\
                 .eq('conversation_id', conversation_id)\
                 .order('message_index', desc=False)\
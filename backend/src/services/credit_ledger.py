@@ -0,0 +1,157 @@
+"""
+Credit reservations for chat requests.
+A request reserves its credit before any work starts and settles the
+reservation once the answer is saved, or refunds it if the request fails.
+A reservation only holds credits: the charge is the assistant message, which
+the messages trigger turns into a usage transaction (see DataStructure.md).
+SupabaseCreditLedger does this with Postgres functions, so the balance check,
+hold and user lookup are one atomic round-trip; LocalCreditLedger is a
+stand-in for databases without those functions.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dataclasses import dataclass
+import asyncio
+
+class UserNotFoundError(Exception):
+    """Raised when no user profile matches the email"""
+
+class InsufficientCreditsError(Exception):
+    """Raised when the user's balance does not cover the reservation"""
+
+@dataclass
+class CreditReservation:
+    reservation_id: str
+    user_id: str
+    amount: int
+    balance: int  # credits left once this reservation is settled
+    status: str = "reserved"  # then "settled" or "refunded"
+
+class CreditLedger(ABC):
+    """
+    Reserve, settle and refund credits.
+    settle and refund only act on reservations that are still reserved, so
+    calling either after the other is a no-op.
+    """
+
+    @abstractmethod
+    async def reserve(self, email: str, amount: int = 1) -> CreditReservation:
+        ...
+
+    @abstractmethod
+    async def settle(
+        self,
+        reservation: CreditReservation,
+        conversation_id: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> None:
+        ...
+
+    @abstractmethod
+    async def refund(self, reservation: CreditReservation) -> None:
+        ...
+
+class SupabaseCreditLedger(CreditLedger):
+    """
+    Ledger backed by the reserve/settle/refund Postgres functions, called over RPC.
+    supabase is the service whose admin_client runs the calls.
+    """
+
+    def __init__(self, supabase: Any):
+        self.supabase = supabase
+
+    async def reserve(self, email: str, amount: int = 1) -> CreditReservation:
+        result = await self.supabase.admin_client.rpc('reserve_credits', {
+            'p_email': email,
+            'p_amount': amount
+        }).execute()
+        row = result.data[0] if isinstance(result.data, list) and result.data else result.data
+        
+        if not row or row.get('status') == 'not_found':
+            raise UserNotFoundError(f"User profile not found: {email}")
+        if row['status'] == 'insufficient':
+            raise InsufficientCreditsError(f"Insufficient credits: {row.get('balance')} left")
+        return CreditReservation(
+            reservation_id=row['reservation_id'],
+            user_id=row['user_id'],
+            amount=amount,
+            balance=row['balance']
+        )
+
+    async def settle(
+        self,
+        reservation: CreditReservation,
+        conversation_id: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> None:
+        await self.supabase.admin_client.rpc('settle_credit_reservation', {
+            'p_reservation_id': reservation.reservation_id,
+            'p_conversation_id': conversation_id,
+            'p_message_id': message_id
+        }).execute()
+
+    async def refund(self, reservation: CreditReservation) -> None:
+        await self.supabase.admin_client.rpc('refund_credit_reservation', {
+            'p_reservation_id': reservation.reservation_id
+        }).execute()
+
+class LocalCreditLedger(CreditLedger):
+    """
+    Stand-in ledger for databases without the credit functions.
+    load_account returns {"user_id", "credits"} for an email, or None. Credits
+    held by requests in flight on this instance are subtracted from the stored
+    balance, which guards against concurrent requests overspending here; only
+    the Supabase ledger holds credits across instances.
+    """
+
+    def __init__(self, load_account: Callable[[str], Awaitable[Optional[Dict]]]):
+        self.load_account = load_account
+        self._held: Dict[str, int] = {}  # user_id -> credits reserved by requests in flight
+        self._reservations: Dict[str, CreditReservation] = {}
+        self._lock = asyncio.Lock()
+        self._next_id = 0
+
+    async def reserve(self, email: str, amount: int = 1) -> CreditReservation:
+        account = await self.load_account(email)
+        if not account:
+            raise UserNotFoundError(f"User profile not found: {email}")
+        
+        user_id = account['user_id']
+        async with self._lock:
+            available = account['credits'] - self._held.get(user_id, 0)
+            if available < amount:
+                raise InsufficientCreditsError(f"Insufficient credits: {available} left")
+            
+            self._held[user_id] = self._held.get(user_id, 0) + amount
+            self._next_id += 1
+            reservation = CreditReservation(
+                reservation_id=f"local-{self._next_id}",
+                user_id=user_id,
+                amount=amount,
+                balance=available - amount
+            )
+            self._reservations[reservation.reservation_id] = reservation
+            return reservation
+
+    async def settle(
+        self,
+        reservation: CreditReservation,
+        conversation_id: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> None:
+        # The charge was made by the assistant message, so only the hold is released
+        await self._release(reservation)
+
+    async def refund(self, reservation: CreditReservation) -> None:
+        await self._release(reservation)
+
+    async def _release(self, reservation: CreditReservation) -> None:
+        async with self._lock:
+            if self._reservations.pop(reservation.reservation_id, None) is None:
+                return
+            held = self._held.get(reservation.user_id, 0) - reservation.amount
+            if held > 0:
+                self._held[reservation.user_id] = held
+            else:
+                self._held.pop(reservation.user_id, None)
@@ -0,0 +1,88 @@
+"""
+Credit accounting for chat requests on top of the ledger selected by
+CREDIT_LEDGER_BACKEND (see credit_ledger). Settlement and refunds run in the
+background so they never hold up a response. Cached profile balances
+(see profile_service) follow the charge made when an answer is saved.
+"""
+
+from typing import Optional, Set
+import asyncio
+import logging
+from .supabase import supabase_service
+from .profile_service import profile_service
+from .credit_ledger import (
+    CreditLedger, CreditReservation, SupabaseCreditLedger, LocalCreditLedger, InsufficientCreditsError
+)
+from ..core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+
+class CreditService:
+    def __init__(self):
+        self.supabase = supabase_service
+        self.profiles = profile_service
+        self.ledger = self._create_ledger()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def reserve(self, email: str, amount: int = 1) -> CreditReservation:
+        """
+        Reserve credits for a request and resolve the user.
+        Raises UserNotFoundError or InsufficientCreditsError.
+        """
+        try:
+            return await self.ledger.reserve(email, amount)
+        except InsufficientCreditsError:
+            if not isinstance(self.ledger, LocalCreditLedger):
+                raise
+            # The cached balance may predate a purchase handled by another instance
+            self.profiles.invalidate(email=email)
+            return await self.ledger.reserve(email, amount)
+
+    def settle(
+        self,
+        reservation: CreditReservation,
+        conversation_id: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> None:
+        """Close a reservation once its answer is saved; the saved message made the charge"""
+        if self._close(reservation, "settled"):
+            # The cached balance predates the charge the messages trigger just made
+            self.profiles.adjust_credits(reservation.user_id, -reservation.amount)
+            self._spawn(self.ledger.settle(reservation, conversation_id, message_id), reservation)
+
+    def refund(self, reservation: Optional[CreditReservation]) -> None:
+        """Return a reservation's credits; a no-op once it is settled or refunded"""
+        if reservation and self._close(reservation, "refunded"):
+            # Nothing was charged, so the stored balance is unchanged
+            self._spawn(self.ledger.refund(reservation), reservation)
+
+    def _close(self, reservation: CreditReservation, status: str) -> bool:
+        # Marked synchronously so a refund racing a settlement cannot send both
+        if reservation.status != "reserved":
+            return False
+        reservation.status = status
+        return True
+
+    def _spawn(self, operation, reservation: CreditReservation) -> None:
+        task = asyncio.create_task(self._run(operation, reservation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, operation, reservation: CreditReservation) -> None:
+        try:
+            await operation
+        except Exception as e:
+            # Unsettled reservations stay visible in credit_reservations for reconciliation
+            logging.error(f"Error closing credit reservation {reservation.reservation_id} as {reservation.status}: {str(e)}")
+
+    def _create_ledger(self) -> CreditLedger:
+        """Create the credit ledger backend selected in settings"""
+        backend = settings.CREDIT_LEDGER_BACKEND
+        if backend == "supabase":
+            return SupabaseCreditLedger(self.supabase)
+        if backend == "local":
+            return LocalCreditLedger(self.profiles.get_profile)
+        raise ValueError(f"Unknown credit ledger backend: {backend}")
+
+# Singleton instance
+credit_service = CreditService()
@@ -4,8 +4,9 @@ Manages interaction between Supabase storage and database for document metadata.
 """
 
 from typing import List, Optional, Tuple, Dict
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import asyncio
 import tempfile
 import os
 from dotenv import load_dotenv
@@ -16,6 +17,10 @@ from ..services.supabase import supabase_service
 from ..models.document_pydantic import DocumentSearchFilters, DocumentResponse, SearchResponse, ProcessingStatus, DocumentBase
 from .pdf_batch_processor import pdf_batch_processor
 from .embedding_service import embedding_service
+from .rag_service import rag_service
+from .ingestion_jobs import JobProgress
+from ..core.concurrency import stage_limit, get_process_pool
+from ..core.config import settings
 import math
 
 # Load environment variables
@@ -23,6 +28,9 @@ load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 
+class DocumentBusyError(Exception):
+    """Raised when a document is already being processed by another run"""
+
 class DocumentService:
     def __init__(self):
         self.supabase = supabase_service
@@ -31,6 +39,8 @@ class DocumentService:
             temperature=0,
             openai_api_key=os.getenv('OPENAI_API_KEY')
         )
+        # One creation at a time per storage path (sync worker vs. API job)
+        self._create_locks: Dict[str, asyncio.Lock] = {}
 
     async def list_documents(self, folder: Optional[str] = None) -> List[dict]:
         """List all documents with their metadata"""
@@ -40,7 +50,7 @@ class DocumentService:
             if folder:
                 query = query.eq('category', folder)
             
-            result = query.execute()
+            result = await query.execute()
             return result.data
         except Exception as e:
             print(f"Document Service Error: {str(e)}")
@@ -54,7 +64,7 @@ class DocumentService:
         """Get document metadata by ID"""
         try:
             # Use admin_client and correct column name
-            result = self.supabase.admin_client.table('documents')\
+            result = await self.supabase.admin_client.table('documents')\
                 .select('*')\
                 .eq('document_id', document_id)\
                 .execute()
@@ -101,7 +111,7 @@ class DocumentService:
             end = start + filters.per_page - 1
 
             # Execute query with range
-            result = query.range(start, end).execute()
+            result = await query.range(start, end).execute()
             
             if not result.data:
                 return SearchResponse(
@@ -138,34 +148,65 @@ class DocumentService:
             print(f"Search Error: {str(e)}")
             raise e
 
-    def document_exists(self, file_name: str) -> bool:
-        response = self.supabase.table('documents').select('document_id').eq('file_path', file_name).execute()
+    async def document_exists(self, file_name: str) -> bool:
+        response = await self.supabase.admin_client.table('documents').select('document_id').eq('file_path', file_name).execute()
         return len(response.data) > 0
 
-    async def process_document(self, document_id: str) -> Dict:
-        """Process a document through the chunking and embedding pipeline"""
+    async def process_document(self, document_id: str, progress: Optional[JobProgress] = None) -> Dict:
+        """
+        Process a document through the chunking and embedding pipeline.
+        Stages (download, parse_embed, cleanup) are reported to progress when given.
+        """
+        progress = progress or JobProgress()
         try:
             # Get document and verify it exists
             document = await self.get_document_by_id(document_id)
             if not document:
                 raise ValueError(f"Document not found: {document_id}")
 
-            # Update status to processing
-            await self._update_processing_status(
-                document_id, 
-                ProcessingStatus.PROCESSING
-            )
+            # Claim the document so overlapping runs never process it twice
+            await self._claim_document(document_id)
 
             try:
-                # Step 1: Process PDF into chunks
+                # Step 1: Parse the PDF; changed chunks are saved page by page
                 logging.info(f"Starting PDF processing for document {document_id}")
-                await pdf_batch_processor.process_pdf_to_chunks(document)
-                logging.info(f"PDF processing completed for document {document_id}")
+                async with progress.stage("download"):
+                    plan = await pdf_batch_processor.process_pdf_to_chunks(
+                        document,
+                        on_moved=lambda chunks: embedding_service.update_chunk_positions(document_id, chunks)
+                    )
                 
-                # Step 2: Generate embeddings for chunks
-                logging.info(f"Starting embedding generation for document {document_id}")
-                await embedding_service.generate_and_store_embeddings(document_id)
-                logging.info(f"Embedding generation completed for document {document_id}")
+                if not plan["unchanged"]:
+                    # Step 2: Embed saved chunks as they stream in, so the first
+                    # vectors are searchable before the last page is parsed
+                    logging.info(f"Starting embedding generation for document {document_id}")
+                    
+                    async def on_stored(chunk_ids: List[str]) -> None:
+                        await pdf_batch_processor.mark_embedded(chunk_ids)
+                        await progress.advance("parse_embed", len(chunk_ids))
+                    
+                    try:
+                        async with progress.stage("parse_embed"), stage_limit("embed"):
+                            await embedding_service.store_embeddings_stream(
+                                document_id,
+                                plan["batches"],
+                                on_stored=on_stored,
+                                document=document
+                            )
+                    finally:
+                        await plan["batches"].aclose()
+                    logging.info(f"PDF processing and embedding completed for document {document_id}")
+                    
+                    # Step 3: Drop vectors and rows of chunks that disappeared
+                    async with progress.stage("cleanup"):
+                        await embedding_service.delete_embeddings(plan["removed_ids"])
+                        await pdf_batch_processor.delete_chunks(plan["removed_ids"])
+                        
+                        await self._update_content_hash(document_id, plan["content_hash"])
+                    
+                    # Cached chat answers may cite chunks that just changed
+                    if rag_service.answer_cache:
+                        rag_service.answer_cache.invalidate_document(document_id)
                 
                 # Update status to completed
                 await self._update_processing_status(
@@ -188,6 +229,26 @@ class DocumentService:
             logging.error(f"Error processing document {document_id}: {str(e)}")
             raise
 
+    async def _claim_document(self, document_id: str) -> None:
+        """
+        Atomically set the document to processing unless another run holds it.
+        Claims older than PROCESSING_CLAIM_TIMEOUT are treated as abandoned.
+        """
+        stale_before = (datetime.utcnow() - timedelta(minutes=settings.PROCESSING_CLAIM_TIMEOUT)).isoformat()
+        result = await self.supabase.admin_client.table('documents')\
+            .update({
+                'processing_status': ProcessingStatus.PROCESSING,
+                'updated_at': datetime.utcnow().isoformat()
+            })\
+            .eq('document_id', document_id)\
+            .or_(f"processing_status.neq.{ProcessingStatus.PROCESSING.value},updated_at.lt.{stale_before}")\
+            .execute()
+        
+        if not result.data:
+            raise DocumentBusyError(f"Document is already being processed: {document_id}")
+        
+        logging.info(f"Updated document {document_id} status to: {ProcessingStatus.PROCESSING}")
+
     async def _update_processing_status(
         self, 
         document_id: str, 
@@ -204,7 +265,7 @@ class DocumentService:
             update_data['error_message'] = error_message
             
         try:
-            self.supabase.admin_client.table('documents')\
+            await self.supabase.admin_client.table('documents')\
                 .update(update_data)\
                 .eq('document_id', document_id)\
                 .execute()
@@ -215,25 +276,73 @@ class DocumentService:
             logging.error(f"Error updating document status: {str(e)}")
             raise
 
-    async def create_document_from_upload(self, storage_path: str) -> Dict:
+    async def update_processing_progress(self, document_id: str, stage: Optional[str], stages: Dict[str, Dict]):
+        """Record the current ingestion stage and per-stage progress on the document"""
+        await self.supabase.admin_client.table('documents')\
+            .update({
+                'processing_stage': stage,
+                'processing_progress': stages
+            })\
+            .eq('document_id', document_id)\
+            .execute()
+
+    async def _update_content_hash(self, document_id: str, content_hash: str):
+        """Record the hash of the file whose chunks are now fully ingested"""
+        try:
+            await self.supabase.admin_client.table('documents')\
+                .update({'content_hash': content_hash})\
+                .eq('document_id', document_id)\
+                .execute()
+            
+        except Exception as e:
+            logging.error(f"Error updating document content hash: {str(e)}")
+            raise
+
+    async def create_document_from_upload(
+        self,
+        storage_path: str,
+        source_etag: Optional[str] = None,
+        progress: Optional[JobProgress] = None
+    ) -> Dict:
         """
         Extract metadata from uploaded PDF and create document record.
         Args:
             storage_path: Path of the uploaded file in Supabase storage
+            source_etag: Storage eTag of the file, used to detect later replacements
+            progress: Receives the download, parse and metadata stages when given
         Returns:
-            Created document record
+            Created document record, or the existing one if storage_path already has a record
         """
+        progress = progress or JobProgress()
+        lock = self._create_locks.setdefault(storage_path, asyncio.Lock())
+        async with lock:
+            result = await self.supabase.admin_client.table('documents')\
+                .select('*')\
+                .eq('file_path', storage_path)\
+                .limit(1)\
+                .execute()
+            if result.data:
+                logging.info(f"Document record already exists for {storage_path}")
+                progress.set_document_id(result.data[0]['document_id'])
+                return result.data[0]
+            
+            return await self._create_document_record(storage_path, source_etag, progress)
+
+    async def _create_document_record(self, storage_path: str, source_etag: Optional[str], progress: JobProgress) -> Dict:
+        """Download the PDF, extract its metadata with the LLM and insert the document row"""
         try:
             # Download file to temporary location
             temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
             try:
-                file_data = await self.supabase.download_file(storage_path)
-                temp_file.write(file_data)
-                temp_file.flush()
+                temp_file.close()
+                async with progress.stage("download"), stage_limit("download"):
+                    await self.supabase.download_to_file(storage_path, temp_file.name)
                 
                 # Load PDF content
-                loader = UnstructuredPDFLoader(temp_file.name)
-                doc = loader.load()[0]
+                # Loading is CPU-bound; keep it off the event loop
+                loop = asyncio.get_running_loop()
+                async with progress.stage("parse"):
+                    doc = await loop.run_in_executor(get_process_pool(), load_pdf_document, temp_file.name)
                 
                 # Create prompt for metadata extraction
                 prompt = ChatPromptTemplate.from_messages([
@@ -262,22 +371,25 @@ class DocumentService:
                 
                 # Get metadata from LLM
                 chain = prompt | self.llm
-                result = chain.invoke({})
+                async with progress.stage("metadata"):
+                    result = await chain.ainvoke({})
                 metadata = eval(result.content)  # Convert string to dict
                 
                 # Add additional required fields
                 metadata['publication_year'] = str(metadata['publication_year'])
-                metadata['file_size'] = len(file_data)
+                metadata['file_size'] = os.path.getsize(temp_file.name)
                 metadata['mime_type'] = 'application/pdf'
                 metadata['processing_status'] = ProcessingStatus.PENDING
                 metadata['file_path'] = storage_path  # Use the original storage path
+                metadata['source_etag'] = source_etag
                 
                 # Create document record
                 doc_data = DocumentBase(**metadata)
-                result = self.supabase.admin_client.table('documents')\
+                result = await self.supabase.admin_client.table('documents')\
                     .insert(doc_data.model_dump())\
                     .execute()
                 
+                progress.set_document_id(result.data[0]['document_id'])
                 return result.data[0]
                 
             finally:
@@ -289,5 +401,9 @@ class DocumentService:
             logging.error(f"Error creating document from upload: {str(e)}")
             raise
 
+def load_pdf_document(file_path: str):
+    """Process-pool entry point: load a PDF's text for metadata extraction"""
+    return UnstructuredPDFLoader(file_path).load()[0]
+
 # Create a singleton instance
 document_service = DocumentService()
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Persistent embedding cache keyed by (model, sha256(text)).
+Keeps a bounded in-process LRU tier in front of an optional SQLite tier,
+and wraps any LangChain embeddings so repeated texts and queries skip the
+embedding API round-trip.
+"""
+
+from typing import List, Dict, Optional
+from collections import OrderedDict
+from array import array
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from langchain_core.embeddings import Embeddings
+
+logging.basicConfig(level=logging.INFO)
+
+class EmbeddingCache:
+    def __init__(self, model: str, max_memory_items: int = 10000, db_path: Optional[str] = None):
+        self.model = model
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Hit/miss counters per tier
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        self._db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._db.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts, returning None for misses"""
+        keys = [self._key(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        disk_lookup: Dict[str, List[int]] = {}
+        
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_lookup.setdefault(key, []).append(i)
+            
+            if disk_lookup and self._db is not None:
+                hashes = list(disk_lookup)
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(hashes), 500):
+                    batch = hashes[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                        f"AND text_hash IN ({','.join('?' * len(batch))})",
+                        [self.model, *batch]
+                    ).fetchall()
+                    for text_hash, blob in rows:
+                        vector = array('f', blob).tolist()
+                        self._remember(text_hash, vector)
+                        for i in disk_lookup.pop(text_hash):
+                            results[i] = vector
+                            self.disk_hits += 1
+            
+            self.misses += sum(len(positions) for positions in disk_lookup.values())
+        
+        return results
+
+    def set_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store embeddings for texts in both tiers"""
+        with self._lock:
+            rows = []
+            for text, vector in zip(texts, vectors):
+                key = self._key(text)
+                self._remember(key, list(vector))
+                rows.append((self.model, key, array('f', vector).tobytes()))
+            
+            if rows and self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    rows
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        """Add to the memory tier, evicting the least recently used entries"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss metrics for monitoring"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory)
+        }
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that only sends cache misses to the underlying model"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = self._missing_texts(texts, vectors)
+        if missing:
+            computed = self.embeddings.embed_documents(missing)
+            self.cache.set_many(missing, computed)
+            vectors = self._fill(texts, vectors, dict(zip(missing, computed)))
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = self._missing_texts(texts, vectors)
+        if missing:
+            computed = await self.embeddings.aembed_documents(missing)
+            self.cache.set_many(missing, computed)
+            vectors = self._fill(texts, vectors, dict(zip(missing, computed)))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_many([text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set_many([text], [vector])
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_many([text])[0]
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.set_many([text], [vector])
+        return vector
+
+    def _missing_texts(self, texts: List[str], vectors: List[Optional[List[float]]]) -> List[str]:
+        """Unique texts without a cached vector, in first-seen order"""
+        return list(dict.fromkeys(
+            text for text, vector in zip(texts, vectors) if vector is None
+        ))
+
+    def _fill(self, texts, vectors, computed: Dict[str, List[float]]) -> List[List[float]]:
+        return [
+            vector if vector is not None else computed[text]
+            for text, vector in zip(texts, vectors)
+        ]
@@ -1,15 +1,28 @@
 """
 Manages document embedding generation and vector storage operations.
-Interfaces with Pinecone for vector similarity search.
+Vectors go to the index backend selected by VECTOR_STORE_BACKEND: Pinecone,
+or a local on-disk index (see vector_stores).
 """
 
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from pinecone import Pinecone as PineconeClient
 from dotenv import load_dotenv
+from ..core.config import settings
+from .embedding_cache import EmbeddingCache, CachedEmbeddings
+from .vector_stores import VectorIndex, PineconeVectorIndex, LocalVectorIndex
+from .lexical_index import LexicalIndex
+from .retrieval_filters import document_filter_metadata
+from .pagination import fetch_all
+from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+import tiktoken
+import asyncio
+import random
+import time
 import os
+import json
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Awaitable
+from datetime import datetime
 
 # Load environment variables
 load_dotenv()
@@ -17,65 +30,378 @@ load_dotenv()
 class EmbeddingService:
     def __init__(self):
         # Initialize OpenAI embeddings
+        self.model = "text-embedding-ada-002"
         self.embeddings = OpenAIEmbeddings(
             api_key=os.getenv('OPENAI_API_KEY'),
-            model="text-embedding-ada-002"
+            model=self.model
         )
         
-        # Initialize Pinecone
-        pc = PineconeClient(api_key=os.getenv('PINECONE_API_KEY'))
-        index = pc.Index(os.getenv('PINECONE_INDEX_NAME'))
+        # Serve repeated chunk texts and queries from the embedding cache
+        self.cache = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            self.cache = EmbeddingCache(
+                model=self.model,
+                max_memory_items=settings.EMBEDDING_CACHE_MEMORY_ITEMS,
+                db_path=settings.EMBEDDING_CACHE_PATH or None
+            )
+            self.embeddings = CachedEmbeddings(self.embeddings, self.cache)
         
-        # Initialize vector store
-        self.vector_store = PineconeVectorStore(
-            embedding=self.embeddings,
-            index=index
-        )
+        # Initialize the vector index backend
+        self.vector_index = self._create_vector_index()
+        
+        # BM25 index over the same chunks, for hybrid retrieval
+        self.lexical_index = LexicalIndex(settings.LEXICAL_INDEX_PATH) if settings.HYBRID_SEARCH_ENABLED else None
         
-        # Configure batch settings
-        self.batch_size = 10
+        # Configure batch settings: batches are sized by token budget, not count
+        self.batch_tokens = settings.EMBEDDING_BATCH_TOKENS
+        self.max_batch_size = settings.EMBEDDING_MAX_BATCH_SIZE
+        self.concurrency = settings.EMBEDDING_CONCURRENCY
+        self.max_retries = settings.EMBEDDING_MAX_RETRIES
+        self.tokenizer = tiktoken.encoding_for_model(self.model)
 
-    async def generate_and_store_embeddings(self, document_id: str) -> None:
-        """Generate and store embeddings for a specific document in batches"""
+    async def generate_and_store_embeddings(
+        self, 
+        document_id: str, 
+        chunks: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """
+        Generate and store embeddings for a specific document in batches.
+        If chunks are given only those are embedded, otherwise every chunk of the document.
+        Vectors are keyed by chunk_id so re-embedding a chunk overwrites its vector.
+        """
         from src.services.supabase import supabase_service
         
         try:
-            # Get all chunks for the document
-            result = supabase_service.admin_client.table('chunks')\
-                .select('*')\
-                .eq('document_id', document_id)\
-                .execute()
+            if chunks is None:
+                # Get all chunks for the document, paged past the select row cap
+                chunks = await fetch_all(
+                    lambda: supabase_service.admin_client.table('chunks')
+                        .select('*')
+                        .eq('document_id', document_id)
+                        .order('chunk_id')
+                )
             
-            if not result.data:
-                logging.warning(f"No chunks found for document {document_id}")
+            if not chunks:
+                logging.info(f"No chunks to embed for document {document_id}")
                 return
-                
-            chunks = result.data
-            total_chunks = len(chunks)
-            logging.info(f"Processing {total_chunks} chunks for document {document_id}")
             
-            # Process in batches
-            total_batches = (total_chunks - 1) // self.batch_size + 1
+            logging.info(f"Processing {len(chunks)} chunks for document {document_id}")
             
-            for i in range(0, total_chunks, self.batch_size):
-                batch = chunks[i:i + self.batch_size]
-                texts = [chunk['content'] for chunk in batch]
-                metadatas = [{
-                    'chunk_id': chunk['chunk_id'],
-                    'document_id': document_id,
-                    'text': chunk['content']
-                } for chunk in batch]
-                
-                # Add texts to vector store
-                await self.vector_store.aadd_texts(texts=texts, metadatas=metadatas)
-                
-                logging.info(f"Processed embedding batch {i//self.batch_size + 1} of {total_batches}")
+            async def single_batch():
+                yield chunks
             
-            logging.info(f"Successfully processed all chunks for document {document_id}")
-                
+            await self.store_embeddings_stream(document_id, single_batch())
+        
         except Exception as e:
             logging.error(f"Error generating embeddings for document {document_id}: {str(e)}")
             raise
 
+    async def store_embeddings_stream(
+        self, 
+        document_id: str, 
+        chunk_batches: AsyncIterator[List[Dict[str, Any]]],
+        on_stored: Optional[Callable[[List[str]], Awaitable[None]]] = None,
+        document: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Embed and store chunks as they arrive from an async iterator of chunk batches.
+        Incoming chunks are regrouped by token budget and several embedding batches
+        run at once. The iterator is only advanced while a slot is free, so a slow
+        provider applies backpressure to upstream parsing instead of buffering chunks.
+        on_stored is awaited with the chunk IDs of every batch once its vectors are stored.
+        document is the documents row whose metadata is copied onto every vector;
+        it is fetched when not given.
+        """
+        metrics = {"embed_seconds": 0.0, "upsert_seconds": 0.0, "retries": 0, "batches_done": 0, "chunks": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: List[asyncio.Task] = []
+        
+        if document is None:
+            document = await self._get_document(document_id)
+        document_metadata = document_filter_metadata(document)
+        
+        async def process_batch(batch: List[Dict[str, Any]]) -> None:
+            try:
+                await self._embed_and_upsert(document_id, batch, metrics, document_metadata)
+                if on_stored:
+                    await on_stored([chunk['chunk_id'] for chunk in batch])
+                metrics["batches_done"] += 1
+                metrics["chunks"] += len(batch)
+                logging.info(f"Stored embedding batch {metrics['batches_done']} ({metrics['chunks']} chunks) for document {document_id}")
+            finally:
+                semaphore.release()
+        
+        async def submit(batch: List[Dict[str, Any]]) -> None:
+            await semaphore.acquire()
+            # Surface failures early instead of parsing the rest of the document
+            for task in tasks:
+                if task.done() and task.exception():
+                    semaphore.release()
+                    raise task.exception()
+            tasks.append(asyncio.create_task(process_batch(batch)))
+        
+        try:
+            async for incoming in chunk_batches:
+                for batch in self._make_batches(incoming):
+                    await submit(batch)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        logging.info(
+            f"Successfully stored {metrics['chunks']} embeddings for document {document_id}: "
+            f"{metrics['batches_done']} batches, embedding {metrics['embed_seconds']:.2f}s, "
+            f"upsert {metrics['upsert_seconds']:.2f}s, {metrics['retries']} retries"
+        )
+        if self.cache:
+            logging.info(f"Embedding cache stats: {self.cache.stats()}")
+
+    def _make_batches(self, chunks: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Group chunks into batches that fit the per-request token budget"""
+        batches = []
+        current: List[Dict[str, Any]] = []
+        current_tokens = 0
+        
+        for chunk in chunks:
+            tokens = len(self.tokenizer.encode(chunk['content'], disallowed_special=()))
+            if current and (current_tokens + tokens > self.batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(chunk)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_and_upsert(
+        self, 
+        document_id: str, 
+        batch: List[Dict[str, Any]], 
+        metrics: Dict[str, Any],
+        document_metadata: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Embed a batch and upsert its vectors, timing each stage separately"""
+        texts = [chunk['content'] for chunk in batch]
+        
+        start = time.perf_counter()
+        vectors = await self._with_backoff(
+            lambda: self.embeddings.aembed_documents(texts),
+            metrics
+        )
+        metrics["embed_seconds"] += time.perf_counter() - start
+        
+        records = [{
+            'id': chunk['chunk_id'],
+            'values': vector,
+            'metadata': self._build_metadata(document_id, chunk, document_metadata)
+        } for chunk, vector in zip(batch, vectors)]
+        
+        start = time.perf_counter()
+        await self._with_backoff(
+            lambda: self.vector_index.upsert(records),
+            metrics
+        )
+        if self.lexical_index is not None:
+            await self.lexical_index.add([
+                {'chunk_id': chunk['chunk_id'], 'document_id': document_id, 'content': chunk['content']}
+                for chunk in batch
+            ])
+        metrics["upsert_seconds"] += time.perf_counter() - start
+
+    async def _with_backoff(self, operation, metrics: Dict[str, Any]):
+        """Run an async operation, backing off exponentially on rate limits and transient errors"""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return await operation()
+            except (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                metrics["retries"] += 1
+                logging.warning(f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                # Pinecone surfaces throttling as an HTTP 429 status
+                if getattr(e, 'status', None) != 429 or attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                metrics["retries"] += 1
+                logging.warning(f"Vector upsert throttled, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Honour Retry-After when the provider sends it, otherwise back off with jitter"""
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None and hasattr(response, 'headers') else None
+        try:
+            if retry_after:
+                return float(retry_after)
+        except ValueError:
+            pass
+        return min(60.0, 2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+
+    async def delete_embeddings(self, chunk_ids: List[str]) -> None:
+        """Delete the vectors of chunks that no longer exist"""
+        if not chunk_ids:
+            return
+        
+        try:
+            await self.vector_index.delete(chunk_ids)
+            if self.lexical_index is not None:
+                await self.lexical_index.remove(chunk_ids)
+            logging.info(f"Deleted {len(chunk_ids)} vectors")
+        except Exception as e:
+            logging.error(f"Error deleting embeddings: {str(e)}")
+            raise
+
+    async def update_chunk_positions(self, document_id: str, chunks: List[Dict[str, Any]]) -> None:
+        """
+        Rewrite the position metadata (page, section, index, location) of chunks
+        that moved within their document, keeping their vectors.
+        Retrieval builds citations from this metadata, so it must follow edits.
+        """
+        try:
+            updates = {}
+            for chunk in chunks:
+                metadata = self._build_metadata(document_id, chunk)
+                updates[chunk['chunk_id']] = {
+                    key: metadata[key]
+                    for key in ('page_number', 'section_title', 'location_data', 'chunk_index')
+                    if key in metadata
+                }
+            await self.vector_index.update_metadata(updates)
+            logging.info(f"Updated positions of {len(updates)} moved vectors for document {document_id}")
+        except Exception as e:
+            logging.error(f"Error updating moved vectors: {str(e)}")
+            raise
+
+    async def backfill_lexical_index(self, page_size: int = 1000) -> None:
+        """Index chunks stored before hybrid search was enabled; no-op once the index has content"""
+        from src.services.supabase import supabase_service
+        
+        if self.lexical_index is None or len(self.lexical_index):
+            return
+        
+        try:
+            rows = await fetch_all(
+                lambda: supabase_service.admin_client.table('chunks')
+                    .select('chunk_id, document_id, content')
+                    .order('chunk_id'),
+                page_size=page_size
+            )
+            await self.lexical_index.add(rows)
+            logging.info(f"Backfilled lexical index with {len(rows)} chunks")
+        
+        except Exception as e:
+            logging.error(f"Error backfilling lexical index: {str(e)}")
+            raise
+
+    async def backfill_filter_metadata(self, page_size: int = 1000) -> None:
+        """
+        Copy the filterable document fields onto vectors embedded before they
+        were stored, so filtered queries also match the existing corpus.
+        Runs once: a marker file is written when every document is done.
+        """
+        from src.services.supabase import supabase_service
+        
+        marker = settings.VECTOR_METADATA_BACKFILL_MARKER
+        if not marker or os.path.exists(marker):
+            return
+        
+        try:
+            documents = await fetch_all(
+                lambda: supabase_service.admin_client.table('documents')
+                    .select('document_id, region, category, tags, publication_year')
+                    .order('document_id'),
+                page_size=page_size
+            )
+            
+            updated = 0
+            for document in documents:
+                metadata = document_filter_metadata(document)
+                if not metadata:
+                    continue
+                chunks = await fetch_all(
+                    lambda: supabase_service.admin_client.table('chunks')
+                        .select('chunk_id')
+                        .eq('document_id', document['document_id'])
+                        .order('chunk_id'),
+                    page_size=page_size
+                )
+                await self.vector_index.update_metadata({chunk['chunk_id']: metadata for chunk in chunks})
+                updated += len(chunks)
+            
+            directory = os.path.dirname(marker)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(marker, "w") as file:
+                file.write(datetime.utcnow().isoformat())
+            logging.info(f"Backfilled filter metadata on {updated} vectors of {len(documents)} documents")
+        
+        except Exception as e:
+            logging.error(f"Error backfilling vector filter metadata: {str(e)}")
+            raise
+
+    def _create_vector_index(self) -> VectorIndex:
+        """Create the vector index backend selected in settings"""
+        backend = settings.VECTOR_STORE_BACKEND
+        if backend == "local":
+            logging.info(f"Using local vector index at {settings.LOCAL_VECTOR_STORE_PATH}")
+            return LocalVectorIndex(
+                settings.LOCAL_VECTOR_STORE_PATH,
+                ivf_min_vectors=settings.LOCAL_VECTOR_IVF_MIN_VECTORS,
+                nprobe=settings.LOCAL_VECTOR_NPROBE
+            )
+        if backend == "pinecone":
+            pc = PineconeClient(api_key=os.getenv('PINECONE_API_KEY'))
+            index_name = os.getenv('PINECONE_INDEX_NAME')
+            return PineconeVectorIndex(
+                pc.Index(index_name),
+                self.embeddings,
+                metric=settings.PINECONE_METRIC or None,
+                describe_index=lambda: pc.describe_index(index_name)
+            )
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+    async def _get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch the document fields that are copied into vector metadata"""
+        from src.services.supabase import supabase_service
+        
+        result = await supabase_service.admin_client.table('documents')\
+            .select('region, category, tags, publication_year')\
+            .eq('document_id', document_id)\
+            .execute()
+        return result.data[0] if result.data else None
+
+    def _build_metadata(
+        self, 
+        document_id: str, 
+        chunk: Dict[str, Any], 
+        document_metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build vector metadata for a chunk.
+        Carries every field the RAG context needs so retrieval can skip the
+        Supabase lookup, plus the document fields retrieval can be filtered on.
+        Pinecone rejects nulls and nested objects, so location_data is stored
+        as a JSON string (for every backend alike).
+        """
+        metadata = {
+            **(document_metadata or {}),
+            'chunk_id': chunk['chunk_id'],
+            'document_id': document_id,
+            'text': chunk['content'],
+            'page_number': chunk.get('page_number') or 0,
+            'section_title': chunk.get('section_title') or '',
+            'location_data': json.dumps(chunk.get('location_data') or {})
+        }
+        if chunk.get('chunk_index') is not None:
+            metadata['chunk_index'] = chunk['chunk_index']
+        return metadata
+
 # Singleton instance
 embedding_service = EmbeddingService()
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Bounded conversation history for prompts.
+Only the last few turns are fetched, with the columns the prompt needs. Older
+turns are folded into a rolling summary stored on the conversation, refreshed
+in the background after each reply, so prompt size stays flat as a
+conversation grows.
+"""
+
+from typing import Dict, List, Optional, Set
+from dataclasses import dataclass, field
+import asyncio
+import logging
+from langchain_openai import ChatOpenAI
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import StrOutputParser
+from .supabase import supabase_service
+from .conversation_service import conversation_service
+from ..core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+
+@dataclass
+class HistoryWindow:
+    """Summary of earlier turns plus the most recent messages, oldest first"""
+    summary: Optional[str] = None
+    messages: List[Dict] = field(default_factory=list)
+
+    def format(self, max_chars: int) -> str:
+        lines = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+        for msg in self.messages:
+            content = msg['content']
+            if len(content) > max_chars:
+                content = content[:max_chars] + " [...]"
+            lines.append(f"{'User' if msg['role'] == 'user' else 'Assistant'}: {content}")
+        return "\n".join(lines)
+
+class HistoryService:
+    def __init__(self):
+        self.supabase = supabase_service
+        self.cache = conversation_service.cache  # None when caching is disabled
+        self.window_messages = settings.HISTORY_MAX_TURNS * 2  # a turn is a question and its answer
+        self.message_max_chars = settings.HISTORY_MESSAGE_MAX_CHARS
+        self.summary_batch = settings.HISTORY_SUMMARY_BATCH
+        self.fold_limit = 40  # messages folded per refresh; long backlogs catch up over several replies
+        self.llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS,
+            api_key=settings.OPENAI_API_KEY
+        )
+        self.summary_prompt = ChatPromptTemplate.from_messages([
+            ("system", """You maintain a running summary of a conversation between a user and an AI assistant about renewable energy regulations.
+Update the summary with the new messages. Keep the user's goals, the regulations, documents and figures discussed, and any conclusions.
+Write at most one short paragraph. Return only the summary."""),
+            ("user", """Current summary:
+{summary}
+
+New messages:
+{messages}"""),
+        ])
+        self._refreshing: Set[str] = set()  # conversations with a summary refresh in flight
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get_window(self, conversation_id: str) -> HistoryWindow:
+        """
+        Fetch the stored summary and the last turns of a conversation.
+        Messages not yet folded into the summary stay in the window, so it holds
+        at most window_messages + summary_batch - 1 messages.
+        Served from the conversation cache when this instance holds the conversation.
+        """
+        try:
+            cached = self.cache.get_window(conversation_id) if self.cache else None
+            if cached:
+                return HistoryWindow(summary=cached.summary, messages=cached.messages)
+            
+            conversation, recent = await asyncio.gather(
+                self.supabase.admin_client.table('conversations')
+                    .select('summary, summary_message_index')
+                    .eq('conversation_id', conversation_id)
+                    .execute(),
+                self._get_recent_messages(conversation_id, self.window_messages + self.summary_batch - 1)
+            )
+            
+            row = conversation.data[0] if conversation.data else {}
+            summarized_up_to = row.get('summary_message_index')
+            if summarized_up_to is not None:
+                recent = [msg for msg in recent if msg['message_index'] > summarized_up_to]
+            if self.cache:
+                self.cache.set_window(conversation_id, row.get('summary'), summarized_up_to, recent)
+            return HistoryWindow(summary=row.get('summary'), messages=recent)
+        
+        except Exception as e:
+            logging.error(f"Error retrieving conversation history: {str(e)}")
+            raise
+
+    async def _get_recent_messages(self, conversation_id: str, limit: int) -> List[Dict]:
+        """The last messages of a conversation, oldest first, with only the columns prompts use"""
+        result = await self.supabase.admin_client.table('messages')\
+            .select('role, content, message_index')\
+            .eq('conversation_id', conversation_id)\
+            .order('message_index', desc=True)\
+            .limit(limit)\
+            .execute()
+        return list(reversed(result.data or []))
+
+    async def add_message(self, message: Dict) -> Dict:
+        """Insert a message and write it through to the conversation cache; returns the stored row"""
+        result = await self.supabase.admin_client.table('messages').insert(message).execute()
+        row = result.data[0] if result.data else {}
+        if self.cache:
+            stored = {**message, **row}
+            self.cache.add_message(message['conversation_id'], {
+                key: stored.get(key) for key in ('role', 'content', 'message_index', 'credits_used')
+            })
+        return row
+
+    def format(self, window: Optional[HistoryWindow]) -> str:
+        return window.format(self.message_max_chars) if window else ""
+
+    def schedule_summary_refresh(self, conversation_id: str, window: Optional[HistoryWindow]) -> None:
+        """
+        Refresh the summary in the background once a batch of messages has left the window.
+        window is the history used for the reply that was just saved, so the
+        conversation now holds two more unsummarised messages than it shows.
+        """
+        unsummarized = (len(window.messages) if window else 0) + 2
+        if unsummarized < self.window_messages + self.summary_batch or conversation_id in self._refreshing:
+            return
+        
+        self._refreshing.add(conversation_id)
+        task = asyncio.create_task(self.refresh_summary(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._refreshing.discard(conversation_id))
+
+    async def refresh_summary(self, conversation_id: str) -> None:
+        """Fold messages older than the window into the conversation summary"""
+        try:
+            conversation, recent = await asyncio.gather(
+                self.supabase.admin_client.table('conversations')
+                    .select('summary, summary_message_index')
+                    .eq('conversation_id', conversation_id)
+                    .execute(),
+                self._get_recent_messages(conversation_id, self.window_messages)
+            )
+            if not conversation.data or len(recent) < self.window_messages:
+                return
+            
+            summary = conversation.data[0].get('summary')
+            summarized_up_to = conversation.data[0].get('summary_message_index')
+            window_start = recent[0]['message_index']
+            
+            query = self.supabase.admin_client.table('messages')\
+                .select('role, content, message_index')\
+                .eq('conversation_id', conversation_id)\
+                .lt('message_index', window_start)
+            if summarized_up_to is not None:
+                query = query.gt('message_index', summarized_up_to)
+            result = await query.order('message_index', desc=False).limit(self.fold_limit).execute()
+            older = result.data or []
+            
+            # Summarise in batches so short conversations do not cost an LLM call per turn
+            if len(older) < self.summary_batch:
+                return
+            
+            chain = self.summary_prompt | self.llm | StrOutputParser()
+            summary = await chain.ainvoke({
+                "summary": summary or "(none)",
+                "messages": HistoryWindow(messages=older).format(self.message_max_chars)
+            })
+            
+            await self.supabase.admin_client.table('conversations')\
+                .update({
+                    'summary': summary.strip(),
+                    'summary_message_index': older[-1]['message_index']
+                })\
+                .eq('conversation_id', conversation_id)\
+                .execute()
+            if self.cache:
+                self.cache.set_summary(conversation_id, summary.strip(), older[-1]['message_index'])
+            logging.info(f"Folded {len(older)} messages into the summary of conversation {conversation_id}")
+        
+        except Exception as e:
+            # The previous summary stays valid; the next reply retries
+            logging.error(f"Error refreshing summary of conversation {conversation_id}: {str(e)}")
+
+# Singleton instance
+history_service = HistoryService()
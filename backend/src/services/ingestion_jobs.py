@@ -0,0 +1,232 @@
+"""
+Ingestion jobs submitted through the API.
+Each job has an ID clients can poll; its status and the timing and item count
+of every stage are kept in SQLite (or in memory with db_path ":memory:"), so
+jobs survive a restart and are re-queued if they were interrupted.
+JobProgress is what the document service reports stages to.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logging.basicConfig(level=logging.INFO)
+
+class IngestionJobStore:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                document_id TEXT,
+                file_path TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                stages TEXT NOT NULL DEFAULT '{}',
+                error TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                updated_at TEXT NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def _now(self) -> str:
+        return datetime.utcnow().isoformat()
+
+    def create(self, kind: str, document_id: Optional[str] = None, file_path: Optional[str] = None) -> Dict:
+        """
+        Queue a job and return it.
+        If the same work is already queued or running, that job is returned instead.
+        Jobs for a file_path match on the path alone, because a running create
+        job records its document_id once the document row exists.
+        """
+        with self._lock:
+            if file_path is not None:
+                row = self._find_active(file_path)
+            else:
+                row = self._db.execute(
+                    "SELECT * FROM ingestion_jobs WHERE kind = ? AND document_id IS ? AND file_path IS NULL "
+                    "AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                    (kind, document_id, self.QUEUED, self.RUNNING)
+                ).fetchone()
+            if row:
+                return self._to_dict(row)
+            
+            job_id = str(uuid.uuid4())
+            now = self._now()
+            self._db.execute(
+                """INSERT INTO ingestion_jobs (job_id, kind, document_id, file_path, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, kind, document_id, file_path, self.QUEUED, now, now)
+            )
+            self._db.commit()
+            row = self._db.execute("SELECT * FROM ingestion_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return self._to_dict(row)
+
+    def find_active(self, file_path: str) -> Optional[Dict]:
+        """Return the oldest queued or running job for file_path, or None"""
+        with self._lock:
+            row = self._find_active(file_path)
+            return self._to_dict(row) if row else None
+
+    def _find_active(self, file_path: str) -> Optional[sqlite3.Row]:
+        return self._db.execute(
+            "SELECT * FROM ingestion_jobs WHERE file_path = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+            (file_path, self.QUEUED, self.RUNNING)
+        ).fetchone()
+
+    def claim_next(self) -> Optional[Dict]:
+        """Atomically mark the oldest queued job as running and return it"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM ingestion_jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (self.QUEUED,)
+            ).fetchone()
+            if not row:
+                return None
+            
+            now = self._now()
+            self._db.execute(
+                "UPDATE ingestion_jobs SET status = ?, started_at = ?, updated_at = ? WHERE job_id = ?",
+                (self.RUNNING, now, now, row["job_id"])
+            )
+            self._db.commit()
+            return {**self._to_dict(row), "status": self.RUNNING, "started_at": now}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM ingestion_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def set_document_id(self, job_id: str, document_id: str) -> None:
+        self._update(job_id, document_id=document_id)
+
+    def update_progress(self, job_id: str, stage: Optional[str], stages: Dict[str, Dict]) -> None:
+        self._update(job_id, stage=stage, stages=json.dumps(stages))
+
+    def complete(self, job_id: str) -> None:
+        self._update(job_id, status=self.DONE, error=None, finished_at=self._now())
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._update(job_id, status=self.FAILED, error=error, finished_at=self._now())
+
+    def requeue_running(self) -> int:
+        """Re-queue every running job; used at startup when no worker can still own them"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE ingestion_jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (self.QUEUED, self._now(), self.RUNNING)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) AS n FROM ingestion_jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = self._now()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE ingestion_jobs SET {assignments} WHERE job_id = ?",
+                [*fields.values(), job_id]
+            )
+            self._db.commit()
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {**dict(row), "stages": json.loads(row["stages"])}
+
+class JobProgress:
+    """
+    Stage timing and item counts of one job.
+    Every change is saved to the job store; publish(document_id, stage, stages)
+    mirrors it to the document, at stage boundaries and at most every
+    publish_interval seconds in between. Without a store it does nothing, so
+    services can report stages whether or not they run as a job.
+    """
+
+    def __init__(
+        self,
+        store: Optional[IngestionJobStore] = None,
+        job_id: Optional[str] = None,
+        document_id: Optional[str] = None,
+        publish: Optional[Callable[[str, Optional[str], Dict[str, Dict]], Awaitable[None]]] = None,
+        publish_interval: float = 5.0
+    ):
+        self.store = store
+        self.job_id = job_id
+        self.document_id = document_id
+        self.publish = publish
+        self.publish_interval = publish_interval
+        self.stages: Dict[str, Dict] = {}
+        self.current: Optional[str] = None
+        self._published_at = 0.0
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Record the enclosed block as one stage; a stage that raises is marked failed"""
+        start = time.perf_counter()
+        self.current = name
+        self.stages[name] = {"status": "running", "started_at": datetime.utcnow().isoformat(), "items": 0}
+        await self._report(force=True)
+        
+        status = "failed"
+        try:
+            yield
+            status = "done"
+        finally:
+            self.stages[name].update(status=status, duration_ms=round((time.perf_counter() - start) * 1000))
+            await self._report(force=True)
+
+    async def advance(self, name: str, items: int) -> None:
+        """Count items finished within a stage, e.g. chunks embedded"""
+        if name in self.stages:
+            self.stages[name]["items"] += items
+            await self._report()
+
+    def set_document_id(self, document_id: str) -> None:
+        self.document_id = document_id
+        if self.store:
+            self.store.set_document_id(self.job_id, document_id)
+
+    async def _report(self, force: bool = False) -> None:
+        if self.store is None:
+            return
+        self.store.update_progress(self.job_id, self.current, self.stages)
+        
+        if not self.publish or not self.document_id:
+            return
+        if not force and time.monotonic() - self._published_at < self.publish_interval:
+            return
+        self._published_at = time.monotonic()
+        try:
+            await self.publish(self.document_id, self.current, self.stages)
+        except Exception as e:
+            # The job store keeps the full record; the copy on the document is best effort
+            logging.warning(f"Could not publish progress of job {self.job_id}: {str(e)}")
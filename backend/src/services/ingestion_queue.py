@@ -0,0 +1,134 @@
+"""
+Persistent queue of files waiting to be ingested.
+Backed by SQLite so queued and in-flight work survives a restart, and
+claims are atomic so overlapping sync runs never pick up the same file.
+"""
+
+from typing import Dict, Optional
+from datetime import datetime
+import logging
+import os
+import sqlite3
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+class IngestionQueue:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS ingestion_queue (
+                file_path TEXT PRIMARY KEY,
+                source_etag TEXT,
+                document_id TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                claimed_at TEXT,
+                updated_at TEXT NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    def _now(self) -> str:
+        return datetime.utcnow().isoformat()
+
+    def enqueue(self, file_path: str, source_etag: Optional[str], document_id: Optional[str] = None) -> bool:
+        """
+        Queue a file for ingestion.
+        Files already queued or running are left alone; returns whether the file was queued.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status FROM ingestion_queue WHERE file_path = ?", (file_path,)
+            ).fetchone()
+            if row and row["status"] in (self.QUEUED, self.RUNNING):
+                return False
+            
+            self._db.execute(
+                """INSERT INTO ingestion_queue (file_path, source_etag, document_id, status, attempts, error, claimed_at, updated_at)
+                VALUES (?, ?, ?, ?, 0, NULL, NULL, ?)
+                ON CONFLICT(file_path) DO UPDATE SET
+                    source_etag = excluded.source_etag,
+                    document_id = COALESCE(excluded.document_id, ingestion_queue.document_id),
+                    status = excluded.status, attempts = 0, error = NULL,
+                    claimed_at = NULL, updated_at = excluded.updated_at""",
+                (file_path, source_etag, document_id, self.QUEUED, self._now())
+            )
+            self._db.commit()
+            return True
+
+    def claim_next(self) -> Optional[Dict]:
+        """Atomically mark the oldest queued file as running and return it"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM ingestion_queue WHERE status = ? ORDER BY updated_at LIMIT 1",
+                (self.QUEUED,)
+            ).fetchone()
+            if not row:
+                return None
+            
+            now = self._now()
+            self._db.execute(
+                "UPDATE ingestion_queue SET status = ?, attempts = attempts + 1, claimed_at = ?, updated_at = ? "
+                "WHERE file_path = ?",
+                (self.RUNNING, now, now, row["file_path"])
+            )
+            self._db.commit()
+            return {**dict(row), "status": self.RUNNING, "attempts": row["attempts"] + 1}
+
+    def set_document_id(self, file_path: str, document_id: str) -> None:
+        """Remember the document created for a file so a retry does not create another"""
+        self._update(file_path, document_id=document_id)
+
+    def complete(self, file_path: str) -> None:
+        self._update(file_path, status=self.DONE, error=None)
+
+    def fail(self, file_path: str, error: str) -> None:
+        """Record a failure, re-queueing the file until it runs out of attempts"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT attempts FROM ingestion_queue WHERE file_path = ?", (file_path,)
+            ).fetchone()
+        status = self.QUEUED if row and row["attempts"] < self.max_attempts else self.FAILED
+        self._update(file_path, status=status, error=error)
+
+    def requeue_running(self) -> int:
+        """Re-queue every running file; used at startup when no worker can still own them"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE ingestion_queue SET status = ?, updated_at = ? WHERE status = ?",
+                (self.QUEUED, self._now(), self.RUNNING)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Number of files per status"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) AS n FROM ingestion_queue GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _update(self, file_path: str, **fields) -> None:
+        fields["updated_at"] = self._now()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE ingestion_queue SET {assignments} WHERE file_path = ?",
+                [*fields.values(), file_path]
+            )
+            self._db.commit()
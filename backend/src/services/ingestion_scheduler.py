@@ -0,0 +1,190 @@
+"""
+Ingestion scheduler that processes several documents concurrently.
+Discovers new and changed files in storage, persists them in the ingestion
+queue and drains the queue with a bounded pool of async workers. Documents
+submitted through the API run as jobs (see ingestion_jobs) on a second
+bounded pool, so requests return immediately. PDF parsing runs in the
+shared process pool; download and embedding stages are capped separately
+(see core.concurrency).
+"""
+
+from typing import Dict, Optional, Set
+import asyncio
+import logging
+from ..core.config import settings
+from .ingestion_queue import IngestionQueue
+from .ingestion_jobs import IngestionJobStore, JobProgress
+from .supabase import supabase_service
+
+logging.basicConfig(level=logging.INFO)
+
+class IngestionScheduler:
+    def __init__(self):
+        self.supabase = supabase_service
+        self.queue = IngestionQueue(
+            settings.INGESTION_QUEUE_PATH,
+            max_attempts=settings.INGEST_MAX_ATTEMPTS
+        )
+        self.concurrency = settings.INGEST_CONCURRENCY
+        self._run_lock: Optional[asyncio.Lock] = None
+        self._recovered = False
+        
+        self.jobs = IngestionJobStore(settings.INGESTION_JOBS_PATH)
+        self.job_workers = settings.INGEST_JOB_WORKERS
+        self._job_tasks: Set[asyncio.Task] = set()
+
+    async def run_sync(self) -> None:
+        """
+        Enqueue new and changed storage files, then drain the queue.
+        A run that starts while another is active returns immediately.
+        """
+        if self._run_lock is None:
+            self._run_lock = asyncio.Lock()
+        if self._run_lock.locked():
+            logging.info("Document sync already running, skipping this run")
+            return
+        
+        async with self._run_lock:
+            try:
+                logging.info("Starting document sync process")
+                
+                if not self._recovered:
+                    # Nothing can still be running from a previous process
+                    requeued = self.queue.requeue_running()
+                    if requeued:
+                        logging.info(f"Re-queued {requeued} documents interrupted by a restart")
+                    self._recovered = True
+                
+                await self._enqueue_pending_files()
+                await self._drain()
+                
+                logging.info(f"Document sync process completed: {self.queue.counts()}")
+            
+            except Exception as e:
+                logging.error(f"Error in document sync process: {str(e)}")
+                raise
+
+    async def _enqueue_pending_files(self) -> None:
+        """Queue files that are new in storage or were replaced under the same path"""
+        new_files, changed_documents = await self.supabase.find_documents_to_sync()
+        
+        queued = 0
+        for file_path, etag in new_files.items():
+            queued += self.queue.enqueue(file_path, etag)
+        for file_path, doc in changed_documents.items():
+            queued += self.queue.enqueue(file_path, doc['source_etag'], doc['document_id'])
+        
+        if queued:
+            logging.info(f"Queued {queued} documents for ingestion")
+        else:
+            logging.info("No new or changed documents to process")
+
+    async def _drain(self) -> None:
+        """Run workers until the queue is empty"""
+        workers = [
+            asyncio.create_task(self._worker(worker_id))
+            for worker_id in range(self.concurrency)
+        ]
+        await asyncio.gather(*workers)
+
+    async def _worker(self, worker_id: int) -> None:
+        """Claim and ingest queued files one at a time"""
+        while True:
+            item = self.queue.claim_next()
+            if item is None:
+                return
+            
+            file_path = item['file_path']
+            try:
+                logging.info(f"[worker {worker_id}] Processing document: {file_path} (attempt {item['attempts']})")
+                await self._ingest(item)
+                self.queue.complete(file_path)
+                logging.info(f"[worker {worker_id}] Successfully processed document: {file_path}")
+            
+            except Exception as e:
+                logging.error(f"[worker {worker_id}] Error processing document {file_path}: {str(e)}")
+                self.queue.fail(file_path, str(e))
+
+    async def _ingest(self, item: dict) -> None:
+        """Create the document record if needed, then chunk and embed it"""
+        from .document_service import document_service  # Import here to avoid circular imports
+        
+        document_id = item['document_id']
+        if not document_id:
+            doc = await document_service.create_document_from_upload(
+                item['file_path'],
+                source_etag=item['source_etag']
+            )
+            if not doc or not doc.get('document_id'):
+                raise ValueError(f"Failed to create document record for: {item['file_path']}")
+            document_id = doc['document_id']
+            self.queue.set_document_id(item['file_path'], document_id)
+        
+        await document_service.process_document(document_id)
+        if item['source_etag']:
+            await self.supabase.update_source_etag(document_id, item['source_etag'])
+
+    def submit(self, kind: str, document_id: Optional[str] = None, file_path: Optional[str] = None) -> Dict:
+        """
+        Queue an ingestion job and make sure workers are running to pick it up.
+        kind is "process" (chunk and embed document_id) or "create" (create the
+        document record for file_path). Returns the job; submitting work that is
+        already queued or running returns the existing job, and a file_path with
+        a queued or running job of any kind returns that job.
+        """
+        job = self.jobs.create(kind, document_id=document_id, file_path=file_path)
+        self._start_job_workers()
+        return job
+
+    async def resume_jobs(self) -> None:
+        """Re-queue jobs interrupted by a restart and start working on them; run at startup"""
+        requeued = self.jobs.requeue_running()
+        if requeued:
+            logging.info(f"Re-queued {requeued} ingestion jobs interrupted by a restart")
+        self._start_job_workers()
+
+    def _start_job_workers(self) -> None:
+        """Start workers up to the pool size while jobs are queued"""
+        while len(self._job_tasks) < min(self.job_workers, self.jobs.counts().get(IngestionJobStore.QUEUED, 0)):
+            task = asyncio.create_task(self._job_worker())
+            self._job_tasks.add(task)
+
+    async def _job_worker(self) -> None:
+        """Run queued jobs one at a time until none are left"""
+        task = asyncio.current_task()
+        while True:
+            job = self.jobs.claim_next()
+            if job is None:
+                # Leave the pool in the same step, so a job submitted now starts a new worker
+                self._job_tasks.discard(task)
+                return
+            
+            try:
+                logging.info(f"Running ingestion job {job['job_id']} ({job['kind']})")
+                await self._run_job(job)
+                self.jobs.complete(job['job_id'])
+                logging.info(f"Ingestion job {job['job_id']} completed")
+            
+            except Exception as e:
+                logging.error(f"Ingestion job {job['job_id']} failed: {str(e)}")
+                self.jobs.fail(job['job_id'], str(e))
+
+    async def _run_job(self, job: Dict) -> None:
+        from .document_service import document_service  # Import here to avoid circular imports
+        
+        progress = JobProgress(
+            self.jobs,
+            job['job_id'],
+            document_id=job['document_id'],
+            publish=document_service.update_processing_progress,
+            publish_interval=settings.INGEST_PROGRESS_INTERVAL
+        )
+        if job['kind'] == "process":
+            await document_service.process_document(job['document_id'], progress=progress)
+        elif job['kind'] == "create":
+            await document_service.create_document_from_upload(job['file_path'], progress=progress)
+        else:
+            raise ValueError(f"Unknown ingestion job kind: {job['kind']}")
+
+# Singleton instance
+ingestion_scheduler = IngestionScheduler()
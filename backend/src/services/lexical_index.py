@@ -0,0 +1,168 @@
+"""
+In-process BM25 index over chunk content.
+Complements dense retrieval for exact tokens such as "Article 15a", "RED III"
+or directive numbers like "2018/2001". Postings live in SQLite keyed by
+(term, chunk number), so the index stays compact on disk and is updated
+incrementally as chunks are embedded or deleted.
+"""
+
+from typing import List, Dict, Optional, Tuple, Iterable
+from collections import Counter, defaultdict
+import asyncio
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+# Words joined by "/", "." or "-" stay together ("2018/2001", "15a", "eu-ets")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+COMPOUND_SPLIT_PATTERN = re.compile(r"[./-]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were which with shall should may such any all not no".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; compounds are indexed whole and by their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if COMPOUND_SPLIT_PATTERN.search(token):
+            tokens.extend(part for part in COMPOUND_SPLIT_PATTERN.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+class LexicalIndex:
+    def __init__(self, db_path: str, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "chunk_no INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, document_id TEXT, length INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, chunk_no INTEGER NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_no)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_no);"
+        )
+        self._db.commit()
+        
+        # Corpus statistics for BM25, kept in memory
+        self._count, self._total_length = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks"
+        ).fetchone()
+
+    def __len__(self) -> int:
+        return self._count
+
+    async def add(self, chunks: List[Dict]) -> None:
+        await asyncio.to_thread(self.add_sync, chunks)
+
+    def add_sync(self, chunks: List[Dict]) -> None:
+        """Index chunks ({chunk_id, document_id, content}); re-adding a chunk replaces it"""
+        if not chunks:
+            return
+        
+        with self._lock:
+            self._remove([chunk['chunk_id'] for chunk in chunks])
+            for chunk in chunks:
+                terms = Counter(tokenize(chunk['content']))
+                length = sum(terms.values())
+                cursor = self._db.execute(
+                    "INSERT INTO chunks (chunk_id, document_id, length) VALUES (?, ?, ?)",
+                    (chunk['chunk_id'], chunk.get('document_id'), length)
+                )
+                self._db.executemany(
+                    "INSERT INTO postings (term, chunk_no, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in terms.items()]
+                )
+                self._count += 1
+                self._total_length += length
+            self._db.commit()
+
+    async def remove(self, chunk_ids: List[str]) -> None:
+        await asyncio.to_thread(self.remove_sync, chunk_ids)
+
+    def remove_sync(self, chunk_ids: List[str]) -> None:
+        with self._lock:
+            self._remove(chunk_ids)
+            self._db.commit()
+
+    def _remove(self, chunk_ids: Iterable[str]) -> None:
+        for chunk_id in chunk_ids:
+            row = self._db.execute("SELECT chunk_no, length FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            self._db.execute("DELETE FROM postings WHERE chunk_no = ?", (row[0],))
+            self._db.execute("DELETE FROM chunks WHERE chunk_no = ?", (row[0],))
+            self._count -= 1
+            self._total_length -= row[1]
+
+    async def search(self, query: str, k: int, document_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        return await asyncio.to_thread(self.search_sync, query, k, document_ids)
+
+    def search_sync(self, query: str, k: int, document_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (chunk_id, BM25 score) pairs, optionally restricted to some documents"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        
+        with self._lock:
+            if not self._count:
+                return []
+            average_length = self._total_length / self._count
+            
+            scores: Dict[int, float] = defaultdict(float)
+            for term in terms:
+                postings = self._db.execute(
+                    "SELECT p.chunk_no, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_no = p.chunk_no "
+                    "WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (self._count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_no, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[chunk_no] += idf * tf * (self.k1 + 1) / (tf + norm)
+            
+            if document_ids is not None:
+                allowed = set(document_ids)
+                rows = self._db.execute(
+                    f"SELECT chunk_no FROM chunks WHERE document_id IN ({','.join('?' * len(allowed))})",
+                    list(allowed)
+                ).fetchall() if allowed else []
+                permitted = {row[0] for row in rows}
+                scores = {chunk_no: score for chunk_no, score in scores.items() if chunk_no in permitted}
+            
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not top:
+                return []
+            chunk_ids = dict(self._db.execute(
+                f"SELECT chunk_no, chunk_id FROM chunks WHERE chunk_no IN ({','.join('?' * len(top))})",
+                [chunk_no for chunk_no, _ in top]
+            ).fetchall())
+        
+        return [(chunk_ids[chunk_no], score) for chunk_no, score in top]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
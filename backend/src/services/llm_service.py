@@ -3,14 +3,15 @@ LLM integration service handling prompt construction, LLM interactions,
 and response processing. Uses Langchain for enhanced LLM capabilities.
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator, List
 import logging
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import StrOutputParser
 from .supabase import supabase_service
 from ..core.config import settings
-from .conversation_service import conversation_service
+from .history_service import history_service, HistoryWindow
+from .context_builder import format_chunk
 
 logging.basicConfig(level=logging.INFO)
 
@@ -55,30 +56,14 @@ Context:
         self, 
         query: str, 
         context: Dict[str, Any],
-        conversation_id: Optional[str] = None
+        conversation_id: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
     ) -> Dict[str, Any]:
         """Generate a response using RAG context and conversation history"""
         try:
-            # Get conversation history if conversation_id provided
-            history = ""
-            if conversation_id:
-                messages = conversation_service.get_conversation_history(conversation_id)
-                if messages:
-                    history = "\n".join([
-                        f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
-                        for msg in messages
-                    ])
-            
-            # Format context
-            formatted_context = self._format_context(context)
-            
             # Generate response
             chain = self.rag_prompt | self.llm | self.output_parser
-            response = await chain.ainvoke({
-                "question": query,
-                "context": formatted_context,
-                "history": history
-            })
+            response = await chain.ainvoke(await self._build_inputs(query, context, conversation_id, history))
             
             return {
                 "response": response,
@@ -89,19 +74,49 @@ Context:
             logging.error(f"Error generating RAG response: {str(e)}")
             raise e
             
-    def _format_context(self, context: Dict[str, Any]) -> str:
-        """Format context chunks for the prompt"""
-        formatted_chunks = []
+    async def stream_rag_response(
+        self, 
+        query: str, 
+        context: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
+    ) -> AsyncIterator[str]:
+        """Generate a response like generate_rag_response, yielding text deltas as they arrive"""
+        try:
+            chain = self.rag_prompt | self.llm | self.output_parser
+            async for delta in chain.astream(await self._build_inputs(query, context, conversation_id, history)):
+                if delta:
+                    yield delta
+                    
+        except Exception as e:
+            logging.error(f"Error streaming RAG response: {str(e)}")
+            raise e
+            
+    async def _build_inputs(
+        self, 
+        query: str, 
+        context: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        history: Optional[HistoryWindow] = None
+    ) -> Dict[str, str]:
+        """
+        Assemble prompt inputs from the question, RAG context and conversation history.
+        History (summary plus recent turns) is fetched by conversation_id unless
+        the caller already has it.
+        """
+        # Get conversation history if conversation_id provided
+        if history is None and conversation_id:
+            history = await history_service.get_window(conversation_id)
         
-        for chunk in context["chunks"]:
-            formatted_chunks.append(
-                f"[Chunk {chunk['index']}]\n"
-                f"Page: {chunk['source']['page_number']}\n"
-                f"Section: {chunk['source']['section_title'] or 'N/A'}\n"
-                f"Content:\n{chunk['content']}\n"
-            )
+        return {
+            "question": query,
+            "context": self._format_context(context),
+            "history": history_service.format(history)
+        }
             
-        return "\n\n".join(formatted_chunks)
+    def _format_context(self, context: Dict[str, Any]) -> str:
+        """Format context chunks for the prompt"""
+        return "\n\n".join(format_chunk(chunk) for chunk in context["chunks"])
 
 # Singleton instance
 llm_service = LLMService()
@@ -0,0 +1,18 @@
+"""
+Paged reads from PostgREST, which caps a single select at 1000 rows.
+"""
+
+from typing import Any, Callable, Dict, List
+
+async def fetch_all(query: Callable[[], Any], page_size: int = 1000) -> List[Dict]:
+    """
+    Fetch every row of a select, one range request at a time until a short page.
+    query returns a fresh builder with a stable order, e.g. .order('chunk_id').
+    """
+    rows: List[Dict] = []
+    while True:
+        result = await query().range(len(rows), len(rows) + page_size - 1).execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
@@ -1,6 +1,12 @@
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator, Awaitable, Callable, Optional
 from src.services.pdf_processing_service import PDFProcessingService
 from src.services.supabase import supabase_service
+from src.core.config import settings
+from src.models.document_pydantic import ProcessingStatus
+from src.core.concurrency import stage_limit
+from src.services.pagination import fetch_all
+import asyncio
+import hashlib
 import tempfile
 import os
 import logging
@@ -8,76 +14,277 @@ from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
 
+def content_hash(data) -> str:
+    """SHA-256 hex digest of file bytes or chunk text"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
 class PDFBatchProcessor:
     def __init__(self):
         self.pdf_processor = PDFProcessingService()
         self.supabase = supabase_service
-        
-    async def process_pdf_to_chunks(self, document: Dict) -> None:
-        """Process a specific document into chunks"""
+        self.insert_batch_size = settings.CHUNK_INSERT_BATCH_SIZE
+        self.max_retries = settings.CHUNK_INSERT_MAX_RETRIES
+        self.read_page_size = 1000  # PostgREST's default max rows per select
+
+    async def process_pdf_to_chunks(
+        self,
+        document: Dict,
+        on_moved: Optional[Callable[[List[Dict]], Awaitable[None]]] = None
+    ) -> Dict:
+        """
+        Process a specific document into chunks, reusing chunks whose content is unchanged.
+        on_moved is awaited with reused chunks that already have vectors but moved
+        (new page, index or location), before their new position is saved, so the
+        vector metadata can follow.
+        Returns the chunking plan:
+            unchanged: True if the file matches the last completed ingest
+            content_hash: hash of the downloaded file
+            batches: async iterator of saved chunk rows that still need embeddings,
+                     produced page by page while the PDF is parsed
+            removed_ids: chunk IDs that no longer exist in the document; filled in
+                         once batches has been fully consumed
+        """
+        document_id = document['document_id']
+        temp_path = None
         try:
-            logging.info(f"Starting to process document {document['document_id']}")
-            await self._process_document(document)
-            logging.info(f"Successfully processed document {document['document_id']} into chunks")
-                
+            logging.info(f"Starting to process document {document_id}")
+            
+            # Stream the file to disk, hashing it on the way
+            fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+            os.close(fd)
+            async with stage_limit("download"):
+                file_hash = await self.supabase.download_to_file(document['file_path'], temp_path)
+            
+            # Skip parsing entirely if this exact file was already ingested
+            if (file_hash == document.get('content_hash')
+                    and document.get('processing_status') == ProcessingStatus.COMPLETED):
+                logging.info(f"Document {document_id} is unchanged, skipping")
+                self._remove_temp_file(temp_path)
+                return {"unchanged": True, "content_hash": file_hash, "batches": None, "removed_ids": []}
+            
+            plan = {"unchanged": False, "content_hash": file_hash, "removed_ids": []}
+            plan["batches"] = self._stream_chunks(document_id, temp_path, plan, on_moved)
+            return plan
+            
         except Exception as e:
-            logging.error(f"Error processing document {document['document_id']} into chunks: {str(e)}")
+            if temp_path:
+                self._remove_temp_file(temp_path)
+            logging.error(f"Error processing document {document_id} into chunks: {str(e)}")
             raise
 
-    async def _process_document(self, document: Dict):
-        """Process single document and save chunks"""
-        temp_file = None
+    async def _stream_chunks(
+        self,
+        document_id: str,
+        file_path: str,
+        plan: Dict,
+        on_moved: Optional[Callable[[List[Dict]], Awaitable[None]]] = None
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Parse the PDF page by page and diff its chunks against those already stored
+        by content hash. Unchanged chunks keep their chunk_id (and vector), new chunks
+        are inserted in bulk batches and yielded for embedding straight away, and
+        stored chunks missing from the new version are reported as removed. Chunks
+        stored but never embedded (e.g. by an interrupted run) are reused and yielded
+        too, so a failed ingest resumes cleanly.
+        """
         try:
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-            file_data = await self.supabase.download_file(document['file_path'])
-            temp_file.write(file_data)
-            temp_file.flush()
-            temp_file.close()
+            # Pool existing rows by content hash; duplicates are matched in order
+            existing_by_hash: Dict[str, List[Dict]] = {}
+            for row in await self._get_existing_chunks(document_id):
+                existing_by_hash.setdefault(row['content_hash'], []).append(row)
             
-            # Process PDF and get chunks
-            processed = await self.pdf_processor.process_pdf(temp_file.name)
+            to_insert: List[Dict] = []
+            to_update: List[Dict] = []
+            to_refresh: List[Dict] = []  # moved rows whose vectors carry the old position
+            to_embed: List[Dict] = []
+            legacy_ids: List[str] = []
+            counts = {"chunks": 0, "new": 0, "moved": 0}
             
-            # Save chunks
-            await self._save_chunks(document['document_id'], processed['chunks'])
+            async for _, page_chunks in self.pdf_processor.iter_pages(file_path):
+                for chunk in page_chunks:
+                    counts["chunks"] += 1
+                    row = self._chunk_to_row(document_id, chunk)
+                    matches = existing_by_hash.get(row['content_hash'])
+                    if not matches:
+                        to_insert.append(row)
+                        continue
+                    
+                    existing = matches.pop(0)
+                    row['chunk_id'] = existing['chunk_id']
+                    if existing.get('legacy'):
+                        # Rows written before hashing was introduced were always embedded
+                        legacy_ids.append(existing['chunk_id'])
+                        to_update.append(row)
+                        if self._position_changed(existing, row):
+                            to_refresh.append(row)
+                    elif self._position_changed(existing, row):
+                        to_update.append(row)
+                        if existing.get('embedded_at'):
+                            to_refresh.append(row)
+                    if not existing.get('legacy') and not existing.get('embedded_at'):
+                        to_embed.append(row)
+                
+                if len(to_update) >= self.insert_batch_size:
+                    counts["moved"] += len(to_update)
+                    await self._flush_updates(to_update, legacy_ids, to_refresh, on_moved)
+                    to_update, legacy_ids, to_refresh = [], [], []
+                
+                while len(to_insert) >= self.insert_batch_size:
+                    batch, to_insert = to_insert[:self.insert_batch_size], to_insert[self.insert_batch_size:]
+                    counts["new"] += len(batch)
+                    yield await self._insert_rows(batch) + to_embed
+                    to_embed = []
+            
+            counts["moved"] += len(to_update)
+            await self._flush_updates(to_update, legacy_ids, to_refresh, on_moved)
+            counts["new"] += len(to_insert)
+            remaining = (await self._insert_rows(to_insert) if to_insert else []) + to_embed
+            if remaining:
+                yield remaining
+            
+            plan["removed_ids"] = [
+                row['chunk_id']
+                for rows in existing_by_hash.values()
+                for row in rows
+            ]
             
+            logging.info(
+                f"Successfully processed document {document_id} into {counts['chunks']} chunks: "
+                f"{counts['new']} new, {counts['moved']} moved, {len(plan['removed_ids'])} removed"
+            )
+            
+        except Exception as e:
+            logging.error(f"Error processing document {document_id} into chunks: {str(e)}")
+            raise
         finally:
-            if temp_file:
-                try:
-                    os.unlink(temp_file.name)
-                except Exception as e:
-                    logging.warning(f"Failed to cleanup temporary file: {str(e)}")
+            self._remove_temp_file(file_path)
 
-    async def _save_chunks(self, document_id: str, chunks: List) -> List[str]:
-        """Save chunks to database and return chunk IDs"""
-        chunk_ids = []
-        total_chunks = len(chunks)
-        logging.info(f"Saving {total_chunks} chunks for document {document_id}")
+    async def _insert_rows(self, rows: List[Dict]) -> List[Dict]:
+        """Insert new chunk rows and attach their generated chunk IDs"""
+        inserted = await self._write_batch(rows)
         
-        for i, chunk in enumerate(chunks, 1):
-            chunk_data = {
-                'document_id': document_id,
-                'content': chunk.content,
-                'page_number': chunk.page_number,
-                'section_title': chunk.section_title,
-                'chunk_index': chunk.chunk_index,
-                'start_offset': chunk.start_offset,
-                'end_offset': chunk.end_offset,
-                'category': chunk.category,
-                'location_data': chunk.location_data,
-                'element_type': chunk.element_type,
-                'font_info': chunk.font_info,
-                'context': chunk.context
-            }
-            result = self.supabase.admin_client.table('chunks')\
-                .insert(chunk_data)\
-                .execute()
-            chunk_ids.append(result.data[0]['chunk_id'])
-            
-            if i % 10 == 0:  # Log progress every 10 chunks
-                logging.info(f"Saved {i}/{total_chunks} chunks")
+        # PostgREST returns inserted rows in request order
+        for row, saved in zip(rows, inserted):
+            row['chunk_id'] = saved['chunk_id']
+        return rows
+
+    async def _flush_updates(
+        self,
+        rows: List[Dict],
+        legacy_ids: List[str],
+        moved: List[Dict],
+        on_moved: Optional[Callable[[List[Dict]], Awaitable[None]]] = None
+    ) -> None:
+        """
+        Refresh position data of reused chunks (legacy rows also get their hash).
+        Vectors of moved chunks are updated first: if the run stops in between,
+        the stored rows still show the old position and the next run retries.
+        """
+        if moved and on_moved:
+            await on_moved(moved)
+        if rows:
+            await self._write_batch(rows, upsert=True)
+        if legacy_ids:
+            await self.mark_embedded(legacy_ids)
+
+    def _remove_temp_file(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Failed to cleanup temporary file: {str(e)}")
+
+    async def _get_existing_chunks(self, document_id: str) -> List[Dict]:
+        """
+        Get stored chunks of a document with the fields needed for diffing.
+        Content is only fetched for legacy rows without a stored hash.
+        Both reads are paged, since a large document has more chunks than one select returns.
+        """
+        rows = await fetch_all(
+            lambda: self.supabase.admin_client.table('chunks')
+                .select('chunk_id, content_hash, page_number, chunk_index, start_offset, end_offset, embedded_at')
+                .eq('document_id', document_id)
+                .order('chunk_id'),
+            page_size=self.read_page_size
+        )
+        
+        if any(not row.get('content_hash') for row in rows):
+            legacy = await fetch_all(
+                lambda: self.supabase.admin_client.table('chunks')
+                    .select('chunk_id, content')
+                    .eq('document_id', document_id)
+                    .is_('content_hash', 'null')
+                    .order('chunk_id'),
+                page_size=self.read_page_size
+            )
+            legacy_hashes = {row['chunk_id']: content_hash(row['content']) for row in legacy}
+            for row in rows:
+                if not row.get('content_hash'):
+                    row['content_hash'] = legacy_hashes.get(row['chunk_id'])
+                    row['legacy'] = True
         
-        logging.info(f"Successfully saved all {total_chunks} chunks for document {document_id}")
-        return chunk_ids
+        return rows
+
+    def _position_changed(self, existing: Dict, row: Dict) -> bool:
+        """Check whether a reused chunk moved within the document"""
+        return any(
+            existing.get(field) != row[field]
+            for field in ('page_number', 'chunk_index', 'start_offset', 'end_offset')
+        )
+
+    async def _write_batch(self, rows: List[Dict], upsert: bool = False) -> List[Dict]:
+        """Insert (or upsert) a batch of chunk rows, retrying with exponential backoff"""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                table = self.supabase.admin_client.table('chunks')
+                query = table.upsert(rows) if upsert else table.insert(rows)
+                result = await query.execute()
+                return result.data
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error(f"Chunk batch write failed after {attempt} attempts: {str(e)}")
+                    raise
+                delay = 2 ** (attempt - 1)
+                logging.warning(f"Chunk batch write failed (attempt {attempt}), retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+    async def mark_embedded(self, chunk_ids: List[str]) -> None:
+        """Record that chunks have vectors in the vector store"""
+        now = datetime.utcnow().isoformat()
+        for start in range(0, len(chunk_ids), self.insert_batch_size):
+            await self.supabase.admin_client.table('chunks')\
+                .update({'embedded_at': now})\
+                .in_('chunk_id', chunk_ids[start:start + self.insert_batch_size])\
+                .execute()
+
+    async def delete_chunks(self, chunk_ids: List[str]) -> None:
+        """Delete chunk rows that no longer exist in the document"""
+        for start in range(0, len(chunk_ids), self.insert_batch_size):
+            await self.supabase.admin_client.table('chunks')\
+                .delete()\
+                .in_('chunk_id', chunk_ids[start:start + self.insert_batch_size])\
+                .execute()
+
+    def _chunk_to_row(self, document_id: str, chunk) -> Dict:
+        """Convert a DocumentChunk into a chunks table row"""
+        return {
+            'document_id': document_id,
+            'content': chunk.content,
+            'content_hash': content_hash(chunk.content),
+            'page_number': chunk.page_number,
+            'section_title': chunk.section_title,
+            'chunk_index': chunk.chunk_index,
+            'start_offset': chunk.start_offset,
+            'end_offset': chunk.end_offset,
+            'category': chunk.category,
+            'location_data': chunk.location_data,
+            'element_type': chunk.element_type,
+            'font_info': chunk.font_info,
+            'context': chunk.context
+        }
 
 # Singleton instance
 pdf_batch_processor = PDFBatchProcessor()
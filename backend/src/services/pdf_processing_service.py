@@ -2,11 +2,16 @@
 Service for processing PDF documents with semantic chunking and detailed location tracking
 """
 
-from typing import List, Dict
+from typing import List, Dict, Tuple, AsyncIterator
+from collections import deque
 from langchain_community.document_loaders import UnstructuredPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from ..models.document_pydantic import DocumentChunk
+from ..core.concurrency import get_process_pool, stage_limit
+from ..core.config import settings
+from .pdf_text_index import PageTextIndex
+import asyncio
 import fitz  # PyMuPDF
 import re
 import logging
@@ -14,114 +19,217 @@ from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
 
+# Compiled once; chunking runs these on every page
+EN_HEADER_PATTERN = re.compile(r'(?m)^EN\s*$')
+EXTRA_NEWLINES_PATTERN = re.compile(r'\n{3,}')
+EXTRA_SPACES_PATTERN = re.compile(r' {2,}')
+NUMBERED_SPLIT_PATTERN = re.compile(r'(?=\([0-9]+\)\s*)')
+NUMBERED_START_PATTERN = re.compile(r'^\([0-9]+\)\s*')
+NUMBERED_PARTS_PATTERN = re.compile(r'(\([0-9]+\)\s*)(.*)', re.DOTALL)
+LIST_ITEM_PATTERN = re.compile(r'^\d+\.\s')
+
+# Chunk offsets index into the cleaned text of all pages joined by this separator
+PAGE_SEPARATOR = '\f'
+
 class PDFProcessingService:
     def __init__(self, max_chunk_size: int = 1000):
         self.max_chunk_size = max_chunk_size
+        self.pages_per_task = settings.PDF_PAGES_PER_TASK
+        self.max_ranges_in_flight = settings.PDF_PARSE_WORKERS * 2
         
     async def process_pdf(self, file_path: str) -> Dict:
-        """Process PDF file and extract text chunks"""
+        """
+        Process PDF file and extract text chunks.
+        Parsing is CPU-bound, so it runs in the shared process pool to keep the event loop free.
+        """
+        chunks = []
+        async for _, page_chunks in self.iter_pages(file_path):
+            chunks.extend(page_chunks)
+        logging.info(f"Successfully processed PDF. Generated {len(chunks)} chunks.")
+        return {"chunks": chunks}
+
+    async def iter_pages(self, file_path: str) -> AsyncIterator[Tuple[int, List[DocumentChunk]]]:
+        """
+        Parse a PDF in the process pool and yield (page_number, chunks) in page order.
+        Large documents are split into page ranges parsed in parallel; pages are
+        yielded as soon as their range finishes, with a bounded number of ranges
+        in flight so memory stays flat on very long documents. Chunk offsets are
+        document-global (see PAGE_SEPARATOR).
+        Each range holds a parse slot only while it is parsed, never while the
+        caller works on the pages yielded.
+        """
+        pending = deque()
         try:
             logging.info(f"Starting PDF processing for file: {file_path}")
-            doc = fitz.open(file_path)
-            chunks = []
+            page_count = await asyncio.to_thread(_count_pages, file_path)
+            
+            ranges = [
+                (start, min(start + self.pages_per_task, page_count))
+                for start in range(0, page_count, self.pages_per_task)
+            ]
+            next_range = 0
+            page_base = 0
+            
+            while next_range < len(ranges) or pending:
+                # Keep the pool busy without parsing arbitrarily far ahead
+                while next_range < len(ranges) and len(pending) < self.max_ranges_in_flight:
+                    start, end = ranges[next_range]
+                    pending.append(asyncio.create_task(self._parse_range(file_path, start, end)))
+                    next_range += 1
+                
+                for page_number, page_chunks, text_length in await pending.popleft():
+                    self._shift_offsets(page_chunks, page_base)
+                    page_base += text_length + len(PAGE_SEPARATOR)
+                    yield page_number, page_chunks
             
-            for page_num in range(len(doc)):
+        except Exception as e:
+            logging.error(f"Error processing PDF: {str(e)}")
+            raise
+        finally:
+            # Stop ranges nobody will consume, e.g. when the caller closes the iterator early
+            for task in pending:
+                task.cancel()
+
+    async def _parse_range(self, file_path: str, start: int, end: int) -> List[Tuple[int, List[DocumentChunk], int]]:
+        """Parse pages [start, end) in the process pool while holding a parse slot"""
+        async with stage_limit("parse"):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                get_process_pool(), parse_pdf_pages, file_path, start, end, self.max_chunk_size
+            )
+
+    def process_pages_sync(self, file_path: str, start: int, end: int) -> List[Tuple[int, List[DocumentChunk], int]]:
+        """
+        Parse pages [start, end) of a PDF in the calling process.
+        Returns (page_number, chunks, cleaned text length) per page; chunk offsets are page-local.
+        """
+        doc = fitz.open(file_path)
+        try:
+            pages = []
+            for page_num in range(start, end):
                 page = doc[page_num]
                 text = page.get_text("text")
                 cleaned_text = self._clean_page_text(text)
                 
+                page_chunks = []
                 if cleaned_text.strip():
                     page_chunks = self._create_semantic_chunks(cleaned_text, page_num + 1, page, doc.name)
-                    chunks.extend(page_chunks)
-                    
+                pages.append((page_num + 1, page_chunks, len(cleaned_text)))
+            return pages
+        finally:
             doc.close()
-            logging.info(f"Successfully processed PDF. Generated {len(chunks)} chunks.")
-            return {"chunks": chunks}
-            
-        except Exception as e:
-            logging.error(f"Error processing PDF: {str(e)}")
-            raise
+
+    def process_pdf_sync(self, file_path: str) -> Dict:
+        """Process PDF file and extract text chunks in the calling process"""
+        chunks = []
+        page_base = 0
+        for _, page_chunks, text_length in self.process_pages_sync(file_path, 0, _count_pages(file_path)):
+            self._shift_offsets(page_chunks, page_base)
+            page_base += text_length + len(PAGE_SEPARATOR)
+            chunks.extend(page_chunks)
+        return {"chunks": chunks}
+
+    def _shift_offsets(self, chunks: List[DocumentChunk], page_base: int) -> None:
+        """Turn page-local chunk offsets into document-global offsets"""
+        for chunk in chunks:
+            chunk.start_offset += page_base
+            chunk.end_offset += page_base
 
     def _clean_page_text(self, text: str) -> str:
         """Clean page text by removing redundant headers/footers and unnecessary whitespace"""
         # Remove common headers/footers
-        text = re.sub(r'(?m)^EN\s*$', '', text)  # Remove standalone "EN"
-        text = re.sub(r'\f', '', text)  # Remove form feeds
+        text = EN_HEADER_PATTERN.sub('', text)  # Remove standalone "EN"
+        text = text.replace('\f', '')  # Remove form feeds
         
         # Remove redundant whitespace while preserving paragraph breaks
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        text = re.sub(r' {2,}', ' ', text)
+        text = EXTRA_NEWLINES_PATTERN.sub('\n\n', text)
+        text = EXTRA_SPACES_PATTERN.sub(' ', text)
         
         return text.strip()
 
-    def _split_into_sections(self, text: str) -> List[str]:
-        """Split text into semantic sections with improved granularity"""
-        sections = []
+    def _split_into_sections(self, text: str) -> List[Tuple[str, int, int]]:
+        """
+        Split text into semantic sections with improved granularity.
+        Returns (content, start, end) per section, where start/end are the
+        character offsets of the section within text, found in a single pass.
+        """
+        sections = []  # [content parts, start, end]
+        position = 0
         
         # First split on numbered points
-        numbered_pattern = r'(?=\([0-9]+\)\s*)'
-        numbered_sections = re.split(numbered_pattern, text)
-        
-        for section in numbered_sections:
-            if not section.strip():
+        for section in NUMBERED_SPLIT_PATTERN.split(text):
+            section_start = position
+            position += len(section)
+            
+            stripped = section.strip()
+            if not stripped:
                 continue
+            start = section_start + len(section) - len(section.lstrip())
+            end = start + len(stripped)
                 
             # If this is a numbered point, it's likely a semantic unit
-            if re.match(r'^\([0-9]+\)\s*', section):
+            if NUMBERED_START_PATTERN.match(section):
                 # Check if section is too long
                 if len(section) > self.max_chunk_size:
                     # Try to split on natural breaks while preserving the number
-                    number_match = re.match(r'(\([0-9]+\)\s*)(.*)', section, re.DOTALL)
+                    number_match = NUMBERED_PARTS_PATTERN.match(section)
                     if number_match:
                         number, content = number_match.groups()
                         subsections = content.split('\n\n')
                         # Add number back to first subsection
-                        if subsections:
-                            subsections[0] = number + subsections[0]
-                            sections.extend([s.strip() for s in subsections if s.strip()])
+                        subsections[0] = number + subsections[0]
+                        offset = section_start
+                        for subsection in subsections:
+                            sub_stripped = subsection.strip()
+                            if sub_stripped:
+                                sub_start = offset + len(subsection) - len(subsection.lstrip())
+                                sections.append([[sub_stripped], sub_start, sub_start + len(sub_stripped)])
+                            offset += len(subsection) + 2  # the '\n\n' separator
                         continue
                 
-                sections.append(section.strip())
+                sections.append([[stripped], start, end])
             else:
                 # For non-numbered text, check if it's a standalone section
                 if len(section.split()) > 10:  # If section has substantial content
-                    sections.append(section.strip())
+                    sections.append([[stripped], start, end])
                 elif sections:  # Combine short sections with previous content
-                    sections[-1] = sections[-1] + "\n" + section.strip()
+                    sections[-1][0].append(stripped)
+                    sections[-1][2] = end
                 else:  # First section
-                    sections.append(section.strip())
+                    sections.append([[stripped], start, end])
         
-        return sections
+        return [("\n".join(parts), start, end) for parts, start, end in sections]
 
     def _create_semantic_chunks(self, text: str, page_num: int, page: fitz.Page, file_path: str) -> List[DocumentChunk]:
-        """Create semantic chunks from text while preserving context"""
+        """
+        Create semantic chunks from text while preserving context.
+        Offsets are relative to the cleaned page text; callers shift them to document offsets.
+        """
         chunks = []
-        sections = self._split_into_sections(text)
+        spans = self._split_into_sections(text)
+        sections = [section for section, _, _ in spans]
+        text_index = PageTextIndex.from_page(page)
         
-        for i, section in enumerate(sections):
+        for i, (section, start_offset, end_offset) in enumerate(spans):
             # Extract section title
             section_title = ""
-            if re.match(r'^\([0-9]+\)\s*', section):
+            if NUMBERED_START_PATTERN.match(section):
                 first_line = section.split('\n')[0]
                 section_title = first_line[:100]
             elif section.isupper():
                 section_title = section.split('\n')[0]
             
-            # Get location data
-            text_instances = page.search_for(section[:100].strip())
+            # Get location data: overall bbox plus one rect per line the section spans
+            location = text_index.locate(section)
             location_data = {}
-            if text_instances:
-                rect = text_instances[0]
+            if location:
+                first_rect = location["rects"][0]
                 location_data = {
-                    "bbox": {
-                        "x0": rect.x0,
-                        "y0": rect.y0,
-                        "x1": rect.x1,
-                        "y1": rect.y1
-                    },
+                    "bbox": location["bbox"],
+                    "rects": location["rects"],
                     "pdf_coordinates": {
                         "page": page_num,
-                        "position": [rect.x0, rect.y0]
+                        "position": [first_rect["x0"], first_rect["y0"]]
                     }
                 }
             
@@ -132,10 +240,6 @@ class PDFProcessingService:
             prev_context = sections[i-1][-200:] if i > 0 else None
             next_context = sections[i+1][:200] if i < len(sections)-1 else None
             
-            # Calculate proper offsets
-            start_offset = sum(len(s) for s in sections[:i])
-            end_offset = start_offset + len(section)
-            
             chunk = DocumentChunk(
                 content=section.strip(),
                 page_number=page_num,
@@ -161,14 +265,22 @@ class PDFProcessingService:
         """Determine chunk category based on content analysis"""
         if title and title.isupper():
             return "Title"
-        elif re.match(r'^\([0-9]+\)', text):
+        elif NUMBERED_START_PATTERN.match(text):
             return "Numbered Section"
-        elif len(text.split('\n')) > 3:
+        elif text.count('\n') > 2:
             return "Text"
-        elif re.match(r'^\d+\.\s', text):
+        elif LIST_ITEM_PATTERN.match(text):
             return "List Item"
         else:
             return "Other"
 
+def _count_pages(file_path: str) -> int:
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+def parse_pdf_pages(file_path: str, start: int, end: int, max_chunk_size: int) -> List[Tuple[int, List[DocumentChunk], int]]:
+    """Process-pool entry point: parse a range of PDF pages into chunks"""
+    return PDFProcessingService(max_chunk_size).process_pages_sync(file_path, start, end)
+
 # Singleton instance
 pdf_processing_service = PDFProcessingService()
\ No newline at end of file
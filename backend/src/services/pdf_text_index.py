@@ -0,0 +1,89 @@
+"""
+Single-pass word index over a PDF page for locating chunk text.
+Maps character offsets of the page's whitespace-normalized text to word
+rectangles, so a chunk's bounding boxes come from an offset lookup instead
+of a full-page text search per chunk.
+"""
+
+from typing import List, Dict, Optional, Tuple
+from bisect import bisect_right
+
+# (x0, y0, x1, y1, text, block_no, line_no, word_no) as returned by page.get_text("words")
+Word = Tuple[float, float, float, float, str, int, int, int]
+
+class PageTextIndex:
+    def __init__(self, words: List[Word], prefix_tokens: int = 8):
+        self.words = words
+        self.prefix_tokens = prefix_tokens
+        self._cursor = 0
+        
+        # Join word texts with single spaces, remembering where each word starts
+        self._starts: List[int] = []
+        parts = []
+        offset = 0
+        for word in words:
+            self._starts.append(offset)
+            parts.append(word[4])
+            offset += len(word[4]) + 1
+        self.text = " ".join(parts)
+
+    @classmethod
+    def from_page(cls, page) -> "PageTextIndex":
+        """Build the index from a PyMuPDF page with one text extraction"""
+        return cls(page.get_text("words", sort=False))
+
+    def locate(self, text: str) -> Optional[Dict]:
+        """
+        Find the page rectangles covered by text.
+        Sections are located in reading order, so the search resumes after the
+        previous match. Returns None if the text cannot be found on the page.
+        """
+        tokens = text.split()
+        if not tokens:
+            return None
+        
+        span = self._find(" ".join(tokens))
+        if span is None and len(tokens) > self.prefix_tokens:
+            # Fall back to the opening words when the body differs (e.g. removed headers)
+            prefix_span = self._find(" ".join(tokens[:self.prefix_tokens]))
+            if prefix_span is not None:
+                span = (prefix_span[0], min(len(self.text), prefix_span[0] + len(" ".join(tokens))))
+        if span is None:
+            return None
+        
+        start, end = span
+        first = bisect_right(self._starts, start) - 1
+        last = bisect_right(self._starts, max(start, end - 1)) - 1
+        self._cursor = end
+        return self._rects(self.words[first:last + 1])
+
+    def _find(self, needle: str) -> Optional[Tuple[int, int]]:
+        position = self.text.find(needle, self._cursor)
+        if position < 0:
+            position = self.text.find(needle)
+        if position < 0:
+            return None
+        return position, position + len(needle)
+
+    def _rects(self, words: List[Word]) -> Dict:
+        """Merge word boxes into one rectangle per text line plus their overall bounding box"""
+        lines: Dict[Tuple[int, int], List[float]] = {}
+        for x0, y0, x1, y1, _, block_no, line_no, _ in words:
+            rect = lines.get((block_no, line_no))
+            if rect is None:
+                lines[(block_no, line_no)] = [x0, y0, x1, y1]
+            else:
+                rect[0], rect[1] = min(rect[0], x0), min(rect[1], y0)
+                rect[2], rect[3] = max(rect[2], x1), max(rect[3], y1)
+        
+        rects = [
+            {"x0": x0, "y0": y0, "x1": x1, "y1": y1}
+            for x0, y0, x1, y1 in lines.values()
+        ]
+        bbox = {
+            "x0": min(rect["x0"] for rect in rects),
+            "y0": min(rect["y0"] for rect in rects),
+            "x1": max(rect["x1"] for rect in rects),
+            "y1": max(rect["y1"] for rect in rects)
+        }
+        return {"bbox": bbox, "rects": rects}
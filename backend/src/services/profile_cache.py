@@ -0,0 +1,75 @@
+"""
+In-process cache of user profile lookups by email.
+Holds the user_id and credit balance of recently seen users, and remembers
+unknown emails for a shorter time. Balances are kept current by the credit
+service and entries are dropped when credit transactions change them;
+everything expires after a TTL and the least recently used entries are evicted.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import threading
+import time
+
+class ProfileCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300, negative_ttl_seconds: float = 30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Optional[Dict], float]]" = OrderedDict()  # email -> (profile, expires_at)
+        self._emails: Dict[str, str] = {}  # user_id -> email
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email: str) -> Tuple[bool, Optional[Dict]]:
+        """(found, profile); a found None means the email is known not to exist"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(email)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            return True, dict(entry[0]) if entry[0] is not None else None
+
+    def set(self, email: str, profile: Optional[Dict]) -> None:
+        with self._lock:
+            self._remove(email)
+            ttl = self.ttl_seconds if profile is not None else self.negative_ttl_seconds
+            self._entries[email] = (dict(profile) if profile is not None else None, time.monotonic() + ttl)
+            if profile is not None:
+                self._emails[profile['user_id']] = email
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def adjust_credits(self, user_id: str, delta: int) -> None:
+        """Apply a balance change made elsewhere to the cached profile, if any"""
+        with self._lock:
+            entry = self._entries.get(self._emails.get(user_id))
+            if entry is not None and entry[0] is not None:
+                entry[0]['credits'] += delta
+
+    def invalidate(self, email: Optional[str] = None, user_id: Optional[str] = None) -> None:
+        with self._lock:
+            if user_id is not None:
+                email = self._emails.get(user_id, email)
+            if email is not None:
+                self._remove(email)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "profiles": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def _remove(self, email: str) -> None:
+        entry = self._entries.pop(email, None)
+        if entry is not None and entry[0] is not None:
+            self._emails.pop(entry[0]['user_id'], None)
@@ -0,0 +1,64 @@
+"""
+Resolves users from their email for chat requests and payment webhooks.
+Lookups are cached in process (see profile_cache), so repeat requests from
+the same user do not query user_profiles again.
+"""
+
+from typing import Dict, Optional
+import logging
+from .supabase import supabase_service
+from .profile_cache import ProfileCache
+from ..core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+
+class ProfileService:
+    def __init__(self):
+        self.supabase = supabase_service
+        
+        # None disables caching
+        self.cache = ProfileCache(
+            max_entries=settings.PROFILE_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.PROFILE_CACHE_TTL,
+            negative_ttl_seconds=settings.PROFILE_CACHE_NEGATIVE_TTL
+        ) if settings.PROFILE_CACHE_ENABLED else None
+
+    async def get_profile(self, email: str, fresh: bool = False) -> Optional[Dict]:
+        """
+        user_id and credits of the user with this email, or None if there is none.
+        fresh skips the cached entry, for writes such as crediting a purchase where a
+        remembered miss would reject a user who signed up since; the result is still cached.
+        """
+        try:
+            if self.cache and not fresh:
+                found, profile = self.cache.get(email)
+                if found:
+                    return profile
+            
+            result = await self.supabase.admin_client.from_('user_profiles')\
+                .select('user_id, credits')\
+                .eq('email', email)\
+                .limit(1)\
+                .execute()
+            profile = result.data[0] if result.data else None
+            
+            if self.cache:
+                self.cache.set(email, profile)
+            return profile
+        
+        except Exception as e:
+            logging.error(f"Error retrieving user profile: {str(e)}")
+            raise
+
+    def adjust_credits(self, user_id: str, delta: int) -> None:
+        """Mirror a balance change already written to Supabase"""
+        if self.cache:
+            self.cache.adjust_credits(user_id, delta)
+
+    def invalidate(self, email: Optional[str] = None, user_id: Optional[str] = None) -> None:
+        """Drop a cached profile, e.g. after a credit transaction changed its balance"""
+        if self.cache:
+            self.cache.invalidate(email=email, user_id=user_id)
+
+# Singleton instance
+profile_service = ProfileService()
@@ -6,32 +6,64 @@ RAG (Retrieval Augmented Generation) service that handles:
 - Response generation with citations
 """
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import asyncio
+import json
 import logging
 from langchain_core.documents import Document
 from .embedding_service import embedding_service
 from .supabase import supabase_service
+from .answer_cache import AnswerCache
+from .lexical_index import reciprocal_rank_fusion
+from .context_builder import ContextBuilder
+from .relevance import adaptive_cutoff
+from .reranker import Reranker, LexicalOverlapScorer, CrossEncoderScorer
+from .retrieval_filters import build_vector_filter, has_metadata_filters, normalize_tags
+from .pagination import fetch_all
+from ..models.chat_pydantic import RetrievalFilters
+from ..core.config import settings
 
 logging.basicConfig(level=logging.INFO)
 
 class RAGService:
     def __init__(self):
         self.embedding_service = embedding_service
-        self.vector_store = embedding_service.vector_store
+        self.vector_index = embedding_service.vector_index
+        self.lexical_index = embedding_service.lexical_index
         self.supabase = supabase_service
         
         # Configuration parameters
         self.max_chunks = 10  # Maximum chunks to retrieve
-        self.similarity_threshold = 0.7  # Minimum similarity score
+        self.similarity_threshold = 0.7  # Minimum similarity score (normalised across index metrics)
+        self.score_margin = settings.RETRIEVAL_SCORE_MARGIN  # Max distance below the top score
+        self.knee_gap = settings.RETRIEVAL_KNEE_GAP  # Score drop that ends the hit list
+        self.hydrate_from_metadata = True  # Skip Supabase lookup when vector metadata is complete
+        self.hybrid_candidates = settings.HYBRID_CANDIDATES  # Candidates per retriever before fusion
+        self.context_builder = ContextBuilder(
+            max_tokens=settings.CONTEXT_MAX_TOKENS,
+            duplicate_threshold=settings.CONTEXT_DUPLICATE_THRESHOLD
+        )
+        self.reranker = self._create_reranker()  # None when reranking is disabled
         
-    async def process_query(self, query: str) -> Dict[str, Any]:
+        # Answers reused for near-identical questions over the same chunks
+        self.answer_cache = AnswerCache(
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL,
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY
+        ) if settings.ANSWER_CACHE_ENABLED else None
+
+    async def process_query(self, query: str, filters: Optional[RetrievalFilters] = None) -> Dict[str, Any]:
         """
         Process a user query through the RAG pipeline
         Returns relevant chunks with their metadata and similarity scores
+        filters restrict retrieval to chunks of matching documents
         """
         try:
+            # Embed the query once; the embedding also keys the answer cache
+            query_embedding = await self.embedding_service.embeddings.aembed_query(query)
+            
             # Get relevant chunks from vector store
-            relevant_docs = await self._retrieve_relevant_chunks(query)
+            relevant_docs = await self._retrieve_relevant_chunks(query, query_embedding, filters)
             
             # Assemble context with metadata
             context = self._assemble_context(relevant_docs)
@@ -39,54 +71,198 @@ class RAGService:
             return {
                 "query": query,
                 "context": context,
-                "total_chunks": len(relevant_docs)
+                "total_chunks": len(relevant_docs),
+                "query_embedding": query_embedding
             }
-            
+        
         except Exception as e:
             logging.error(f"Error processing RAG query: {str(e)}")
             raise
 
-    async def _retrieve_relevant_chunks(self, query: str) -> List[Dict]:
+    async def _retrieve_relevant_chunks(
+        self, 
+        query: str, 
+        query_embedding: Optional[List[float]] = None,
+        filters: Optional[RetrievalFilters] = None
+    ) -> List[Dict]:
         """
-        Retrieve relevant chunks from vector store based on query similarity
+        Retrieve relevant chunks from vector store based on query similarity.
+        With hybrid search, BM25 hits are fused with the vector hits by
+        reciprocal rank fusion, so exact matches on terms like "Article 15a"
+        reach the context even when their embedding similarity is low.
+        Filters are applied inside the index query rather than to its results.
+        With reranking, more candidates are fetched and the reranker picks max_chunks.
+        Vector hits below the similarity threshold are dropped up front; the
+        adaptive cut (margin and knee) runs on the final reranked list.
         """
         try:
-            # Use vector store's similarity search
-            docs_with_scores = await self.vector_store.asimilarity_search_with_score(
-                query,
-                k=self.max_chunks
+            # Use vector store's similarity search, alongside the lexical index
+            if query_embedding is None:
+                query_embedding = await self.embedding_service.embeddings.aembed_query(query)
+            fetch_k = self.reranker.candidates if self.reranker else self.max_chunks
+            vector_k = max(fetch_k, self.hybrid_candidates) if self.lexical_index is not None else fetch_k
+            docs_with_scores, lexical_hits = await asyncio.gather(
+                self.vector_index.search(query_embedding, k=vector_k, filter=build_vector_filter(filters)),
+                self._lexical_search(query, filters) if self.lexical_index is not None else asyncio.sleep(0, [])
             )
             
-            # Filter and format results
+            # Only the similarity floor applies before fusion, so every candidate above
+            # it reaches the reranker; the relative cut is made on the final ranking
+            docs_with_scores = sorted(docs_with_scores, key=lambda hit: hit[1], reverse=True)
+            hits = [(doc, score) for doc, score in docs_with_scores if score >= self.similarity_threshold]
+            similarity_scores = {doc.metadata['chunk_id']: score for doc, score in hits}
+            
+            if lexical_hits:
+                ranked = reciprocal_rank_fusion([
+                    [doc.metadata['chunk_id'] for doc, _ in hits],
+                    [chunk_id for chunk_id, _ in lexical_hits]
+                ])[:fetch_k]
+            else:
+                ranked = [(doc.metadata['chunk_id'], score) for doc, score in hits][:fetch_k]
+            
+            # Build chunks straight from vector metadata where possible
+            chunks_by_id = {}
+            for doc, _ in hits:
+                chunk_data = self._chunk_from_metadata(doc) if self.hydrate_from_metadata else None
+                if chunk_data:
+                    chunks_by_id[doc.metadata['chunk_id']] = chunk_data
+            
+            # Hydrate the rest (incl. lexical-only hits) with a single batched Supabase lookup
+            missing_ids = [chunk_id for chunk_id, _ in ranked if chunk_id not in chunks_by_id]
+            if missing_ids:
+                chunks_by_id.update(await self._get_chunks_data(missing_ids))
+            
             relevant_chunks = []
-            for doc, score in docs_with_scores:
-                if score >= self.similarity_threshold:
-                    # Get full chunk data from Supabase
-                    chunk_data = self._get_chunk_data(doc.metadata['chunk_id'])
-                    if chunk_data:
-                        relevant_chunks.append({
-                            "chunk": chunk_data,
-                            "similarity_score": score
-                        })
+            for chunk_id, retrieval_score in ranked:
+                chunk_data = chunks_by_id.get(chunk_id)
+                if chunk_data:
+                    relevant_chunks.append({
+                        "chunk": chunk_data,
+                        "similarity_score": similarity_scores.get(chunk_id),  # None for lexical-only hits
+                        "retrieval_score": retrieval_score
+                    })
             
-            return relevant_chunks
+            reranked = False
+            if self.reranker:
+                relevant_chunks = await self.reranker.rerank(query, relevant_chunks, self.max_chunks)
+                reranked = all(hit.get("reranked") for hit in relevant_chunks)
             
+            # Keep the hits that stand out: near the top score and before the largest drop.
+            # Rerank and similarity scores are on a [0, 1] relevance scale; fused ranks
+            # (also kept when reranking times out) are not, so they are only capped
+            if reranked or not lexical_hits:
+                relevant_chunks = relevant_chunks[:adaptive_cutoff(
+                    [hit["retrieval_score"] for hit in relevant_chunks],
+                    min_score=0.0,
+                    margin=self.score_margin,
+                    knee_gap=self.knee_gap
+                )]
+            
+            return relevant_chunks
+        
         except Exception as e:
             logging.error(f"Error retrieving relevant chunks: {str(e)}")
             raise
 
-    def _get_chunk_data(self, chunk_id: str) -> Dict:
+    def _create_reranker(self) -> Optional[Reranker]:
+        """Create the second-stage reranker selected in settings"""
+        if not settings.RERANK_ENABLED:
+            return None
+        if settings.RERANK_BACKEND == "cross-encoder":
+            scorer = CrossEncoderScorer(settings.RERANK_MODEL)
+        elif settings.RERANK_BACKEND == "lexical":
+            scorer = LexicalOverlapScorer()
+        else:
+            raise ValueError(f"Unknown reranker backend: {settings.RERANK_BACKEND}")
+        return Reranker(
+            scorer,
+            candidates=settings.RERANK_CANDIDATES,
+            timeout_ms=settings.RERANK_TIMEOUT_MS,
+            batch_size=settings.RERANK_BATCH_SIZE,
+            cache_size=settings.RERANK_CACHE_SIZE
+        )
+
+    async def _lexical_search(self, query: str, filters: Optional[RetrievalFilters] = None) -> List:
+        """BM25 search, limited to the documents that match the filters"""
+        document_ids = filters.document_ids if filters else None
+        if has_metadata_filters(filters):
+            document_ids = await self._get_filtered_document_ids(filters)
+        if document_ids is not None and not document_ids:
+            return []
+        return await self.lexical_index.search(query, k=self.hybrid_candidates, document_ids=document_ids)
+
+    async def _get_filtered_document_ids(self, filters: RetrievalFilters) -> List[str]:
         """
-        Retrieve full chunk data from Supabase
+        Look up the IDs of documents matching the filters.
+        Tags are compared here rather than in the query, since Postgres array
+        overlap is case-sensitive and the vector side matches them lowercased.
         """
         try:
-            result = self.supabase.admin_client.table('chunks')\
-                .select('*')\
-                .eq('chunk_id', chunk_id)\
-                .execute()
+            def documents_query():
+                query = self.supabase.admin_client.table('documents').select('document_id, tags')
+                if filters.region:
+                    query = query.ilike('region', filters.region.strip())
+                if filters.category:
+                    query = query.ilike('category', filters.category.strip())
+                if filters.year is not None:
+                    query = query.eq('publication_year', str(filters.year))
+                if filters.year_from is not None:
+                    query = query.gte('publication_year', str(filters.year_from))
+                if filters.year_to is not None:
+                    query = query.lte('publication_year', str(filters.year_to))
+                if filters.document_ids is not None:
+                    query = query.in_('document_id', filters.document_ids)
+                return query.order('document_id')
             
-            return result.data[0] if result.data else None
+            rows = await fetch_all(documents_query)
+            if filters.tags:
+                wanted = set(normalize_tags(filters.tags))
+                rows = [row for row in rows if wanted.intersection(normalize_tags(row.get('tags')))]
+            return [row['document_id'] for row in rows]
+        
+        except Exception as e:
+            logging.error(f"Error resolving retrieval filters: {str(e)}")
+            raise
+
+    def _chunk_from_metadata(self, doc: Document) -> Optional[Dict]:
+        """
+        Build chunk data from vector metadata alone.
+        Returns None if the metadata lacks any field needed by _assemble_context
+        """
+        metadata = doc.metadata
+        if not all(key in metadata for key in ('document_id', 'page_number', 'location_data')):
+            return None
+        
+        try:
+            location_data = metadata['location_data']
+            if isinstance(location_data, str):
+                location_data = json.loads(location_data) if location_data else {}
+        except ValueError:
+            return None
+        
+        return {
+            "chunk_id": metadata['chunk_id'],
+            "document_id": metadata['document_id'],
+            "content": doc.page_content,
+            "page_number": int(metadata['page_number'] or 0) or None,
+            "section_title": metadata.get('section_title') or None,
+            "location_data": location_data,
+            "chunk_index": int(metadata['chunk_index']) if metadata.get('chunk_index') is not None else None
+        }
+
+    async def _get_chunks_data(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Retrieve full chunk data for several chunks from Supabase in one request
+        Returns a mapping of chunk_id to chunk data
+        """
+        try:
+            result = await self.supabase.admin_client.table('chunks')\
+                .select('chunk_id, document_id, content, page_number, section_title, location_data, chunk_index')\
+                .in_('chunk_id', chunk_ids)\
+                .execute()
             
+            return {chunk['chunk_id']: chunk for chunk in result.data or []}
+        
         except Exception as e:
             logging.error(f"Error retrieving chunk data: {str(e)}")
             raise
@@ -94,34 +270,12 @@ class RAGService:
     def _assemble_context(self, relevant_chunks: List[Dict]) -> Dict:
         """
         Assemble retrieved chunks into an array-based context format
-        Each chunk maintains its content and detailed source information
+        Each chunk maintains its content and detailed source information;
+        duplicates are dropped, neighbours merged and the whole fits the token budget
         """
         try:
-            # Sort chunks by similarity score
-            sorted_chunks = sorted(
-                relevant_chunks,
-                key=lambda x: x['similarity_score'],
-                reverse=True
-            )
-            
-            # Create array-based context with detailed source tracking
-            context = {
-                "chunks": [{
-                    "index": i,  # Add index for easy reference
-                    "content": chunk['chunk']['content'],
-                    "source": {
-                        "chunk_id": chunk['chunk']['chunk_id'],
-                        "document_id": chunk['chunk']['document_id'],
-                        "page_number": chunk['chunk']['page_number'],
-                        "section_title": chunk['chunk']['section_title'],
-                        "location_data": chunk['chunk']['location_data'],
-                        "similarity_score": chunk['similarity_score']
-                    }
-                } for i, chunk in enumerate(sorted_chunks)]
-            }
-            
-            return context
-            
+            return self.context_builder.build(relevant_chunks)
+        
         except Exception as e:
             logging.error(f"Error assembling context: {str(e)}")
             raise
@@ -0,0 +1,45 @@
+"""
+Relevance scores on one scale for every vector backend.
+Indexes report cosine similarity, dot product or (squared) euclidean distance
+depending on their metric; scores are mapped to a cosine-equivalent similarity
+in [0, 1] so one threshold means the same thing everywhere. An adaptive cutoff
+then keeps only the hits that stand out from the rest.
+"""
+
+from typing import List
+
+def normalize_score(score: float, metric: str) -> float:
+    """
+    Map a raw index score to a similarity in [0, 1], higher is better.
+    OpenAI embeddings are unit length, so dot product equals cosine similarity
+    and a squared euclidean distance d relates to it as cos = 1 - d / 2.
+    """
+    metric = metric.lower()
+    if metric in ("cosine", "dotproduct"):
+        similarity = score
+    elif metric == "euclidean":
+        similarity = 1 - score / 2
+    else:
+        raise ValueError(f"Unsupported vector metric: {metric}")
+    return min(1.0, max(0.0, similarity))
+
+def adaptive_cutoff(
+    scores: List[float],
+    min_score: float,
+    margin: float,
+    knee_gap: float,
+    min_keep: int = 1
+) -> int:
+    """
+    Number of leading hits to keep from scores sorted best first.
+    Hits must reach min_score and lie within margin of the top score; if the
+    largest drop between consecutive kept scores is at least knee_gap, the list
+    is cut there, so a confident match is not diluted by weaker ones.
+    """
+    keep = sum(1 for score in scores if score >= max(min_score, scores[0] - margin)) if scores else 0
+    if keep <= min_keep:
+        return keep
+
+    gaps = [(scores[i - 1] - scores[i], i) for i in range(min_keep, keep)]
+    gap, position = max(gaps, key=lambda item: item[0])
+    return position if gap >= knee_gap else keep
@@ -0,0 +1,142 @@
+"""
+Second-stage reranking of retrieved chunks.
+Retrieval over-fetches candidates cheaply; the reranker scores each
+(query, chunk) pair on CPU in batches and only the best few reach the LLM.
+Scores are cached per query and chunk, and scoring that overruns its latency
+budget is abandoned in favour of the first-stage order.
+"""
+
+from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from .lexical_index import tokenize, TOKEN_PATTERN, STOPWORDS
+
+logging.basicConfig(level=logging.INFO)
+
+class RerankTimeout(Exception):
+    """Raised when scoring runs past the reranker's latency budget"""
+
+class LexicalOverlapScorer:
+    """
+    Scores how much of the query a chunk covers: the weighted share of query
+    terms it contains (identifiers like "2018/2001" count double) plus the
+    share of query word pairs it contains in order.
+    """
+    name = "lexical"
+
+    def score_batch(self, query: str, texts: List[str]) -> List[float]:
+        terms = set(tokenize(query))
+        if not terms:
+            return [0.0] * len(texts)
+        weights = {term: 2.0 if any(char.isdigit() for char in term) else 1.0 for term in terms}
+        total_weight = sum(weights.values())
+        query_pairs = self._pairs(query)
+        
+        scores = []
+        for text in texts:
+            text_terms = set(tokenize(text))
+            coverage = sum(weight for term, weight in weights.items() if term in text_terms) / total_weight
+            proximity = len(query_pairs & self._pairs(text)) / len(query_pairs) if query_pairs else 0.0
+            scores.append(0.8 * coverage + 0.2 * proximity)
+        return scores
+
+    def _pairs(self, text: str) -> set:
+        words = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+        return set(zip(words, words[1:]))
+
+class CrossEncoderScorer:
+    """Scores pairs with a local sentence-transformers cross-encoder (optional dependency)"""
+
+    def __init__(self, model_name: str):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("RERANK_BACKEND=cross-encoder requires the sentence-transformers package") from e
+        self.name = model_name
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score_batch(self, query: str, texts: List[str]) -> List[float]:
+        logits = self.model.predict([(query, text) for text in texts], show_progress_bar=False)
+        return [1 / (1 + math.exp(-float(logit))) for logit in logits]
+
+class Reranker:
+    def __init__(
+        self,
+        scorer,
+        candidates: int = 50,
+        timeout_ms: float = 150,
+        batch_size: int = 16,
+        cache_size: int = 10000,
+        first_stage_weight: float = 0.3
+    ):
+        self.scorer = scorer
+        self.candidates = candidates  # hits fetched by the first stage
+        self.timeout = timeout_ms / 1000
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.first_stage_weight = first_stage_weight  # share of the final score kept from first-stage rank
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def rerank(self, query: str, hits: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Reorder hits ({chunk, similarity_score, retrieval_score}, best first) and
+        return the top_k. retrieval_score is replaced by the blended rerank score
+        and the hit is marked "reranked". Falls back to the incoming hits, unmarked
+        and with their first-stage scores, if scoring exceeds the latency budget.
+        """
+        if len(hits) <= 1:
+            return hits[:top_k]
+        
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        try:
+            scores = await asyncio.wait_for(
+                asyncio.to_thread(self._score, query, hits, deadline),
+                timeout=self.timeout
+            )
+        except (RerankTimeout, asyncio.TimeoutError):
+            logging.warning(f"Reranking {len(hits)} chunks exceeded {self.timeout * 1000:.0f}ms, keeping first-stage order")
+            return hits[:top_k]
+        
+        reranked = []
+        for rank, (hit, score) in enumerate(zip(hits, scores)):
+            first_stage = 1 - rank / len(hits)
+            blended = self.first_stage_weight * first_stage + (1 - self.first_stage_weight) * score
+            reranked.append({**hit, "retrieval_score": blended, "reranked": True})
+        reranked.sort(key=lambda hit: hit["retrieval_score"], reverse=True)
+        
+        logging.info(f"Reranked {len(hits)} chunks with {self.scorer.name} in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return reranked[:top_k]
+
+    def _score(self, query: str, hits: List[Dict], deadline: float) -> List[float]:
+        """Score hits in batches, reusing cached scores; raises RerankTimeout past the deadline"""
+        query_key = hashlib.sha256(query.strip().lower().encode()).hexdigest()
+        keys = [(query_key, hit["chunk"]["chunk_id"]) for hit in hits]
+        
+        with self._lock:
+            scores: List[Optional[float]] = [self._cache.get(key) for key in keys]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        
+        for start in range(0, len(pending), self.batch_size):
+            if time.perf_counter() > deadline:
+                raise RerankTimeout()
+            batch = pending[start:start + self.batch_size]
+            batch_scores = self.scorer.score_batch(query, [hits[i]["chunk"]["content"] for i in batch])
+            with self._lock:
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = score
+                    self._cache[keys[i]] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+        return scores
@@ -0,0 +1,67 @@
+"""
+Metadata filters for retrieval.
+Document fields (region, category, tags, publication year) are copied onto
+every chunk vector so a scoped question is answered by a filtered index query
+instead of searching the whole corpus and discarding hits afterwards.
+"""
+
+from typing import Any, Dict, List, Optional
+from ..models.chat_pydantic import RetrievalFilters
+
+def document_filter_metadata(document: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Filterable document fields in the form stored on vectors: region and
+    category lowercased, tags as a lowercased string list and publication_year
+    as an int. Missing fields are left out, since Pinecone rejects nulls.
+    """
+    if not document:
+        return {}
+
+    metadata = {}
+    for field in ('region', 'category'):
+        if document.get(field):
+            metadata[field] = str(document[field]).strip().lower()
+    tags = normalize_tags(document.get('tags'))
+    if tags:
+        metadata['tags'] = tags
+    try:
+        metadata['publication_year'] = int(document['publication_year'])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return metadata
+
+def normalize_tags(tags: Optional[List[Any]]) -> List[str]:
+    """Tags as stored on vectors and compared with filters: stripped, lowercased, blanks dropped"""
+    return [str(tag).strip().lower() for tag in tags or [] if str(tag).strip()]
+
+def build_vector_filter(filters: Optional[RetrievalFilters]) -> Optional[Dict[str, Any]]:
+    """Translate retrieval filters into a Pinecone-style metadata filter (None when unscoped)"""
+    if filters is None:
+        return None
+
+    conditions: Dict[str, Any] = {}
+    if filters.region:
+        conditions['region'] = {'$eq': filters.region.strip().lower()}
+    if filters.category:
+        conditions['category'] = {'$eq': filters.category.strip().lower()}
+    if filters.tags:
+        conditions['tags'] = {'$in': normalize_tags(filters.tags)}
+
+    year = {}
+    if filters.year is not None:
+        year['$eq'] = filters.year
+    if filters.year_from is not None:
+        year['$gte'] = filters.year_from
+    if filters.year_to is not None:
+        year['$lte'] = filters.year_to
+    if year:
+        conditions['publication_year'] = year
+
+    if filters.document_ids is not None:
+        conditions['document_id'] = {'$in': filters.document_ids}
+
+    return conditions or None
+
+def has_metadata_filters(filters: Optional[RetrievalFilters]) -> bool:
+    """Whether the filters constrain anything beyond an explicit list of documents"""
+    return any(field != 'document_id' for field in build_vector_filter(filters) or {})
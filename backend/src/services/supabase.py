@@ -1,45 +1,212 @@
 """
 Supabase client configuration and core operations for both database
 and storage interactions. Handles connection management and basic CRUD operations.
+
+All requests go through async clients sharing one pooled HTTP transport, so
+database and storage calls never block the event loop and reuse keep-alive
+connections across requests.
 """
 
-from supabase import create_client, Client
+from supabase import AsyncClient
+from postgrest import AsyncPostgrestClient
+from storage3 import AsyncStorageClient
 from ..core.config import settings
+import asyncio
+import hashlib
+import httpx
 import logging
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Tuple, Optional
 from ..models.document_pydantic import ProcessingStatus
+from .pagination import fetch_all
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """
+    Retry idempotent requests on transport errors and gateway failures.
+    Connection failures are retried for every method by the wrapped transport,
+    since no request was sent yet.
+    """
+    RETRY_STATUSES = {502, 503, 504}
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, retries: int, backoff: float = 0.25):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        retryable = request.method in self.IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if not retryable or attempt >= self.retries:
+                    raise
+                logging.warning(f"Supabase request failed ({type(e).__name__}), retrying: {request.url.path}")
+            else:
+                if not retryable or attempt >= self.retries or response.status_code not in self.RETRY_STATUSES:
+                    return response
+                await response.aclose()
+                logging.warning(f"Supabase returned {response.status_code}, retrying: {request.url.path}")
+            
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+class PooledAsyncClient(AsyncClient):
+    """Async Supabase client whose PostgREST and storage sessions share a transport"""
+
+    def __init__(self, supabase_url: str, supabase_key: str, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        super().__init__(supabase_url, supabase_key)
+
+    @property
+    def postgrest(self) -> AsyncPostgrestClient:
+        if self._postgrest is None:
+            self._postgrest = AsyncPostgrestClient(
+                self.rest_url,
+                headers=self.options.headers,
+                schema=self.options.schema
+            )
+            self._postgrest.session = self._session(self.rest_url, self._postgrest.session.headers)
+        return self._postgrest
+
+    @property
+    def storage(self) -> AsyncStorageClient:
+        if self._storage is None:
+            self._storage = AsyncStorageClient(self.storage_url, self.options.headers)
+            self._storage.session = self._session(self.storage_url, self._storage.session.headers)
+            self._storage._client = self._storage.session
+        return self._storage
+
+    def _session(self, base_url: str, headers: httpx.Headers) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=supabase_timeout(),
+            transport=self._transport,
+            follow_redirects=True
+        )
+
+def supabase_timeout() -> httpx.Timeout:
+    return httpx.Timeout(settings.SUPABASE_TIMEOUT, connect=settings.SUPABASE_CONNECT_TIMEOUT)
 
 class SupabaseService:
     def __init__(self):
-        self.client: Client = create_client(
-            settings.SUPABASE_URL,
-            settings.SUPABASE_KEY
-        )
-        # For admin operations (like managing storage)
-        self.admin_client: Client = create_client(
-            settings.SUPABASE_URL,
-            settings.SUPABASE_SERVICE_KEY
-        )
         self.bucket_name = settings.STORAGE_BUCKET
+        
+        # Built on first use. Connections are bound to the event loop that opens
+        # them, so a pool built outside a loop is adopted by the first loop using it
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._transport: Optional[RetryTransport] = None
+        self._client: Optional[PooledAsyncClient] = None
+        self._admin_client: Optional[PooledAsyncClient] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> PooledAsyncClient:
+        self._ensure_pool()
+        return self._client
+
+    @property
+    def admin_client(self) -> PooledAsyncClient:
+        """Client with the service key, for admin operations (like managing storage)"""
+        self._ensure_pool()
+        return self._admin_client
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """Plain HTTP client on the shared pool, e.g. for signed URLs"""
+        self._ensure_pool()
+        return self._http
+
+    def _ensure_pool(self) -> None:
+        """
+        Create the pooled clients, or rebuild them for a different event loop.
+        Works without a running loop too (e.g. in scripts building queries up front).
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        
+        if self._transport is not None:
+            if self._loop is loop or loop is None:
+                return
+            if self._loop is None:
+                # Built outside a loop and not used yet, so no connection is bound elsewhere
+                self._loop = loop
+                return
+        
+        self._transport = RetryTransport(
+            httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=settings.SUPABASE_RETRIES,
+                limits=httpx.Limits(
+                    max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SUPABASE_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.SUPABASE_KEEPALIVE_EXPIRY
+                )
+            ),
+            retries=settings.SUPABASE_RETRIES
+        )
+        self._client = PooledAsyncClient(settings.SUPABASE_URL, settings.SUPABASE_KEY, self._transport)
+        self._admin_client = PooledAsyncClient(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY, self._transport)
+        self._http = httpx.AsyncClient(timeout=supabase_timeout(), transport=self._transport)
+        self._loop = loop
+        logging.info(f"Opened Supabase connection pool (max {settings.SUPABASE_MAX_CONNECTIONS} connections)")
+
+    async def aclose(self) -> None:
+        """Close pooled connections; called at application shutdown"""
+        if self._transport is not None and self._loop in (None, asyncio.get_running_loop()):
+            await self._http.aclose()
+            await self._transport.aclose()
+        self._loop = None
+        self._transport = None
+        self._client = None
+        self._admin_client = None
+        self._http = None
 
-    async def get_storage_client(self, admin: bool = False) -> Client:
+    async def get_storage_client(self, admin: bool = False) -> PooledAsyncClient:
         """Get appropriate storage client based on operation type"""
         return self.admin_client if admin else self.client
 
     async def download_file(self, path: str) -> bytes:
         """Download file from storage bucket"""
         try:
-            response = self.admin_client.storage.from_(self.bucket_name)\
+            response = await self.admin_client.storage.from_(self.bucket_name)\
                 .download(path)
             return response
         except Exception as e:
             print(f"Error downloading file: {str(e)}, Path: {path}")
             raise e
 
+    async def download_to_file(self, path: str, destination: str, chunk_size: int = 1 << 20) -> str:
+        """
+        Stream a file from the storage bucket to a local path without holding it in memory.
+        Returns the SHA-256 hex digest of the downloaded content.
+        """
+        try:
+            url = await self.get_file_url(path, expires_in=600)
+            digest = hashlib.sha256()
+            timeout = httpx.Timeout(60.0, connect=settings.SUPABASE_CONNECT_TIMEOUT)
+            async with self.http.stream("GET", url, timeout=timeout) as response:
+                response.raise_for_status()
+                with open(destination, 'wb') as file:
+                    async for block in response.aiter_bytes(chunk_size):
+                        digest.update(block)
+                        file.write(block)
+            return digest.hexdigest()
+        except Exception as e:
+            logging.error(f"Error streaming file: {str(e)}, Path: {path}")
+            raise
+
     async def get_file_url(self, path: str, expires_in: int = 3600) -> str:
         """Generate a signed URL for file download"""
         try:
-            response = self.admin_client.storage.from_(self.bucket_name).create_signed_url(
+            response = await self.admin_client.storage.from_(self.bucket_name).create_signed_url(
                 path,
                 expires_in
             )
@@ -51,78 +218,99 @@ class SupabaseService:
     async def list_files(self, folder: str = "") -> list:
         """List files in a specific folder"""
         client = await self.get_storage_client()
-        return client.storage.from_(self.bucket_name).list(folder)
+        return await client.storage.from_(self.bucket_name).list(folder)
 
     async def get_storage_files(self) -> Set[str]:
         """Get all file paths from storage bucket"""
         try:
             # Use storage API instead of querying the table directly
-            files = self.admin_client.storage.from_(self.bucket_name).list()
+            files = await self.admin_client.storage.from_(self.bucket_name).list()
             return {file['name'] for file in files}
         except Exception as e:
             logging.error(f"Error getting storage files: {str(e)}")
             raise
 
+    async def get_storage_file_versions(self) -> Dict[str, str]:
+        """Get the current eTag of every file in the storage bucket"""
+        try:
+            files = await self.admin_client.storage.from_(self.bucket_name).list()
+            return {
+                file['name']: (file.get('metadata') or {}).get('eTag')
+                for file in files
+            }
+        except Exception as e:
+            logging.error(f"Error getting storage file versions: {str(e)}")
+            raise
+
+    async def get_document_versions(self) -> Dict[str, Dict]:
+        """
+        Map file paths in the documents table to their document ID and last seen eTag.
+        Paged, so files past the first select's row cap are not mistaken for new ones.
+        """
+        try:
+            documents = await fetch_all(
+                lambda: self.admin_client.table('documents')
+                    .select('document_id, file_path, source_etag')
+                    .order('document_id')
+            )
+            return {doc['file_path']: doc for doc in documents}
+        except Exception as e:
+            logging.error(f"Error getting document versions: {str(e)}")
+            raise
+
+    async def update_source_etag(self, document_id: str, etag: str) -> None:
+        """Record the storage eTag a document was last synced from"""
+        await self.admin_client.table('documents')\
+            .update({'source_etag': etag})\
+            .eq('document_id', document_id)\
+            .execute()
+
     async def get_processed_documents(self) -> Set[str]:
         """Get all file paths from documents table"""
         try:
-            result = self.admin_client.table('documents')\
+            result = await self.admin_client.table('documents')\
                 .select('file_path')\
                 .execute()
             return {doc['file_path'] for doc in result.data}
         except Exception as e:
             logging.error(f"Error getting processed documents: {str(e)}")
             raise
-    
+
+    async def find_documents_to_sync(self) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+        """
+        Compare storage with the documents table.
+        Returns new files (path -> eTag) and documents whose file was replaced
+        under the same path (path -> document with the new source_etag).
+        """
+        storage_versions = await self.get_storage_file_versions()
+        documents = await self.get_document_versions()
+        
+        new_files = {
+            file_path: etag for file_path, etag in storage_versions.items()
+            if file_path not in documents
+        }
+        changed_documents = {}
+        for file_path, etag in storage_versions.items():
+            doc = documents.get(file_path)
+            if not doc or not etag or doc.get('source_etag') == etag:
+                continue
+            if doc.get('source_etag') is None:
+                # Documents synced before eTags were tracked: adopt the current version
+                await self.update_source_etag(doc['document_id'], etag)
+            else:
+                changed_documents[file_path] = {**doc, 'source_etag': etag}
+        
+        return new_files, changed_documents
+
     # FIXME: This approach only works on the local machine, not on the server. Add a way to sync documents on the server, while keeping the local machine as a backup.
     async def sync_unprocessed_documents(self) -> None:
         """
-        Check for unprocessed documents and trigger processing.
-        This method will be called by the background task scheduler.
+        Check for new or changed documents and ingest them.
+        Delegates to the ingestion scheduler, which processes documents concurrently.
         """
-        from ..services.document_service import document_service  # Import here to avoid circular imports
+        from ..services.ingestion_scheduler import ingestion_scheduler  # Import here to avoid circular imports
         
-        try:
-            logging.info("Starting document sync process")
-            
-            # Get files from both storage and documents tables
-            storage_files = await self.get_storage_files()
-            processed_files = await self.get_processed_documents()
-            
-            # Find unprocessed files
-            unprocessed_files = storage_files - processed_files
-            
-            if not unprocessed_files:
-                logging.info("No new documents to process")
-                return
-                
-            logging.info(f"Found {len(unprocessed_files)} unprocessed documents")
-            
-            # Process each unprocessed file
-            for file_path in unprocessed_files:
-                try:
-                    logging.info(f"Processing document: {file_path}")
-                    
-                    # Create document record and extract metadata
-                    doc = await document_service.create_document_from_upload(file_path)
-                    
-                    if doc and doc.get('document_id'):
-                        # Process document (create chunks and embeddings)
-                        await document_service.process_document(doc['document_id'])
-                        logging.info(f"Successfully processed document: {file_path}")
-                    else:
-                        logging.error(f"Failed to create document record for: {file_path}")
-                        
-                except Exception as e:
-                    logging.error(f"Error processing document {file_path}: {str(e)}")
-                    # Continue with next document
-                    continue
-            
-            logging.info("Document sync process completed")
-            
-        except Exception as e:
-            logging.error(f"Error in document sync process: {str(e)}")
-            raise
+        await ingestion_scheduler.run_sync()
 
 # Create a singleton instance
 supabase_service = SupabaseService()
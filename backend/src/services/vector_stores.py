@@ -0,0 +1,473 @@
+"""
+Pluggable vector index backends for chunk embeddings.
+VectorIndex is the interface EmbeddingService and RAGService use to store,
+search and delete vectors; PineconeVectorIndex talks to the hosted index and
+LocalVectorIndex keeps vectors in a memory-mapped file on this machine.
+"""
+
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Tuple, Set, Callable
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_pinecone import PineconeVectorStore
+import numpy as np
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from .relevance import normalize_score
+
+logging.basicConfig(level=logging.INFO)
+
+class VectorIndex(ABC):
+    """
+    Vector storage keyed by chunk_id.
+    Records are {"id", "values", "metadata"}; search returns documents whose
+    page_content is the metadata "text" field, scored by similarity in [0, 1]
+    whatever the index metric (see relevance.normalize_score).
+    Filters use the Pinecone metadata filter syntax.
+    """
+
+    @abstractmethod
+    async def upsert(self, records: List[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    async def search(
+        self,
+        vector: List[float],
+        k: int,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        ...
+
+    @abstractmethod
+    async def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def update_metadata(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        """Set metadata fields (id -> fields) on existing vectors, keeping their other fields; unknown ids are skipped"""
+
+    def close(self) -> None:
+        """Release resources held by the backend"""
+
+class PineconeVectorIndex(VectorIndex):
+    """
+    Hosted Pinecone index. Raw scores depend on the index metric, which is
+    given up front or read once with describe_index (a callable returning the
+    index description) on the first search.
+    """
+    def __init__(
+        self, 
+        index, 
+        embeddings: Embeddings, 
+        metric: Optional[str] = None, 
+        describe_index: Optional[Callable[[], Any]] = None
+    ):
+        self.index = index
+        self.vector_store = PineconeVectorStore(embedding=embeddings, index=index)
+        self.metric = metric
+        self.describe_index = describe_index
+
+    async def upsert(self, records: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self.index.upsert, vectors=records)
+
+    async def search(
+        self,
+        vector: List[float],
+        k: int,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        results = await asyncio.to_thread(
+            self.vector_store.similarity_search_by_vector_with_score,
+            vector,
+            k=k,
+            filter=filter
+        )
+        metric = await self._get_metric()
+        return [(doc, normalize_score(score, metric)) for doc, score in results]
+
+    async def _get_metric(self) -> str:
+        if self.metric is None:
+            try:
+                description = await asyncio.to_thread(self.describe_index)
+                self.metric = description.metric
+                logging.info(f"Pinecone index metric: {self.metric}")
+            except Exception as e:
+                logging.error(f"Error reading Pinecone index metric, assuming cosine: {str(e)}")
+                self.metric = "cosine"
+        return self.metric
+
+    async def delete(self, ids: List[str]) -> None:
+        await self.vector_store.adelete(ids=ids)
+
+    async def update_metadata(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        def update_all():
+            # Pinecone updates one vector per call
+            for vector_id, metadata in updates.items():
+                self.index.update(id=vector_id, set_metadata=metadata)
+        await asyncio.to_thread(update_all)
+
+class LocalVectorIndex(VectorIndex):
+    """
+    On-disk vector index for corpora that fit on one machine.
+    Unit-normalised float32 vectors live in a memory-mapped file, one row per
+    chunk, with ids and metadata in SQLite next to it. Small indexes are
+    searched exactly; past ivf_min_vectors an IVF coarse quantizer (k-means
+    centroids) is trained and queries only scan the nprobe closest lists.
+    """
+    # Metadata kept in memory for filtering; large fields are read from SQLite for hits only
+    UNFILTERED_FIELDS = ("text", "location_data")
+
+    def __init__(self, path: str, ivf_min_vectors: int = 20000, nprobe: int = 8):
+        self.path = path
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, metadata TEXT NOT NULL, list_no INTEGER NOT NULL DEFAULT -1)"
+        )
+        self._db.commit()
+        
+        self._vectors: Optional[np.memmap] = None
+        self._dimension = int(self._setting("dimension") or 0)
+        self._capacity = 0
+        self._row_of: Dict[str, int] = {}
+        self._filter_fields: Dict[int, Dict[str, Any]] = {}
+        self._doc_rows: Dict[str, Set[int]] = {}
+        self._free_rows: List[int] = []
+        self._next_row = 0
+        
+        # IVF state: centroids plus the inverted list each row belongs to
+        self._centroids: Optional[np.ndarray] = None
+        self._list_of: Optional[np.ndarray] = None
+        self._trained_size = int(self._setting("trained_size") or 0)
+        
+        self._load()
+
+    def _setting(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, key: str, value: Any) -> None:
+        self._db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _load(self) -> None:
+        """Load ids, filterable metadata and IVF lists from disk"""
+        rows = self._db.execute("SELECT row, id, metadata, list_no FROM vectors").fetchall()
+        self._next_row = max((row for row, _, _, _ in rows), default=-1) + 1
+        if self._dimension:
+            self._open_vectors(max(self._next_row, 1024))
+        
+        list_of = np.full(self._capacity, -1, dtype=np.int32)
+        for row, chunk_id, metadata, list_no in rows:
+            self._track(row, chunk_id, json.loads(metadata))
+            list_of[row] = list_no
+        live = set(self._row_of.values())
+        self._free_rows = [row for row in range(self._next_row) if row not in live]
+        
+        centroids_path = os.path.join(self.path, "centroids.npy")
+        if self._trained_size and os.path.exists(centroids_path):
+            self._centroids = np.load(centroids_path)
+            self._list_of = list_of
+        
+        if rows:
+            logging.info(f"Loaded local vector index with {len(rows)} vectors from {self.path}")
+
+    def _open_vectors(self, capacity: int) -> None:
+        """Map the vector file, growing it to hold at least capacity rows"""
+        file_path = os.path.join(self.path, "vectors.f32")
+        row_bytes = self._dimension * 4
+        existing = os.path.getsize(file_path) // row_bytes if os.path.exists(file_path) else 0
+        capacity = max(capacity, existing)
+        
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(file_path, "ab") as file:
+            file.truncate(capacity * row_bytes)
+        self._vectors = np.memmap(file_path, dtype=np.float32, mode="r+", shape=(capacity, self._dimension))
+        
+        if self._list_of is not None and len(self._list_of) < capacity:
+            self._list_of = np.concatenate([self._list_of, np.full(capacity - len(self._list_of), -1, dtype=np.int32)])
+        self._capacity = capacity
+
+    def _track(self, row: int, chunk_id: str, metadata: Dict[str, Any]) -> None:
+        self._row_of[chunk_id] = row
+        fields = {key: value for key, value in metadata.items() if key not in self.UNFILTERED_FIELDS}
+        self._filter_fields[row] = fields
+        if fields.get("document_id"):
+            self._doc_rows.setdefault(fields["document_id"], set()).add(row)
+
+    def _untrack(self, chunk_id: str) -> Optional[int]:
+        row = self._row_of.pop(chunk_id, None)
+        if row is None:
+            return None
+        self._untrack_fields(row)
+        if self._list_of is not None:
+            self._list_of[row] = -1
+        return row
+
+    def _untrack_fields(self, row: int) -> None:
+        fields = self._filter_fields.pop(row, {})
+        rows = self._doc_rows.get(fields.get("document_id"))
+        if rows is not None:
+            rows.discard(row)
+            if not rows:
+                del self._doc_rows[fields["document_id"]]
+
+    async def upsert(self, records: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self.upsert_sync, records)
+
+    def upsert_sync(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        
+        with self._lock:
+            if not self._dimension:
+                self._dimension = len(records[0]["values"])
+                self._set_setting("dimension", self._dimension)
+                self._open_vectors(1024)
+            
+            vectors = _normalise(np.asarray([record["values"] for record in records], dtype=np.float32))
+            rows = []
+            for record in records:
+                row = self._untrack(record["id"])
+                if row is None:
+                    row = self._free_rows.pop() if self._free_rows else self._allocate_row()
+                rows.append(row)
+                self._track(row, record["id"], record["metadata"])
+            
+            self._vectors[rows] = vectors
+            list_nos = self._assign(vectors) if self._centroids is not None else np.full(len(rows), -1)
+            if self._list_of is not None:
+                self._list_of[rows] = list_nos
+            
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors (row, id, metadata, list_no) VALUES (?, ?, ?, ?)",
+                [
+                    (row, record["id"], json.dumps(record["metadata"]), int(list_no))
+                    for row, record, list_no in zip(rows, records, list_nos)
+                ]
+            )
+            self._db.commit()
+            self._vectors.flush()
+            
+            # (Re)train the coarse quantizer once the index outgrows exact search
+            size = len(self._row_of)
+            if size >= self.ivf_min_vectors and size >= 2 * self._trained_size:
+                self._train()
+
+    def _allocate_row(self) -> int:
+        if self._next_row >= self._capacity:
+            self._open_vectors(self._capacity * 2)
+        row = self._next_row
+        self._next_row += 1
+        return row
+
+    def _train(self, iterations: int = 10) -> None:
+        """Run k-means over the live vectors and rebuild the inverted lists"""
+        rows = np.fromiter(self._row_of.values(), dtype=np.int64)
+        nlist = max(1, min(len(rows), int(4 * np.sqrt(len(rows)))))
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(rows, size=min(len(rows), 64 * nlist), replace=False))]
+        
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for list_no in range(nlist):
+                members = sample[assignment == list_no]
+                if len(members):
+                    centroids[list_no] = members.mean(axis=0)
+            centroids = _normalise(centroids)
+        
+        self._centroids = centroids
+        self._list_of = np.full(self._capacity, -1, dtype=np.int32)
+        for start in range(0, len(rows), 8192):
+            block = np.sort(rows[start:start + 8192])
+            self._list_of[block] = self._assign(self._vectors[block])
+        
+        np.save(os.path.join(self.path, "centroids.npy"), centroids)
+        self._db.executemany(
+            "UPDATE vectors SET list_no = ? WHERE row = ?",
+            [(int(self._list_of[row]), int(row)) for row in rows]
+        )
+        self._trained_size = len(rows)
+        self._set_setting("trained_size", self._trained_size)
+        self._db.commit()
+        logging.info(f"Trained local vector index: {nlist} lists over {len(rows)} vectors")
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    async def search(
+        self,
+        vector: List[float],
+        k: int,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        return await asyncio.to_thread(self.search_sync, vector, k, filter)
+
+    def search_sync(
+        self,
+        vector: List[float],
+        k: int,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        with self._lock:
+            if not self._row_of or k <= 0:
+                return []
+            query = _normalise(np.asarray(vector, dtype=np.float32)[None, :])[0]
+            candidates = self._candidates(query, filter)
+            if candidates is None:
+                # Exact scan over the contiguous rows, skipping freed ones
+                scores = self._vectors[:self._next_row] @ query
+                scores[self._free_rows] = -np.inf
+                candidates = np.arange(self._next_row)
+            elif len(candidates) == 0:
+                return []
+            else:
+                scores = self._vectors[candidates] @ query
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            hits = [(int(candidates[i]), float(scores[i])) for i in top if scores[i] > -np.inf]
+            if not hits:
+                return []
+            
+            metadata = dict(self._db.execute(
+                f"SELECT row, metadata FROM vectors WHERE row IN ({','.join('?' * len(hits))})",
+                [row for row, _ in hits]
+            ).fetchall())
+        
+        results = []
+        for row, score in hits:
+            fields = json.loads(metadata[row])
+            text = fields.pop("text", "")
+            results.append((Document(page_content=text, metadata=fields), normalize_score(score, "cosine")))
+        return results
+
+    def _candidates(self, query: np.ndarray, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Rows to score: filtered rows or the probed IVF lists; None means every live row"""
+        if filter:
+            rows = self._rows_for_documents(filter.get("document_id"))
+            if rows is None:
+                rows = self._row_of.values()
+            return np.fromiter(
+                (row for row in rows if matches_filter(self._filter_fields[row], filter)),
+                dtype=np.int64
+            )
+        
+        if self._centroids is None or len(self._row_of) < self.ivf_min_vectors:
+            return None
+        
+        live = np.fromiter(self._row_of.values(), dtype=np.int64)
+        probe = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        return live[np.isin(self._list_of[live], probe)]
+
+    def _rows_for_documents(self, condition: Any) -> Optional[Set[int]]:
+        """Use the document_id index when the filter pins documents; None otherwise"""
+        if isinstance(condition, str):
+            document_ids = [condition]
+        elif isinstance(condition, dict) and set(condition) <= {"$eq", "$in"}:
+            document_ids = [condition["$eq"]] if "$eq" in condition else list(condition["$in"])
+        else:
+            return None
+        return set().union(*(self._doc_rows.get(document_id, set()) for document_id in document_ids))
+
+    async def delete(self, ids: List[str]) -> None:
+        await asyncio.to_thread(self.delete_sync, ids)
+
+    def delete_sync(self, ids: List[str]) -> None:
+        with self._lock:
+            rows = [row for row in (self._untrack(chunk_id) for chunk_id in ids) if row is not None]
+            self._free_rows.extend(rows)
+            self._db.executemany("DELETE FROM vectors WHERE row = ?", [(row,) for row in rows])
+            self._db.commit()
+
+    async def update_metadata(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self.update_metadata_sync, updates)
+
+    def update_metadata_sync(self, updates: Dict[str, Dict[str, Any]]) -> None:
+        """Rewrite the stored metadata of the given vectors; their values and IVF lists are untouched"""
+        with self._lock:
+            rewrites = []
+            for chunk_id, metadata in updates.items():
+                row = self._row_of.get(chunk_id)
+                if row is None:
+                    continue
+                stored = self._db.execute("SELECT metadata FROM vectors WHERE row = ?", (row,)).fetchone()
+                merged = {**json.loads(stored[0]), **metadata}
+                self._untrack_fields(row)
+                self._track(row, chunk_id, merged)
+                rewrites.append((json.dumps(merged), row))
+            self._db.executemany("UPDATE vectors SET metadata = ? WHERE row = ?", rewrites)
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._db.close()
+
+NEGATED_OPERATORS = {"$ne", "$nin"}
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """
+    Evaluate a Pinecone-style metadata filter: field equality, $eq, $ne, $in,
+    $nin, $gt, $gte, $lt, $lte, combined with $and / $or. List-valued fields
+    (like tags) match when any element matches, except for $ne and $nin, which
+    every element must satisfy, as in Pinecone.
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, part) for part in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            values = value if isinstance(value, list) else [value]
+            operators = condition if isinstance(condition, dict) else {"$eq": condition}
+            for operator, operand in operators.items():
+                combine = all if operator in NEGATED_OPERATORS else any
+                if not combine(_compare(item, operator, operand) for item in values):
+                    return False
+    return True
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lt":
+        return value < operand
+    if operator == "$lte":
+        return value <= operand
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
@@ -0,0 +1,33 @@
+from src.services.answer_cache import AnswerCache
+
+SOURCES = [{"index": 0, "content": "42.5% by 2030", "source": {"chunk_id": "c1", "document_id": "red-iii"}}]
+
+def test_similar_query_over_same_chunks_hits():
+    """Near-identical questions reuse the answer only while the chunk set matches"""
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.store([1.0, 0.0, 0.1], ["c1", "c2"], "The target is 42.5% [0].", SOURCES)
+
+    hit = cache.lookup([1.0, 0.01, 0.1], ["c2", "c1"])
+    assert hit is not None and hit.response == "The target is 42.5% [0]."
+
+    assert cache.lookup([1.0, 0.01, 0.1], ["c1", "c3"]) is None
+    assert cache.lookup([0.0, 1.0, 0.0], ["c1", "c2"]) is None
+    assert cache.stats()["hits"] == 1
+
+def test_reingestion_and_ttl_invalidate():
+    """Re-ingesting a document drops its answers; expired entries are never served"""
+    cache = AnswerCache()
+    cache.store([1.0, 0.0], ["c1"], "answer", SOURCES)
+    cache.invalidate_document("red-iii")
+    assert cache.lookup([1.0, 0.0], ["c1"]) is None
+
+    cache = AnswerCache(ttl_seconds=-1)
+    cache.store([1.0, 0.0], ["c1"], "answer", SOURCES)
+    assert cache.lookup([1.0, 0.0], ["c1"]) is None
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=1)
+    cache.store([1.0, 0.0], ["c1"], "first", SOURCES)
+    cache.store([0.0, 1.0], ["c1"], "second", SOURCES)
+    assert cache.lookup([1.0, 0.0], ["c1"]) is None
+    assert cache.lookup([0.0, 1.0], ["c1"]).response == "second"
@@ -0,0 +1,56 @@
+from src.services.context_builder import ContextBuilder, format_chunk
+
+class WordTokenizer:
+    """Whitespace tokenizer standing in for tiktoken; one token per word"""
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+def hit(chunk_id, content, score, page=1, chunk_index=None, document_id="doc-1"):
+    return {
+        "chunk": {
+            "chunk_id": chunk_id,
+            "document_id": document_id,
+            "content": content,
+            "page_number": page,
+            "section_title": None,
+            "location_data": {"bbox": {}, "rects": [{"x0": 0, "y0": chunk_index or 0, "x1": 10, "y1": (chunk_index or 0) + 1}]},
+            "chunk_index": chunk_index,
+        },
+        "similarity_score": score,
+        "retrieval_score": score,
+    }
+
+def test_merges_neighbours_and_drops_duplicates():
+    builder = ContextBuilder(max_tokens=1000, tokenizer=WordTokenizer())
+    context = builder.build([
+        hit("c2", "Member States shall ensure grid access for renewable installations.", 0.95, chunk_index=2),
+        hit("c3", "The permit granting process shall not exceed two years.", 0.80, chunk_index=3),
+        hit("dup", "Member States shall ensure grid access for renewable installations.", 0.90, page=7, document_id="doc-2"),
+        hit("other", "Offshore wind auctions are held annually.", 0.85, page=4, chunk_index=0),
+    ])
+
+    assert [chunk["source"]["chunk_ids"] for chunk in context["chunks"]] == [["c2", "c3"], ["other"]]
+    assert [chunk["index"] for chunk in context["chunks"]] == [0, 1]
+    merged = context["chunks"][0]
+    assert merged["source"]["chunk_id"] == "c2"
+    assert merged["content"].startswith("Member States") and merged["content"].endswith("two years.")
+    assert merged["source"]["location_data"]["bbox"] == {"x0": 0, "y0": 2, "x1": 10, "y1": 4}
+    assert merged["source"]["similarity_score"] == 0.95
+
+def test_packs_best_chunks_into_budget():
+    chunks = [hit(f"c{i}", " ".join(["word"] * 40) + f" chunk{i}", 1 - i / 10, page=i) for i in range(5)]
+    entry_tokens = len(format_chunk({"index": 0, "content": chunks[0]["chunk"]["content"], "source": {"page_number": 0, "section_title": None}}).split())
+    builder = ContextBuilder(max_tokens=entry_tokens * 2 + 5, duplicate_threshold=1.01, tokenizer=WordTokenizer())
+
+    context = builder.build(chunks)
+    assert [chunk["source"]["chunk_id"] for chunk in context["chunks"]] == ["c0", "c1"]
+    assert context["tokens"] <= builder.max_tokens
+
+    # An oversized top chunk is truncated instead of leaving the context empty
+    builder = ContextBuilder(max_tokens=20, tokenizer=WordTokenizer())
+    context = builder.build(chunks[:1])
+    assert len(context["chunks"]) == 1
+    assert context["tokens"] <= 20
@@ -0,0 +1,43 @@
+import time
+from types import SimpleNamespace
+from src.services.conversation_cache import ConversationCache
+
+def message(index, role="user", credits_used=0):
+    return {"role": role, "content": f"m{index}", "message_index": index, "credits_used": credits_used}
+
+def test_write_through_window_and_summary():
+    cache = ConversationCache(max_messages=4)
+    assert cache.get_window("c1") is None
+
+    cache.set_conversation("c1", SimpleNamespace(total_credits_used=3))
+    cache.set_window("c1", None, None, [message(0), message(1, "assistant")])
+    for index in range(2, 6):
+        cache.add_message("c1", message(index, "assistant" if index % 2 else "user", -1 if index % 2 else 0))
+
+    # Only the last max_messages are kept, and assistant replies add to the credit total
+    assert [msg["message_index"] for msg in cache.get_window("c1").messages] == [2, 3, 4, 5]
+    assert cache.get_conversation("c1").total_credits_used == 5
+
+    # Messages folded into the summary leave the window
+    cache.set_summary("c1", "earlier turns", 3)
+    window = cache.get_window("c1")
+    assert window.summary == "earlier turns"
+    assert [msg["message_index"] for msg in window.messages] == [4, 5]
+
+def test_message_written_while_window_loads_is_kept():
+    """A read that started before the insert landed must not drop the new message"""
+    cache = ConversationCache()
+    cache.add_message("c1", message(2))
+    cache.set_window("c1", "summary", None, [message(0), message(1, "assistant")])
+    assert [msg["message_index"] for msg in cache.get_window("c1").messages] == [0, 1, 2]
+
+def test_ttl_and_lru_eviction():
+    cache = ConversationCache(max_conversations=2, ttl_seconds=0.05)
+    for conversation_id in ("a", "b", "c"):
+        cache.set_window(conversation_id, None, None, [])
+    assert cache.get_window("a") is None
+    assert cache.get_window("c") is not None
+
+    time.sleep(0.06)
+    assert cache.get_window("c") is None
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,29 @@
+import asyncio
+import pytest
+from src.services.credit_ledger import LocalCreditLedger, UserNotFoundError, InsufficientCreditsError
+
+def ledger_for(accounts):
+    async def load_account(email):
+        await asyncio.sleep(0)
+        return accounts.get(email)
+    return LocalCreditLedger(load_account)
+
+@pytest.mark.asyncio
+async def test_concurrent_reservations_cannot_overspend():
+    ledger = ledger_for({"a@x.com": {"user_id": "u1", "credits": 2}})
+    outcomes = await asyncio.gather(*[ledger.reserve("a@x.com") for _ in range(3)], return_exceptions=True)
+    reserved = [outcome for outcome in outcomes if not isinstance(outcome, Exception)]
+    assert len(reserved) == 2
+    assert sorted(reservation.balance for reservation in reserved) == [0, 1]
+    assert sum(isinstance(outcome, InsufficientCreditsError) for outcome in outcomes) == 1
+
+    # A refund returns the credit; refunding again or settling afterwards changes nothing
+    await ledger.refund(reserved[0])
+    await ledger.refund(reserved[0])
+    await ledger.settle(reserved[0])
+    assert (await ledger.reserve("a@x.com")).balance == 0
+
+@pytest.mark.asyncio
+async def test_unknown_user():
+    with pytest.raises(UserNotFoundError):
+        await ledger_for({}).reserve("nobody@x.com")
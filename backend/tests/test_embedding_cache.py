@@ -0,0 +1,43 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from src.services.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic embeddings that record which texts reached the model"""
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+@pytest.mark.asyncio
+async def test_repeated_texts_skip_the_model(tmp_path):
+    """Repeated texts are served from memory, then from disk after a restart"""
+    db_path = str(tmp_path / "embeddings.sqlite3")
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, EmbeddingCache("test-model", db_path=db_path))
+    
+    first = await embeddings.aembed_documents(["RED III", "Article 15a", "RED III"])
+    query = await embeddings.aembed_query("Article 15a")
+    
+    assert model.calls == ["RED III", "Article 15a"]
+    assert first[0] == first[2]
+    assert query == first[1]
+    
+    # A fresh cache over the same file hits the disk tier
+    restarted = CachedEmbeddings(model, EmbeddingCache("test-model", db_path=db_path))
+    assert restarted.embed_query("RED III") == first[0]
+    assert restarted.cache.stats()["disk_hits"] == 1
+    assert model.calls == ["RED III", "Article 15a"]
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = EmbeddingCache("test-model", max_memory_items=2)
+    cache.set_many(["a", "b"], [[1.0], [2.0]])
+    cache.get_many(["a"])
+    cache.set_many(["c"], [[3.0]])
+    
+    assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
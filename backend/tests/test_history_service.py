@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from src.services.history_service import history_service, HistoryWindow
+from src.services.conversation_cache import ConversationCache
+
+def message(index):
+    return {"conversation_id": "c1", "role": "assistant" if index % 2 else "user",
+            "content": f"m{index}", "message_index": index}
+
+class StubQuery:
+    """Just enough of the PostgREST builder for the history queries; update() writes through"""
+    def __init__(self, rows, values=None):
+        self.rows = list(rows)
+        self.values = values
+
+    def eq(self, column, value):
+        self.rows = [row for row in self.rows if row[column] == value]
+        return self
+
+    def lt(self, column, value):
+        self.rows = [row for row in self.rows if row[column] < value]
+        return self
+
+    def gt(self, column, value):
+        self.rows = [row for row in self.rows if row[column] > value]
+        return self
+
+    def order(self, column, desc=False):
+        self.rows = sorted(self.rows, key=lambda row: row[column], reverse=desc)
+        return self
+
+    def limit(self, count):
+        self.rows = self.rows[:count]
+        return self
+
+    async def execute(self):
+        if self.values is not None:
+            for row in self.rows:
+                row.update(self.values)
+        return SimpleNamespace(data=[dict(row) for row in self.rows])
+
+class StubTable:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, columns):
+        return StubQuery(self.rows)
+
+    def update(self, values):
+        return StubQuery(self.rows, values)
+
+    def insert(self, row):
+        self.rows.append(dict(row))
+        return StubQuery([row])
+
+@pytest.fixture
+def history(monkeypatch):
+    """history_service over 14 stored messages (0-13), a stub LLM and a fresh cache"""
+    tables = {
+        "conversations": [{"conversation_id": "c1", "summary": None, "summary_message_index": None}],
+        "messages": [message(index) for index in range(14)],
+    }
+    prompts = []
+
+    def summarize(prompt):
+        prompts.append(prompt.to_string())
+        return AIMessage(content=f"summary {len(prompts)}")
+
+    monkeypatch.setattr(history_service, "supabase", SimpleNamespace(
+        admin_client=SimpleNamespace(table=lambda name: StubTable(tables[name]))
+    ))
+    monkeypatch.setattr(history_service, "llm", RunnableLambda(summarize))
+    monkeypatch.setattr(history_service, "cache", ConversationCache())
+    monkeypatch.setattr(history_service, "window_messages", 6)
+    monkeypatch.setattr(history_service, "summary_batch", 4)
+    return SimpleNamespace(service=history_service, conversation=tables["conversations"][0], prompts=prompts)
+
+@pytest.mark.asyncio
+async def test_refresh_fires_once_a_batch_has_left_the_window(history, monkeypatch):
+    started = []
+
+    async def refresh_summary(conversation_id):
+        started.append(conversation_id)
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(history.service, "refresh_summary", refresh_summary)
+
+    # 7 shown + the 2 just saved: 3 messages outside the window, below the batch of 4
+    history.service.schedule_summary_refresh("c1", HistoryWindow(messages=[message(i) for i in range(7)]))
+    await asyncio.sleep(0)
+    assert started == []
+
+    # 8 shown + 2 saved: a full batch has left the window; a second call while in flight is ignored
+    window = HistoryWindow(messages=[message(i) for i in range(8)])
+    history.service.schedule_summary_refresh("c1", window)
+    history.service.schedule_summary_refresh("c1", window)
+    await asyncio.gather(*history.service._tasks)
+    assert started == ["c1"]
+    assert "c1" not in history.service._refreshing
+
+@pytest.mark.asyncio
+async def test_refresh_folds_only_unsummarised_messages_before_the_window(history):
+    await history.service.refresh_summary("c1")
+
+    # The window is the last 6 messages (8-13), so 0-7 are folded
+    assert "m0" in history.prompts[0] and "m7" in history.prompts[0] and "m8" not in history.prompts[0]
+    assert history.conversation["summary"] == "summary 1"
+    assert history.conversation["summary_message_index"] == 7
+
+    # Four more messages later, only 8-11 are new outside the window
+    history.service.cache = None
+    for index in range(14, 18):
+        await history.service.add_message(message(index))
+    await history.service.refresh_summary("c1")
+    assert "summary 1" in history.prompts[1]
+    assert "m7" not in history.prompts[1] and "m8" in history.prompts[1] and "m11" in history.prompts[1]
+    assert history.conversation["summary_message_index"] == 11
+
+    # Fewer than a batch outside the window: no LLM call
+    await history.service.refresh_summary("c1")
+    assert len(history.prompts) == 2
+
+@pytest.mark.asyncio
+async def test_window_moves_forward_with_the_summary(history):
+    # Nothing summarised yet: the window holds window_messages + summary_batch - 1 messages
+    window = await history.service.get_window("c1")
+    assert window.summary is None
+    assert [msg["message_index"] for msg in window.messages] == list(range(5, 14))
+
+    # The cached window drops the folded messages as soon as the summary advances
+    await history.service.refresh_summary("c1")
+    window = await history.service.get_window("c1")
+    assert window.summary == "summary 1"
+    assert [msg["message_index"] for msg in window.messages] == list(range(8, 14))
+
+    # A cold read from Supabase agrees
+    history.service.cache = ConversationCache()
+    window = await history.service.get_window("c1")
+    assert window.summary == "summary 1"
+    assert [msg["message_index"] for msg in window.messages] == list(range(8, 14))
@@ -0,0 +1,70 @@
+import pytest
+from src.services.ingestion_jobs import IngestionJobStore, JobProgress
+
+def test_jobs_are_deduplicated_and_survive_restart(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    store = IngestionJobStore(db_path)
+    
+    job = store.create("process", document_id="doc-1")
+    assert store.create("process", document_id="doc-1")["job_id"] == job["job_id"]  # already queued
+    assert store.create("create", file_path="annex.pdf")["job_id"] != job["job_id"]
+    
+    assert store.claim_next()["job_id"] == job["job_id"]
+    restarted = IngestionJobStore(db_path)
+    assert restarted.requeue_running() == 1
+    assert restarted.counts() == {"queued": 2}
+    
+    restarted.claim_next()
+    restarted.fail(job["job_id"], "timeout")
+    assert restarted.get(job["job_id"])["error"] == "timeout"
+    assert restarted.create("process", document_id="doc-1")["job_id"] != job["job_id"]  # finished jobs are not reused
+
+def test_file_path_jobs_are_deduplicated_once_the_document_exists():
+    store = IngestionJobStore(":memory:")
+    job = store.create("create", file_path="red_iii.pdf")
+    
+    # The running create job has inserted the document row; a second POST still gets this job
+    store.claim_next()
+    store.set_document_id(job["job_id"], "doc-1")
+    assert store.create("create", file_path="red_iii.pdf")["job_id"] == job["job_id"]
+    assert store.find_active("red_iii.pdf")["document_id"] == "doc-1"
+    
+    store.complete(job["job_id"])
+    assert store.find_active("red_iii.pdf") is None
+    assert store.create("create", file_path="red_iii.pdf")["job_id"] != job["job_id"]
+
+@pytest.mark.asyncio
+async def test_progress_records_stages_and_publishes_to_document():
+    store = IngestionJobStore(":memory:")
+    job = store.create("create", file_path="red_iii.pdf")
+    published = []
+    
+    async def publish(document_id, stage, stages):
+        published.append((document_id, stage, stages[stage]["status"]))
+    
+    progress = JobProgress(store, job["job_id"], publish=publish, publish_interval=60)
+    async with progress.stage("download"):
+        pass
+    progress.set_document_id("doc-1")
+    async with progress.stage("parse_embed"):
+        await progress.advance("parse_embed", 100)
+        await progress.advance("parse_embed", 50)  # within the publish interval
+    with pytest.raises(RuntimeError):
+        async with progress.stage("cleanup"):
+            raise RuntimeError("delete failed")
+    
+    stored = store.get(job["job_id"])
+    assert stored["document_id"] == "doc-1"
+    assert stored["stage"] == "cleanup"
+    assert stored["stages"]["parse_embed"]["items"] == 150
+    assert stored["stages"]["cleanup"]["status"] == "failed"
+    assert "duration_ms" in stored["stages"]["download"]
+    # Only stage boundaries once the document is known
+    assert published == [
+        ("doc-1", "parse_embed", "running"), ("doc-1", "parse_embed", "done"),
+        ("doc-1", "cleanup", "running"), ("doc-1", "cleanup", "failed")
+    ]
+    
+    # Without a store nothing is recorded
+    async with JobProgress().stage("download"):
+        pass
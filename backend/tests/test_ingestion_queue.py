@@ -0,0 +1,33 @@
+from src.services.ingestion_queue import IngestionQueue
+
+def test_claims_are_exclusive_and_survive_restart(tmp_path):
+    """A running file is not handed out twice, and is re-queued after a restart"""
+    db_path = str(tmp_path / "queue.sqlite3")
+    queue = IngestionQueue(db_path)
+    
+    assert queue.enqueue("red_iii.pdf", "etag-1")
+    assert not queue.enqueue("red_iii.pdf", "etag-1")  # already queued
+    
+    item = queue.claim_next()
+    assert item["file_path"] == "red_iii.pdf"
+    assert queue.claim_next() is None
+    assert not queue.enqueue("red_iii.pdf", "etag-1")  # still running
+    
+    queue.set_document_id("red_iii.pdf", "doc-1")
+    
+    restarted = IngestionQueue(db_path)
+    assert restarted.requeue_running() == 1
+    item = restarted.claim_next()
+    assert item["document_id"] == "doc-1"
+    assert item["attempts"] == 2
+
+def test_failed_files_are_retried_until_attempts_run_out(tmp_path):
+    queue = IngestionQueue(str(tmp_path / "queue.sqlite3"), max_attempts=2)
+    queue.enqueue("annex.pdf", None)
+    
+    queue.fail(queue.claim_next()["file_path"], "timeout")
+    assert queue.counts() == {"queued": 1}
+    
+    queue.fail(queue.claim_next()["file_path"], "timeout")
+    assert queue.counts() == {"failed": 1}
+    assert queue.claim_next() is None
@@ -0,0 +1,32 @@
+from src.services.lexical_index import LexicalIndex, tokenize, reciprocal_rank_fusion
+
+CHUNKS = [
+    {"chunk_id": "c1", "document_id": "red-iii", "content": "Article 15a sets out measures for renewable energy in buildings."},
+    {"chunk_id": "c2", "document_id": "red-iii", "content": "Member States shall ensure renewable energy targets are met."},
+    {"chunk_id": "c3", "document_id": "repower", "content": "Directive (EU) 2018/2001 is amended as follows."},
+]
+
+def test_tokenize_keeps_regulatory_identifiers():
+    assert tokenize("Article 15a of Directive (EU) 2018/2001") == ["article", "15a", "directive", "eu", "2018/2001", "2018", "2001"]
+
+def test_exact_terms_rank_first_and_updates_persist(tmp_path):
+    """BM25 ranks exact identifier matches first; removals survive a reopen"""
+    db_path = str(tmp_path / "lexical.sqlite3")
+    index = LexicalIndex(db_path)
+    index.add_sync(CHUNKS)
+
+    assert index.search_sync("What does Article 15a require?", k=3)[0][0] == "c1"
+    assert index.search_sync("2018/2001", k=3)[0][0] == "c3"
+    assert [chunk_id for chunk_id, _ in index.search_sync("renewable", k=3, document_ids=["repower"])] == []
+
+    index.remove_sync(["c1"])
+    index.close()
+
+    reopened = LexicalIndex(db_path)
+    assert len(reopened) == 2
+    assert all(chunk_id != "c1" for chunk_id, _ in reopened.search_sync("Article 15a", k=3))
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]])
+    assert fused[0][0] == "c"
+    assert {item for item, _ in fused} == {"a", "b", "c", "d"}
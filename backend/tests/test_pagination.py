@@ -0,0 +1,61 @@
+import pytest
+from types import SimpleNamespace
+from src.services.pagination import fetch_all
+
+class StubQuery:
+    """Minimal PostgREST builder over a list of rows, capped like the server at max_rows"""
+    def __init__(self, rows, max_rows=1000):
+        self.rows = rows
+        self.max_rows = max_rows
+        self.start, self.end = 0, None
+
+    def eq(self, column, value):
+        self.rows = [row for row in self.rows if row[column] == value]
+        return self
+
+    def is_(self, column, value):
+        self.rows = [row for row in self.rows if row[column] is None]
+        return self
+
+    def order(self, column):
+        self.rows = sorted(self.rows, key=lambda row: row[column])
+        return self
+
+    def range(self, start, end):
+        self.start, self.end = start, end
+        return self
+
+    async def execute(self):
+        end = len(self.rows) if self.end is None else self.end + 1
+        return SimpleNamespace(data=self.rows[self.start:min(end, self.start + self.max_rows)])
+
+@pytest.mark.asyncio
+async def test_reads_past_the_server_row_cap():
+    chunks = [
+        {"chunk_id": f"c{index:05d}", "document_id": "doc-1" if index % 5 else "doc-2",
+         "content_hash": None if index % 7 == 0 else f"h{index}"}
+        for index in range(3000)
+    ]
+    calls = []
+
+    def query():
+        calls.append(1)
+        return StubQuery(chunks).eq("document_id", "doc-1").order("chunk_id")
+
+    rows = await fetch_all(query)
+    assert len(rows) == 2400 and len(calls) == 3
+    assert len({row["chunk_id"] for row in rows}) == 2400
+
+    # A single select stops at the cap
+    assert len((await StubQuery(chunks).eq("document_id", "doc-1").execute()).data) == 1000
+
+    legacy = await fetch_all(
+        lambda: StubQuery(chunks).eq("document_id", "doc-1").is_("content_hash", "null").order("chunk_id"),
+        page_size=100
+    )
+    assert len(legacy) == sum(1 for index in range(3000) if index % 5 and index % 7 == 0)
+
+@pytest.mark.asyncio
+async def test_exact_multiple_of_page_size_ends_on_empty_page():
+    rows = [{"chunk_id": index} for index in range(200)]
+    assert len(await fetch_all(lambda: StubQuery(rows).order("chunk_id"), page_size=100)) == 200
@@ -0,0 +1,103 @@
+import pytest
+from types import SimpleNamespace
+from src.services.pdf_batch_processor import pdf_batch_processor
+from src.services.embedding_service import embedding_service
+from src.services.vector_stores import LocalVectorIndex
+from tests.test_pagination import StubQuery
+
+def chunk(content, page_number, chunk_index, start_offset):
+    return SimpleNamespace(
+        content=content, page_number=page_number, section_title=None, chunk_index=chunk_index,
+        start_offset=start_offset, end_offset=start_offset + len(content), category=None,
+        location_data={"page": page_number}, element_type="text", font_info=None, context=None
+    )
+
+class StubChunksTable:
+    """The chunks table: paged selects, inserts with generated IDs, upserts and updates by chunk_id"""
+    def __init__(self):
+        self.rows = []
+
+    def select(self, columns):
+        return StubQuery(self.rows)
+
+    def insert(self, rows):
+        for row in rows:
+            row = {**row, "chunk_id": f"chunk-{len(self.rows)}", "embedded_at": None}
+            self.rows.append(row)
+        return SimpleNamespace(execute=self._result(self.rows[-len(rows):]))
+
+    def upsert(self, rows):
+        by_id = {row["chunk_id"]: row for row in self.rows}
+        for row in rows:
+            by_id[row["chunk_id"]].update(row)
+        return SimpleNamespace(execute=self._result(rows))
+
+    def update(self, values):
+        def in_(column, ids):
+            for row in self.rows:
+                if row[column] in ids:
+                    row.update(values)
+            return SimpleNamespace(execute=self._result([]))
+        return SimpleNamespace(in_=in_)
+
+    def _result(self, rows):
+        async def execute():
+            return SimpleNamespace(data=[dict(row) for row in rows])
+        return execute
+
+async def ingest(document, pages, index, file_hash):
+    """Run one ingest of pages and store vectors for the chunks it hands out for embedding"""
+    async def iter_pages(file_path):
+        for page_number, chunks in pages:
+            yield page_number, chunks
+
+    async def download_to_file(file_path, destination):
+        return file_hash
+
+    pdf_batch_processor.pdf_processor = SimpleNamespace(iter_pages=iter_pages)
+    pdf_batch_processor.supabase.download_to_file = download_to_file
+    plan = await pdf_batch_processor.process_pdf_to_chunks(
+        document,
+        on_moved=lambda chunks: embedding_service.update_chunk_positions(document["document_id"], chunks)
+    )
+    async for batch in plan["batches"]:
+        await index.upsert([{
+            "id": row["chunk_id"],
+            "values": [1.0, float(row["chunk_index"])],
+            "metadata": embedding_service._build_metadata(document["document_id"], row)
+        } for row in batch])
+        await pdf_batch_processor.mark_embedded([row["chunk_id"] for row in batch])
+    return plan
+
+@pytest.mark.asyncio
+async def test_moved_chunk_vector_follows_its_new_page(tmp_path, monkeypatch):
+    """A paragraph inserted before a chunk pushes it to the next page; its vector cites the new page"""
+    table = StubChunksTable()
+    index = LocalVectorIndex(str(tmp_path))
+    monkeypatch.setattr(pdf_batch_processor, "supabase", SimpleNamespace(
+        admin_client=SimpleNamespace(table=lambda name: table)
+    ))
+    monkeypatch.setattr(pdf_batch_processor, "pdf_processor", None)
+    monkeypatch.setattr(embedding_service, "vector_index", index)
+    document = {"document_id": "doc-1", "file_path": "doc-1.pdf"}
+
+    await ingest(document, [
+        (1, [chunk("Article 1 scope", 1, 0, 0)]),
+        (2, [chunk("Article 2 permitting deadlines", 2, 1, 15)]),
+    ], index, "v1")
+    moved_id = next(row["chunk_id"] for row in table.rows if row["content"].startswith("Article 2"))
+
+    plan = await ingest(document, [
+        (1, [chunk("Article 1 scope", 1, 0, 0)]),
+        (2, [chunk("Article 1a new definitions", 2, 1, 15)]),
+        (3, [chunk("Article 2 permitting deadlines", 3, 2, 41)]),
+    ], index, "v2")
+
+    assert plan["removed_ids"] == []
+    stored = next(row for row in table.rows if row["chunk_id"] == moved_id)
+    assert stored["page_number"] == 3
+    hits = await index.search([1.0, 2.0], k=3, filter={"chunk_id": moved_id})
+    assert hits[0][0].metadata["page_number"] == 3
+    assert hits[0][0].metadata["chunk_index"] == 2
+    assert hits[0][0].metadata["location_data"] == '{"page": 3}'
+    assert hits[0][0].page_content == "Article 2 permitting deadlines"
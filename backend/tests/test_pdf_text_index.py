@@ -0,0 +1,29 @@
+from src.services.pdf_text_index import PageTextIndex
+
+def word(x0, y0, text, block, line, n):
+    return (x0, y0, x0 + 10 * len(text), y0 + 10, text, block, line, n)
+
+# Two lines of text: "(1) Member States shall" / "ensure that the share"
+WORDS = [
+    word(10, 100, "(1)", 0, 0, 0), word(50, 100, "Member", 0, 0, 1),
+    word(120, 100, "States", 0, 0, 2), word(190, 100, "shall", 0, 0, 3),
+    word(10, 115, "ensure", 0, 1, 0), word(80, 115, "that", 0, 1, 1),
+    word(130, 115, "the", 0, 1, 2), word(170, 115, "share", 0, 1, 3),
+]
+
+def test_locate_returns_one_rect_per_line():
+    """Text wrapped over two lines yields a rect per line and their union"""
+    location = PageTextIndex(WORDS).locate("Member States shall\nensure that")
+    
+    assert location["rects"] == [
+        {"x0": 50, "y0": 100, "x1": 240, "y1": 110},
+        {"x0": 10, "y0": 115, "x1": 120, "y1": 125},
+    ]
+    assert location["bbox"] == {"x0": 10, "y0": 100, "x1": 240, "y1": 125}
+
+def test_locate_falls_back_to_prefix_and_misses_cleanly():
+    index = PageTextIndex(WORDS, prefix_tokens=2)
+    
+    # Body differs from the page text, but the opening words still anchor it
+    assert index.locate("(1) Member States must")["rects"][0]["x0"] == 10
+    assert PageTextIndex(WORDS).locate("Article 15a") is None
@@ -0,0 +1,31 @@
+import time
+from src.services.profile_cache import ProfileCache
+
+def test_lookup_negative_entries_and_invalidation():
+    cache = ProfileCache(ttl_seconds=60, negative_ttl_seconds=0.05)
+    assert cache.get("a@x.com") == (False, None)
+
+    cache.set("a@x.com", {"user_id": "u1", "credits": 5})
+    cache.set("nobody@x.com", None)
+    assert cache.get("nobody@x.com") == (True, None)
+
+    # Balance changes are mirrored by user_id; callers get copies
+    cache.adjust_credits("u1", -1)
+    found, profile = cache.get("a@x.com")
+    profile["credits"] = 100
+    assert cache.get("a@x.com") == (True, {"user_id": "u1", "credits": 4})
+
+    # A credit transaction drops the entry; unknown emails expire sooner
+    cache.invalidate(user_id="u1")
+    assert cache.get("a@x.com") == (False, None)
+    time.sleep(0.06)
+    assert cache.get("nobody@x.com") == (False, None)
+    assert cache.stats()["hits"] == 3
+
+def test_lru_eviction():
+    cache = ProfileCache(max_entries=2)
+    for index in range(3):
+        cache.set(f"{index}@x.com", {"user_id": f"u{index}", "credits": 1})
+    assert cache.get("0@x.com") == (False, None)
+    cache.adjust_credits("u0", -1)  # evicted users are ignored
+    assert cache.get("2@x.com")[0]
@@ -1,6 +1,102 @@
 import pytest
 import asyncio
+import time
+from types import SimpleNamespace
+from langchain_core.documents import Document
 from src.services.rag_service import rag_service
+from src.services.reranker import Reranker, LexicalOverlapScorer
+
+QUERY = "Article 15a permitting deadlines for offshore wind"
+
+class StubVectorIndex:
+    """Returns fixed (chunk_id, similarity, text) hits and records the requested k"""
+    def __init__(self, hits):
+        self.hits = hits
+        self.k = None
+
+    async def search(self, vector, k, filter=None):
+        self.k = k
+        return [(Document(page_content=text, metadata={
+            "chunk_id": chunk_id, "document_id": "doc-1", "page_number": 1, "location_data": "{}"
+        }), score) for chunk_id, score, text in self.hits[:k]]
+
+class StubLexicalIndex:
+    def __init__(self, hits):
+        self.hits = hits
+
+    async def search(self, query, k, document_ids=None):
+        return self.hits[:k]
+
+class StubChunksTable:
+    """Serves the batched Supabase lookup for lexical-only hits"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def select(self, columns):
+        return self
+
+    def in_(self, column, ids):
+        self.ids = ids
+        return self
+
+    async def execute(self):
+        return SimpleNamespace(data=[chunk for chunk in self.chunks if chunk["chunk_id"] in self.ids])
+
+VECTOR_HITS = [
+    ("vec-overview", 0.95, "General overview of the renewable energy directive."),
+    ("vec-article", 0.80, "Article 15a permitting deadlines for offshore wind projects are set here."),
+    *[(f"vec-tariffs-{i}", 0.79 - i * 0.01, f"Grid tariffs are reviewed in cycle {i}.") for i in range(8)],
+    ("vec-weak", 0.60, "Article 15a permitting deadlines for offshore wind, restated."),
+]
+class SlowScorer(LexicalOverlapScorer):
+    def score_batch(self, query, texts):
+        time.sleep(0.05)
+        return super().score_batch(query, texts)
+
+LEXICAL_CHUNK = {
+    "chunk_id": "lex-article", "document_id": "doc-2", "content": "Under Article 15a, permitting deadlines for offshore wind are two years.",
+    "page_number": 4, "section_title": None, "location_data": {}, "chunk_index": 0
+}
+
+@pytest.mark.asyncio
+async def test_retrieval_cuts_after_reranking(monkeypatch):
+    """
+    Every vector candidate above the similarity threshold reaches the reranker,
+    lexical-only hits included, and the adaptive cut runs on the reranked list:
+    the second vector hit survives although it is far below the top similarity.
+    """
+    vector_index = StubVectorIndex(VECTOR_HITS)
+    monkeypatch.setattr(rag_service, "vector_index", vector_index)
+    monkeypatch.setattr(rag_service, "lexical_index", StubLexicalIndex([("lex-article", 7.5)]))
+    monkeypatch.setattr(rag_service, "reranker", Reranker(LexicalOverlapScorer(), candidates=50, timeout_ms=5000))
+    monkeypatch.setattr(rag_service, "supabase", SimpleNamespace(
+        admin_client=SimpleNamespace(table=lambda name: StubChunksTable([LEXICAL_CHUNK]))
+    ))
+    monkeypatch.setattr(rag_service, "similarity_threshold", 0.7)
+    monkeypatch.setattr(rag_service, "score_margin", 0.1)
+    monkeypatch.setattr(rag_service, "knee_gap", 0.05)
+    
+    hits = await rag_service._retrieve_relevant_chunks(QUERY, query_embedding=[0.1, 0.2])
+    
+    assert vector_index.k == 50
+    assert {hit["chunk"]["chunk_id"] for hit in hits} == {"vec-article", "lex-article"}
+    lexical_hit = next(hit for hit in hits if hit["chunk"]["chunk_id"] == "lex-article")
+    assert lexical_hit["similarity_score"] is None
+    
+    # A reranker past its budget returns the fused order, which is only capped,
+    # even with a knee gap small enough to cut between fused ranks
+    monkeypatch.setattr(rag_service, "reranker", Reranker(SlowScorer(), candidates=50, timeout_ms=10, batch_size=1))
+    monkeypatch.setattr(rag_service, "knee_gap", 0.0001)
+    hits = await rag_service._retrieve_relevant_chunks(QUERY, query_embedding=[0.1, 0.2])
+    assert len(hits) == rag_service.max_chunks
+    assert "vec-weak" not in {hit["chunk"]["chunk_id"] for hit in hits}
+    
+    # Without reranking or lexical hits the cut applies to the similarity scores
+    monkeypatch.setattr(rag_service, "knee_gap", 0.05)
+    monkeypatch.setattr(rag_service, "reranker", None)
+    monkeypatch.setattr(rag_service, "lexical_index", None)
+    hits = await rag_service._retrieve_relevant_chunks(QUERY, query_embedding=[0.1, 0.2])
+    assert [hit["chunk"]["chunk_id"] for hit in hits] == ["vec-overview"]
 
 @pytest.mark.asyncio
 async def test_rag_query_processing():
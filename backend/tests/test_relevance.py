@@ -0,0 +1,20 @@
+import pytest
+from src.services.relevance import normalize_score, adaptive_cutoff
+
+def test_metrics_map_to_the_same_scale():
+    """Unit vectors at cosine 0.8 score the same whichever metric the index uses"""
+    assert normalize_score(0.8, "cosine") == pytest.approx(0.8)
+    assert normalize_score(0.8, "dotproduct") == pytest.approx(0.8)
+    assert normalize_score(2 - 2 * 0.8, "euclidean") == pytest.approx(0.8)  # squared distance
+    assert normalize_score(-0.3, "cosine") == 0.0
+    with pytest.raises(ValueError):
+        normalize_score(0.5, "manhattan")
+
+def test_adaptive_cutoff():
+    # A confident match stands apart from the rest
+    assert adaptive_cutoff([0.93, 0.81, 0.80, 0.79], min_score=0.7, margin=0.2, knee_gap=0.05) == 1
+    # Evenly spread scores are limited by the margin below the top score
+    assert adaptive_cutoff([0.86, 0.84, 0.82, 0.80, 0.78, 0.74], min_score=0.7, margin=0.07, knee_gap=0.05) == 4
+    # Nothing above the floor
+    assert adaptive_cutoff([0.65, 0.6], min_score=0.7, margin=0.1, knee_gap=0.05) == 0
+    assert adaptive_cutoff([], min_score=0.7, margin=0.1, knee_gap=0.05) == 0
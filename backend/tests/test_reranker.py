@@ -0,0 +1,49 @@
+import time
+import pytest
+from src.services.reranker import Reranker, LexicalOverlapScorer
+
+def hits(*contents):
+    return [{
+        "chunk": {"chunk_id": f"c{i}", "content": content},
+        "similarity_score": 0.9 - i / 100,
+        "retrieval_score": 0.9 - i / 100
+    } for i, content in enumerate(contents)]
+
+class CountingScorer(LexicalOverlapScorer):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.scored = 0
+
+    def score_batch(self, query, texts):
+        time.sleep(self.delay)
+        self.scored += len(texts)
+        return super().score_batch(query, texts)
+
+CANDIDATES = hits(
+    "Renewable energy communities may share energy produced within the community.",
+    "Member States shall set an indicative target for innovative renewable energy technology.",
+    "Directive (EU) 2018/2001 sets the binding overall Union target for 2030.",
+)
+
+@pytest.mark.asyncio
+async def test_rerank_promotes_covering_chunk_and_caches_scores():
+    scorer = CountingScorer()
+    reranker = Reranker(scorer, batch_size=2)
+
+    top = await reranker.rerank("Union target in Directive 2018/2001", CANDIDATES, top_k=2)
+    assert [hit["chunk"]["chunk_id"] for hit in top] == ["c2", "c0"]
+    assert all(hit["reranked"] for hit in top)
+    assert scorer.scored == 3
+
+    # Cached scores are reused for the same query and chunks
+    await reranker.rerank("Union target in Directive 2018/2001", CANDIDATES, top_k=2)
+    assert scorer.scored == 3
+
+@pytest.mark.asyncio
+async def test_rerank_keeps_first_stage_order_past_budget():
+    reranker = Reranker(CountingScorer(delay=0.05), batch_size=1, timeout_ms=20)
+
+    top = await reranker.rerank("Union target in Directive 2018/2001", CANDIDATES, top_k=2)
+    assert [hit["chunk"]["chunk_id"] for hit in top] == ["c0", "c1"]
+    assert top[0]["retrieval_score"] == CANDIDATES[0]["retrieval_score"]
+    assert not any(hit.get("reranked") for hit in top)
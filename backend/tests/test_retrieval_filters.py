@@ -0,0 +1,59 @@
+import pytest
+from src.models.chat_pydantic import RetrievalFilters
+from src.services.retrieval_filters import build_vector_filter, document_filter_metadata, has_metadata_filters, normalize_tags
+from src.services.vector_stores import LocalVectorIndex
+
+DOCUMENTS = {
+    "doc-eu-2023": {"region": "Europe", "category": "Regulations", "tags": ["Solar", "grid"], "publication_year": "2023"},
+    "doc-eu-2019": {"region": "europe", "category": "regulations", "tags": ["wind"], "publication_year": "2019"},
+    "doc-asia-2023": {"region": "asia", "category": "reports", "tags": [], "publication_year": None},
+}
+
+def test_document_metadata_is_normalised():
+    """Fields are lowercased, the year becomes an int and missing values are dropped"""
+    assert document_filter_metadata(DOCUMENTS["doc-eu-2023"]) == {
+        "region": "europe", "category": "regulations", "tags": ["solar", "grid"], "publication_year": 2023
+    }
+    assert document_filter_metadata(DOCUMENTS["doc-asia-2023"]) == {"region": "asia", "category": "reports"}
+    assert document_filter_metadata(None) == {}
+
+def test_build_vector_filter():
+    assert build_vector_filter(None) is None
+    assert build_vector_filter(RetrievalFilters()) is None
+    assert build_vector_filter(RetrievalFilters(region=" EU ", year_from=2020, year_to=2024, tags=["Solar"])) == {
+        "region": {"$eq": "eu"},
+        "tags": {"$in": ["solar"]},
+        "publication_year": {"$gte": 2020, "$lte": 2024},
+    }
+    assert not has_metadata_filters(RetrievalFilters(document_ids=["doc-1"]))
+    assert has_metadata_filters(RetrievalFilters(category="reports"))
+
+def test_tags_match_case_insensitively_on_both_sides():
+    """Stored and requested tags are normalised alike, so "Solar" finds a document tagged "SOLAR " """
+    stored = document_filter_metadata({"tags": ["SOLAR ", " ", "Grid"]})["tags"]
+    requested = build_vector_filter(RetrievalFilters(tags=["Solar"]))["tags"]["$in"]
+    assert stored == normalize_tags(["solar", "grid"]) == ["solar", "grid"]
+    assert set(requested) & set(stored)
+
+@pytest.mark.asyncio
+async def test_filters_are_applied_in_the_index(tmp_path):
+    """A scoped search only returns chunks of matching documents, even when k exceeds them"""
+    index = LocalVectorIndex(str(tmp_path))
+    await index.upsert([{
+        "id": f"{document_id}-{i}",
+        "values": [1.0, i / 10, 0.0],
+        "metadata": {
+            **document_filter_metadata(document),
+            "chunk_id": f"{document_id}-{i}",
+            "document_id": document_id,
+            "text": f"{document_id} chunk {i}",
+        }
+    } for document_id, document in DOCUMENTS.items() for i in range(3)])
+
+    scoped = RetrievalFilters(region="Europe", category="regulations", year=2023)
+    hits = await index.search([1.0, 0.0, 0.0], k=10, filter=build_vector_filter(scoped))
+    assert {doc.metadata["document_id"] for doc, _ in hits} == {"doc-eu-2023"}
+    assert len(hits) == 3
+
+    hits = await index.search([1.0, 0.0, 0.0], k=10, filter=build_vector_filter(RetrievalFilters(tags=["wind", "grid"])))
+    assert {doc.metadata["document_id"] for doc, _ in hits} == {"doc-eu-2023", "doc-eu-2019"}
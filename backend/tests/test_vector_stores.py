@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from src.services.vector_stores import LocalVectorIndex, matches_filter
+
+def make_records(count, dimension=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{
+        "id": f"chunk-{i}",
+        "values": rng.normal(size=dimension).tolist(),
+        "metadata": {"chunk_id": f"chunk-{i}", "document_id": f"doc-{i % 3}", "text": f"Article {i}", "page_number": i}
+    } for i in range(count)]
+
+@pytest.mark.asyncio
+async def test_search_filter_delete_and_reload(tmp_path):
+    """Exact search returns the query's own vector first and survives a restart"""
+    records = make_records(50)
+    index = LocalVectorIndex(str(tmp_path))
+    await index.upsert(records)
+
+    hits = await index.search(records[7]["values"], k=3)
+    assert hits[0][0].page_content == "Article 7"
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    filtered = await index.search(records[7]["values"], k=5, filter={"document_id": "doc-2"})
+    assert {doc.metadata["document_id"] for doc, _ in filtered} == {"doc-2"}
+
+    await index.delete(["chunk-7"])
+    index.close()
+
+    reloaded = LocalVectorIndex(str(tmp_path))
+    assert len(reloaded) == 49
+    hits = await reloaded.search(records[7]["values"], k=1)
+    assert hits[0][0].metadata["chunk_id"] != "chunk-7"
+
+@pytest.mark.asyncio
+async def test_ivf_search_finds_nearest(tmp_path):
+    """Past ivf_min_vectors queries scan only the probed lists but still find exact matches"""
+    records = make_records(400)
+    index = LocalVectorIndex(str(tmp_path), ivf_min_vectors=200, nprobe=4)
+    await index.upsert(records)
+
+    found = 0
+    for record in records[:50]:
+        hits = await index.search(record["values"], k=1)
+        found += hits[0][0].metadata["chunk_id"] == record["id"]
+    assert found == 50
+
+def test_matches_filter():
+    metadata = {"region": "europe", "publication_year": 2023, "tags": ["solar", "grid"]}
+    assert matches_filter(metadata, {"region": "europe", "tags": {"$in": ["grid"]}})
+    assert matches_filter(metadata, {"publication_year": {"$gte": 2020, "$lt": 2024}})
+    assert not matches_filter(metadata, {"$or": [{"region": "asia"}, {"publication_year": {"$gt": 2023}}]})
+
+@pytest.mark.asyncio
+async def test_negated_operators_exclude_any_matching_list_element(tmp_path):
+    """A chunk tagged ["solar", "grid"] is excluded by $nin ["solar"], as in Pinecone"""
+    metadata = {"tags": ["solar", "grid"]}
+    assert not matches_filter(metadata, {"tags": {"$nin": ["solar"]}})
+    assert not matches_filter(metadata, {"tags": {"$ne": "grid"}})
+    assert matches_filter(metadata, {"tags": {"$nin": ["wind"]}, "$and": [{"tags": {"$ne": "wind"}}]})
+
+    records = make_records(3)
+    for record, tags in zip(records, (["solar", "grid"], ["wind"], [])):
+        record["metadata"]["tags"] = tags
+    index = LocalVectorIndex(str(tmp_path))
+    await index.upsert(records)
+    hits = await index.search(records[0]["values"], k=3, filter={"tags": {"$nin": ["solar"]}})
+    assert sorted(doc.metadata["chunk_id"] for doc, _ in hits) == ["chunk-1", "chunk-2"]
+
+@pytest.mark.asyncio
+async def test_update_metadata_makes_existing_vectors_filterable(tmp_path):
+    """Backfilled document fields are matched by filters and kept across a restart"""
+    records = make_records(6)
+    index = LocalVectorIndex(str(tmp_path))
+    await index.upsert(records)
+    query = records[0]["values"]
+    assert await index.search(query, k=6, filter={"region": {"$eq": "europe"}}) == []
+
+    fields = {"region": "europe", "tags": ["solar"]}
+    await index.update_metadata({"chunk-0": fields, "chunk-3": fields, "missing": fields})
+    hits = await index.search(query, k=6, filter={"region": {"$eq": "europe"}})
+    assert sorted(doc.metadata["chunk_id"] for doc, _ in hits) == ["chunk-0", "chunk-3"]
+    assert hits[0][0].page_content == "Article 0"
+    assert hits[0][0].metadata["page_number"] == 0
+    index.close()
+
+    reloaded = LocalVectorIndex(str(tmp_path))
+    hits = await reloaded.search(query, k=6, filter={"document_id": "doc-0", "tags": {"$in": ["solar"]}})
+    assert sorted(doc.metadata["chunk_id"] for doc, _ in hits) == ["chunk-0", "chunk-3"]
+
+@pytest.mark.asyncio
+async def test_search_without_hits_returns_nothing(tmp_path):
+    """k <= 0, a filter matching only freed rows and an emptied index all give no hits"""
+    records = make_records(4)
+    index = LocalVectorIndex(str(tmp_path))
+    await index.upsert(records)
+    assert await index.search(records[0]["values"], k=0) == []
+
+    await index.delete(["chunk-0", "chunk-3"])
+    assert await index.search(records[0]["values"], k=2, filter={"document_id": "doc-0"}) == []
+    assert await index.search([float("nan")] * 16, k=2) == []
+
+    await index.delete(["chunk-1", "chunk-2"])
+    assert await index.search(records[0]["values"], k=2) == []